@@ -1,23 +1,34 @@
-from .data_sources import (ApifyAPI, BraveSearchAPI, GithubAPI, Glassdoor, RedditAPI, SalaryAPI, GoogleNewsAPI,
-                           YoutubeAPI, GoogleTrends, GoogleJobs, TrendingNow, LinkedInAPI, IndeedAPI)
-
-
-
-
-
 __all__ = [
     "ApifyAPI",
     "BraveSearchAPI",
     "GithubAPI",
+    "AsyncGithubAPI",
     "Glassdoor",
     "RedditAPI",
     "YoutubeAPI",
+    "AsyncYoutubeAPI",
     "GoogleTrends",
     "GoogleJobs",
     "TrendingNow",
     "LinkedInAPI",
+    "AsyncLinkedInAPI",
     "IndeedAPI",
     "SalaryAPI",
     "GoogleNewsAPI"
 ]
 
+
+# The data sources are loaded on first access, e.g. `from api_crawler import GithubAPI` only imports
+# the GitHub source and its dependencies
+def __getattr__(name):
+    if name not in __all__:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    from . import data_sources
+
+    value = getattr(data_sources, name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
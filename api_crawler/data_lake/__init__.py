@@ -1,4 +1,35 @@
-from .logger import log_io_to_json, read_log
+from .logger import (log_io_to_json, read_log, enable_async_writes, disable_async_writes, flush_lake,
+                     get_lake_index, get_blob_store, enable_response_cache, disable_response_cache,
+                     get_response_cache, set_log_level, get_log_level, get_lakes_base_dir)
+from .writer import LakeWriter
+from .storage import merge_shards
+from .reader import iter_log
+from .index import LakeIndex
+from .blobs import BlobStore, collect_garbage
+from .compaction import compact_lake
+from .export import export_parquet
+from .cache import ResponseCache, bypass_cache
 
 __all__ = ["log_io_to_json",
-           "read_log"]
\ No newline at end of file
+           "read_log",
+           "iter_log",
+           "enable_async_writes",
+           "disable_async_writes",
+           "flush_lake",
+           "LakeWriter",
+           "merge_shards",
+           "LakeIndex",
+           "get_lake_index",
+           "BlobStore",
+           "get_blob_store",
+           "collect_garbage",
+           "compact_lake",
+           "export_parquet",
+           "ResponseCache",
+           "enable_response_cache",
+           "disable_response_cache",
+           "get_response_cache",
+           "bypass_cache",
+           "set_log_level",
+           "get_log_level",
+           "get_lakes_base_dir"]
\ No newline at end of file
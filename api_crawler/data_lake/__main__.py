@@ -0,0 +1,86 @@
+"""
+Maintenance commands for the data lake.
+
+Usage:
+    python -m api_crawler.data_lake gc [LAKE_DIR] [--min-age SECONDS] [--dry-run]
+    python -m api_crawler.data_lake compact [LAKE_DIR] [--split {none,year,month,day}] [--drop-before TIME]
+                                            [--no-compress] [--workers N]
+    python -m api_crawler.data_lake export [LAKE_DIR] --output OUTPUT_DIR [--full]
+"""
+import argparse
+import os
+import sys
+from .blobs import collect_garbage
+from .compaction import SPLITS, compact_lake
+from .export import export_parquet
+
+
+def _gc(args):
+    deleted = collect_garbage(args.lake_dir, min_age=args.min_age, dry_run=args.dry_run)
+    action = 'Would delete' if args.dry_run else 'Deleted'
+    print(f"{action} {len(deleted)} unreferenced blobs from {args.lake_dir}")
+
+
+def _compact(args):
+    reports = compact_lake(args.lake_dir, split=args.split, drop_before=args.drop_before,
+                           compress=not args.no_compress, workers=args.workers)
+    for report in reports:
+        if report.inputs != report.outputs:
+            print(f"{report.group}: {len(report.inputs)} files -> {len(report.outputs)} files, "
+                  f"{report.read} records read, {report.dropped} dropped, {report.written} written")
+    compacted = [report for report in reports if report.inputs != report.outputs]
+    print(f"Compacted {len(compacted)} of {len(reports)} lake files in {args.lake_dir}: "
+          f"{sum(report.written for report in compacted)} records written, "
+          f"{sum(report.dropped for report in compacted)} dropped")
+
+
+def _export(args):
+    stats = export_parquet(args.lake_dir, args.output, incremental=not args.full)
+    rows = ', '.join(f"{n_rows} {table}" for table, n_rows in sorted(stats['rows'].items())) or 'no rows'
+    print(f"Exported {stats['exported']} lake files to {args.output} ({rows}), skipped {stats['skipped']} "
+          f"unchanged files and removed the tables of {stats['removed']} deleted files")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m api_crawler.data_lake', description=__doc__.split('\n')[1])
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    gc_parser = subparsers.add_parser('gc', help='Delete the deduplicated outputs no record references anymore.')
+    gc_parser.add_argument('lake_dir', nargs='?', default=os.environ.get('LAKES_BASE_DIR'),
+                           help='The base directory of the lake. Defaults to LAKES_BASE_DIR.')
+    gc_parser.add_argument('--min-age', type=float, default=3600,
+                           help='Keep the blobs modified less than this number of seconds ago.')
+    gc_parser.add_argument('--dry-run', action='store_true', help='Only count the blobs that would be deleted.')
+    gc_parser.set_defaults(handler=_gc)
+
+    compact_parser = subparsers.add_parser(
+        'compact', help='Convert the legacy JSON array files to compressed JSON Lines segments and merge the shards '
+                        'and small segments, streaming the records.')
+    compact_parser.add_argument('lake_dir', nargs='?', default=os.environ.get('LAKES_BASE_DIR'),
+                                help='The base directory of the lake. Defaults to LAKES_BASE_DIR.')
+    compact_parser.add_argument('--split', choices=list(SPLITS), default='none',
+                                help='Write a segment per period of the start times of the calls.')
+    compact_parser.add_argument('--drop-before', help='Drop the calls started before this ISO 8601 time.')
+    compact_parser.add_argument('--no-compress', action='store_true', help='Do not gzip compress the segments.')
+    compact_parser.add_argument('--workers', type=int, default=1,
+                                help='Number of processes compacting lake files in parallel.')
+    compact_parser.set_defaults(handler=_compact)
+
+    export_parser = subparsers.add_parser('export', help='Export the records to Parquet tables. Requires pyarrow.')
+    export_parser.add_argument('lake_dir', nargs='?', default=os.environ.get('LAKES_BASE_DIR'),
+                               help='The base directory of the lake. Defaults to LAKES_BASE_DIR.')
+    export_parser.add_argument('--output', required=True, help='The root directory of the Parquet tables.')
+    export_parser.add_argument('--full', action='store_true',
+                               help='Export every lake file, not only the ones that changed since the last export.')
+    export_parser.set_defaults(handler=_export)
+
+    args = parser.parse_args(argv)
+    if getattr(args, 'lake_dir', '') is None:
+        parser.error('LAKE_DIR is required when LAKES_BASE_DIR is not set')
+    if getattr(args, 'lake_dir', None) and not os.path.isdir(args.lake_dir):
+        parser.error(f"{args.lake_dir} is not a directory")
+    args.handler(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,186 @@
+import gzip
+import hashlib
+import json
+import os
+import time
+from .serialization import EncodedJSON, dumps
+from .partitions import PARTITION_KEYS
+
+
+BLOBS_DIR_NAME = 'blobs'
+BLOB_REFERENCE_KEY = 'output_blob'
+
+
+class BlobStore:
+    """
+    Content-addressed store of the outputs logged in the data lake.
+
+    Each output is stored once, gzip compressed, under the SHA-256 digest of its JSON encoding,
+    and the lake records reference it by digest instead of holding a copy. Crawls that fetch the same
+    data over and over therefore only write it once.
+
+    Args:
+        directory (str): The directory of the blobs, usually '<LAKES_BASE_DIR>/blobs'.
+        min_bytes (int): Outputs whose encoding is smaller than this are kept inline in the records,
+            since the reference would save little.
+    """
+
+    def __init__(self, directory: str, min_bytes: int = 512):
+        self.directory = directory
+        self.min_bytes = min_bytes
+
+
+    def path(self, digest: str) -> str:
+        return os.path.join(self.directory, digest[:2], f"{digest[2:]}.json.gz")
+
+
+    def __contains__(self, digest: str) -> bool:
+        return os.path.exists(self.path(digest))
+
+
+    def put(self, value) -> str:
+        """
+        Store a JSON serializable value, unless it is already stored.
+
+        Returns:
+            str: The digest referencing the value.
+        """
+        return self._put(dumps(value))
+
+
+    def _put(self, encoded: bytes) -> str:
+        digest = hashlib.sha256(encoded).hexdigest()
+        blob_path = self.path(digest)
+        try:
+            # Refresh the modification time so garbage collection spares blobs that were just referenced again
+            os.utime(blob_path)
+            return digest
+        except FileNotFoundError:
+            pass
+
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        temp_path = f"{blob_path}.{os.getpid()}.tmp"
+        with gzip.open(temp_path, 'wb') as f:
+            f.write(encoded)
+        os.replace(temp_path, blob_path)
+        return digest
+
+
+    def get(self, digest: str):
+        """
+        Load the value stored under a digest.
+        """
+        with gzip.open(self.path(digest), 'rb') as f:
+            return json.loads(f.read())
+
+
+    def externalize(self, entry: dict) -> dict:
+        """
+        Move the output of a lake record to the store, replacing it with a reference.
+
+        Returns:
+            dict: The record to write, or the record itself if its output is kept inline.
+        """
+        output = entry.get('output')
+        if output is None or BLOB_REFERENCE_KEY in entry:
+            return entry
+
+        encoded = output if isinstance(output, EncodedJSON) else dumps(output)
+        if len(encoded) < self.min_bytes:
+            return entry
+        return {**entry, 'output': None, BLOB_REFERENCE_KEY: self._put(encoded)}
+
+
+    def resolve(self, entry: dict) -> dict:
+        """
+        Replace the output reference of a lake record by the stored output.
+        """
+        digest = entry.get(BLOB_REFERENCE_KEY)
+        if digest is None:
+            return entry
+        resolved = {key: value for key, value in entry.items() if key != BLOB_REFERENCE_KEY}
+        resolved['output'] = self.get(digest)
+        return resolved
+
+
+    def digests(self):
+        """
+        Iterate over the digests of every stored blob.
+        """
+        if not os.path.isdir(self.directory):
+            return
+        for prefix in sorted(os.listdir(self.directory)):
+            prefix_dir = os.path.join(self.directory, prefix)
+            if not os.path.isdir(prefix_dir):
+                continue
+            for file_name in sorted(os.listdir(prefix_dir)):
+                if file_name.endswith('.json.gz'):
+                    yield prefix + file_name[:-len('.json.gz')]
+
+
+    def collect_garbage(self, referenced: set, min_age: float = 3600, dry_run: bool = False) -> list:
+        """
+        Delete the blobs that no lake record references.
+
+        Args:
+            referenced (set): The digests referenced by the lake records.
+            min_age (float): Blobs modified less than this number of seconds ago are kept, so the blobs
+                of records still waiting to be written are not deleted.
+            dry_run (bool): Only list the blobs that would be deleted.
+
+        Returns:
+            list: The digests of the deleted blobs.
+        """
+        now = time.time()
+        deleted = []
+        for digest in list(self.digests()):
+            if digest in referenced:
+                continue
+            blob_path = self.path(digest)
+            try:
+                if now - os.path.getmtime(blob_path) < min_age:
+                    continue
+                if not dry_run:
+                    os.remove(blob_path)
+            except FileNotFoundError:
+                continue
+            deleted.append(digest)
+        return deleted
+
+
+def blob_store_for(path: str) -> BlobStore:
+    """
+    Get the blob store of the lake holding a lake file or directory, if it has one.
+    """
+    directory = path if os.path.isdir(path) else os.path.dirname(path)
+    # The blobs of a partitioned lake are stored at its root, above the partitions
+    while os.path.basename(directory).partition('=')[0] in PARTITION_KEYS:
+        directory = os.path.dirname(directory)
+    blobs_dir = os.path.join(directory, BLOBS_DIR_NAME)
+    return BlobStore(blobs_dir) if os.path.isdir(blobs_dir) else None
+
+
+def referenced_blobs(lake_dir: str) -> set:
+    """
+    Collect the digests referenced by the records of every lake file of a directory, streaming the records.
+    """
+    from .reader import iter_log
+
+    return {record[BLOB_REFERENCE_KEY] for record in iter_log(lake_dir, resolve_blobs=False)
+            if record.get(BLOB_REFERENCE_KEY)}
+
+
+def collect_garbage(lake_dir: str, min_age: float = 3600, dry_run: bool = False) -> list:
+    """
+    Delete the blobs of a lake that none of its records reference.
+
+    Args:
+        lake_dir (str): The base directory of the lake, e.g. LAKES_BASE_DIR.
+        min_age (float): Blobs modified less than this number of seconds ago are kept.
+        dry_run (bool): Only list the blobs that would be deleted.
+
+    Returns:
+        list: The digests of the deleted blobs.
+    """
+    store = BlobStore(os.path.join(lake_dir, BLOBS_DIR_NAME))
+    return store.collect_garbage(referenced_blobs(lake_dir), min_age=min_age, dry_run=dry_run)
@@ -0,0 +1,197 @@
+import contextlib
+import contextvars
+import os
+import pickle
+import shutil
+import threading
+import time
+from collections import Counter, OrderedDict
+from .index import hash_arguments
+
+
+CACHE_DIR_NAME = 'cache'
+
+_bypass = contextvars.ContextVar('api_crawler_cache_bypass', default=False)
+
+
+@contextlib.contextmanager
+def bypass_cache():
+    """
+    Context manager making the decorated calls skip the response cache lookups.
+
+    The calls still go to the network and their fresh results replace the cached ones.
+    """
+    token = _bypass.set(True)
+    try:
+        yield
+    finally:
+        _bypass.reset(token)
+
+
+class ResponseCache:
+    """
+    Memoizing cache of the results of the functions decorated with `log_io_to_json`.
+
+    Results are keyed on the qualified name of the function and a canonical hash of its bound arguments
+    (leaving out 'self'), so repeated calls return without any network I/O. The cache has two tiers: an
+    in-memory LRU tier and an optional on-disk tier shared across processes and restarts. Results are
+    stored pickled, so every hit returns a fresh copy that the caller is free to modify.
+
+    Args:
+        directory (str): The directory of the on-disk tier, or None to only cache in memory.
+        max_entries (int): Maximum number of results kept in memory.
+        default_ttl (float): Number of seconds a result stays valid. None keeps it forever.
+        ttls (dict): TTLs per function qualified name, e.g. {'SalaryAPI.get_salaries_range': 86400}.
+            A TTL of 0 disables the cache for the function.
+    """
+
+    def __init__(self, directory: str = None, max_entries: int = 1024, default_ttl: float = 3600,
+                 ttls: dict = None):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.ttls = dict(ttls or {})
+        self.counters = Counter()
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+
+    def ttl(self, qualname: str) -> float:
+        return self.ttls.get(qualname, self.default_ttl)
+
+
+    def set_ttl(self, qualname: str, ttl: float):
+        """
+        Set the TTL of a function, in seconds. None keeps its results forever and 0 disables its cache.
+        """
+        self.ttls[qualname] = ttl
+
+
+    def key(self, args: dict) -> str:
+        """
+        Build the cache key of a call from its bound arguments.
+        """
+        return hash_arguments(args)
+
+
+    def _path(self, qualname: str, key: str = None) -> str:
+        function_dir = os.path.join(self.directory, qualname.replace('.', '_'))
+        return function_dir if key is None else os.path.join(function_dir, f"{key}.pkl")
+
+
+    def get(self, qualname: str, key: str):
+        """
+        Look up the cached result of a call.
+
+        Returns:
+            tuple: (True, result) on a hit, (False, None) on a miss.
+        """
+        if self.ttl(qualname) == 0:
+            return False, None
+        if _bypass.get():
+            self.counters[(qualname, 'bypasses')] += 1
+            return False, None
+
+        now = time.time()
+        with self._lock:
+            item = self._memory.get((qualname, key))
+            if item is not None:
+                expires_at, payload = item
+                if expires_at is None or expires_at > now:
+                    self._memory.move_to_end((qualname, key))
+                    self.counters[(qualname, 'memory_hits')] += 1
+                    return True, pickle.loads(payload)
+                del self._memory[(qualname, key)]
+
+        if self.directory is not None:
+            try:
+                with open(self._path(qualname, key), 'rb') as f:
+                    expires_at, payload = pickle.load(f)
+            except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+                pass
+            else:
+                if expires_at is None or expires_at > now:
+                    self._remember(qualname, key, expires_at, payload)
+                    self.counters[(qualname, 'disk_hits')] += 1
+                    return True, pickle.loads(payload)
+
+        self.counters[(qualname, 'misses')] += 1
+        return False, None
+
+
+    def set(self, qualname: str, key: str, value):
+        """
+        Cache the result of a call. Results that cannot be pickled are not cached.
+        """
+        ttl = self.ttl(qualname)
+        if ttl == 0:
+            return
+        try:
+            payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            self.counters[(qualname, 'unpicklable')] += 1
+            return
+
+        expires_at = None if ttl is None else time.time() + ttl
+        self._remember(qualname, key, expires_at, payload)
+
+        if self.directory is not None:
+            path = self._path(qualname, key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_path, 'wb') as f:
+                pickle.dump((expires_at, payload), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, path)
+
+
+    def _remember(self, qualname: str, key: str, expires_at: float, payload: bytes):
+        with self._lock:
+            self._memory[(qualname, key)] = (expires_at, payload)
+            self._memory.move_to_end((qualname, key))
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+
+    def invalidate(self, qualname: str = None, args: dict = None):
+        """
+        Drop cached results: those of a single call if `args` is given, those of a function if only
+        `qualname` is given, or the whole cache.
+
+        Args:
+            qualname (str): The qualified name of the function, e.g. 'GoogleTrends.get'.
+            args (dict): The bound arguments of the call, without 'self'.
+        """
+        if args is not None and qualname is None:
+            raise ValueError("qualname is required to invalidate the result of a call")
+
+        key = self.key(args) if args is not None else None
+        with self._lock:
+            for cached_qualname, cached_key in list(self._memory):
+                if qualname in (None, cached_qualname) and key in (None, cached_key):
+                    del self._memory[(cached_qualname, cached_key)]
+
+        if self.directory is None:
+            return
+        if key is not None:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(self._path(qualname, key))
+        elif qualname is not None:
+            shutil.rmtree(self._path(qualname), ignore_errors=True)
+        else:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+
+    def stats(self, qualname: str = None) -> dict:
+        """
+        Get the hit and miss counters, of a function or of the whole cache.
+
+        Returns:
+            dict: The number of 'hits' (and how many came from 'memory_hits' and 'disk_hits'), 'misses'
+                and 'bypasses'.
+        """
+        stats = Counter()
+        for (counter_qualname, name), count in self.counters.items():
+            if qualname in (None, counter_qualname):
+                stats[name] += count
+        stats['hits'] = stats['memory_hits'] + stats['disk_hits']
+        return {name: stats[name] for name in ['hits', 'memory_hits', 'disk_hits', 'misses', 'bypasses']}
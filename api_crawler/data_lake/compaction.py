@@ -0,0 +1,200 @@
+import contextlib
+import gzip
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Union
+from .storage import (COMPRESSED_EXTENSION, FILE_EXTENSIONS, JSONL_FORMAT, SEGMENT_PREFIX, RotationPolicy,
+                      file_lock, iter_file_entries, parse_lake_file_name)
+from .serialization import dumps
+from .reader import _as_timestamp, select_lake_files
+from .index import INDEX_FILE_NAME, LakeIndex
+
+
+# Length of the prefix of the ISO 8601 start time identifying the output file of a record
+SPLITS = {'none': 0, 'year': 4, 'month': 7, 'day': 10}
+
+CompactionReport = namedtuple('CompactionReport', ['group', 'inputs', 'outputs', 'read', 'dropped', 'written'])
+
+
+def lake_file_groups(lake_dir: str) -> dict:
+    """
+    Group the files of a lake by the lake file they belong to, whatever their shard, segment, format and
+    compression, e.g. 'GithubAPI_get_repo_issues.json' and 'GithubAPI_get_repo_issues.host-42.seg-....jsonl.gz'.
+
+    Args:
+        lake_dir (str): The base directory of the lake, partitioned or not.
+
+    Returns:
+        dict: The paths of the files of each group, keyed by the path of the group without extension.
+    """
+    groups = {}
+    for file_path in select_lake_files(lake_dir):
+        parsed = parse_lake_file_name(os.path.basename(file_path))
+        groups.setdefault(os.path.join(os.path.dirname(file_path), parsed.stem), []).append(file_path)
+    return groups
+
+
+def _segment_path(group: str, start_time: str, compress: bool, taken: set) -> str:
+    # Name the segment after its last start time, so the readers pruning the segments closed before
+    # a time never skip it, and bump the microseconds until the name is free
+    closed_at = datetime.fromisoformat(start_time[:19]) if start_time else datetime.now()
+    extension = FILE_EXTENSIONS[JSONL_FORMAT] + (COMPRESSED_EXTENSION if compress else '')
+    microsecond = 999999 if start_time else closed_at.microsecond
+    while True:
+        segment = f"{closed_at.strftime('%Y%m%dT%H%M%S')}{microsecond:06d}"
+        path = f"{group}.{SEGMENT_PREFIX}{segment}{extension}"
+        if path not in taken and not os.path.exists(path):
+            return path
+        microsecond -= 1
+
+
+def _close_active_files(paths: list, index: LakeIndex = None) -> list:
+    # Turn the files still being written into segments, holding their lock only while they are renamed,
+    # so the writers go on with new files and every input of the compaction is immutable
+    closed = []
+    for path in paths:
+        parsed = parse_lake_file_name(os.path.basename(path))
+        if parsed.segment is not None or parsed.compressed:
+            closed.append(path)
+            continue
+        with file_lock(path):
+            if os.path.exists(path):
+                segment_path = RotationPolicy(compress=False).rotate(path)
+                if index is not None:
+                    index.move(path, segment_path)
+                closed.append(segment_path)
+    return closed
+
+
+def compact_files(group: str, paths: list, split: str = 'none', drop_before: Union[str, datetime] = None,
+                  compress: bool = True, index_path: str = None) -> CompactionReport:
+    """
+    Rewrite the files of a lake file into JSON Lines segments, streaming the records in bounded memory.
+
+    The records of the legacy JSON array files, of the shards and of the segments are merged, optionally
+    dropping the oldest ones and splitting the rest by period. The number of written records is verified
+    before the input files are removed; on a mismatch, the inputs are kept and the outputs deleted.
+
+    Args:
+        group (str): The path of the lake file without extension, e.g. '<LAKES_BASE_DIR>/GithubAPI_get_repo_issues'.
+        paths (list): The files of the lake file, as listed by `lake_file_groups`.
+        split (str): 'none', 'year', 'month' or 'day'. Writes a segment per period of the start times.
+        drop_before (str or datetime): Drop the calls started before this time.
+        compress (bool): Gzip compress the written segments.
+        index_path (str): The path of the LakeIndex to update with the new location of the records, if any.
+
+    Returns:
+        CompactionReport: The input and output files and the number of read, dropped and written records.
+    """
+    if split not in SPLITS:
+        raise ValueError(f"Invalid split {split}. Choose from {list(SPLITS)}.")
+    drop_before = _as_timestamp(drop_before)
+
+    parsed = parse_lake_file_name(os.path.basename(paths[0]))
+    if (len(paths) == 1 and parsed.extension == FILE_EXTENSIONS[JSONL_FORMAT] and split == 'none'
+            and drop_before is None):
+        # Nothing to merge, convert or drop
+        return CompactionReport(group, paths, paths, 0, 0, 0)
+
+    index = LakeIndex(index_path) if index_path is not None else None
+    try:
+        return _compact_files(group, paths, split, drop_before, compress, index)
+    finally:
+        if index is not None:
+            index.close()
+
+
+def _compact_files(group: str, paths: list, split: str, drop_before: str, compress: bool,
+                   index: LakeIndex) -> CompactionReport:
+    inputs = _close_active_files(paths, index)
+    prefix_length = SPLITS[split]
+    outputs = {}
+    read = dropped = 0
+    try:
+        for path in inputs:
+            for record in iter_file_entries(path):
+                read += 1
+                start_time = record.get('start_time') or ''
+                if drop_before and start_time < drop_before:
+                    dropped += 1
+                    continue
+                key = start_time[:prefix_length] if start_time else None
+                if key not in outputs:
+                    temp_path = f"{group}.compaction-{os.getpid()}-{len(outputs)}.tmp"
+                    opener = gzip.open if compress else open
+                    outputs[key] = {'temp_path': temp_path, 'file': opener(temp_path, 'wb'), 'count': 0,
+                                    'last_start_time': ''}
+                output = outputs[key]
+                output['file'].write(dumps(record) + b'\n')
+                output['count'] += 1
+                output['last_start_time'] = max(output['last_start_time'], start_time)
+    finally:
+        for output in outputs.values():
+            output['file'].close()
+
+    written = 0
+    with contextlib.ExitStack() as cleanup:
+        cleanup.callback(lambda: [os.remove(output['temp_path']) for output in outputs.values()
+                                  if os.path.exists(output['temp_path'])])
+        for output in outputs.values():
+            opener = gzip.open if compress else open
+            with opener(output['temp_path'], 'rt') as f:
+                n_records = sum(1 for line in f if line.strip())
+            if n_records != output['count']:
+                raise RuntimeError(f"Compaction of {group} wrote {n_records} records instead of {output['count']}")
+            written += n_records
+        if written != read - dropped:
+            raise RuntimeError(f"Compaction of {group} wrote {written} records instead of {read - dropped}")
+
+        output_paths = []
+        taken = set(inputs)
+        for output in outputs.values():
+            output_path = _segment_path(group, output['last_start_time'], compress, taken)
+            os.replace(output['temp_path'], output_path)
+            taken.add(output_path)
+            output_paths.append(output_path)
+
+    for path in inputs:
+        os.remove(path)
+
+    if index is not None:
+        for path in inputs:
+            index.remove(path)
+        for path in output_paths:
+            index.index_file(path)
+
+    return CompactionReport(group, inputs, sorted(output_paths), read, dropped, written)
+
+
+def _compact_group(kwargs: dict) -> CompactionReport:
+    return compact_files(**kwargs)
+
+
+def compact_lake(lake_dir: str, split: str = 'none', drop_before: Union[str, datetime] = None,
+                 compress: bool = True, workers: int = 1) -> list:
+    """
+    Compact every lake file of a lake with `compact_files`, converting the legacy JSON array files to
+    JSON Lines and merging the shards and the small segments.
+
+    The lake index, if any, is updated with the new location of the records.
+
+    Args:
+        lake_dir (str): The base directory of the lake, e.g. LAKES_BASE_DIR.
+        split (str): 'none', 'year', 'month' or 'day'. Writes a segment per period of the start times.
+        drop_before (str or datetime): Drop the calls started before this time.
+        compress (bool): Gzip compress the written segments.
+        workers (int): Number of processes compacting lake files in parallel.
+
+    Returns:
+        list: A CompactionReport per lake file.
+    """
+    index_path = os.path.join(lake_dir, INDEX_FILE_NAME)
+    tasks = [{'group': group, 'paths': paths, 'split': split, 'drop_before': _as_timestamp(drop_before),
+              'compress': compress, 'index_path': index_path if os.path.exists(index_path) else None}
+             for group, paths in sorted(lake_file_groups(lake_dir).items())]
+    if workers <= 1:
+        return [compact_files(**task) for task in tasks]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_compact_group, tasks))
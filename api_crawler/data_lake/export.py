@@ -0,0 +1,416 @@
+import json
+import os
+from collections import namedtuple
+from datetime import datetime, timezone
+from .storage import iter_file_entries
+from .reader import select_lake_files
+from .blobs import blob_store_for
+
+
+EXPORT_STATE_FILE_NAME = '_export_state.json'
+CALLS_TABLE = 'calls'
+
+# A known record shape: the functions returning it, the typed columns of its table, and a function
+# turning a lake record into the rows of the table
+Shape = namedtuple('Shape', ['name', 'functions', 'columns', 'flatten'])
+
+# Columns added to the rows of every shape, linking them to the call that fetched them
+_CALL_COLUMNS = [('call_id', 'string'), ('parent_id', 'string'), ('function', 'string'),
+                 ('call_start_time', 'timestamp')]
+
+
+def _arrow_type(type_name: str):
+    import pyarrow as pa
+
+    return {
+        'string': pa.string(),
+        'int64': pa.int64(),
+        'float64': pa.float64(),
+        'bool': pa.bool_(),
+        'date': pa.date32(),
+        'timestamp': pa.timestamp('us'),
+        'timestamp_utc': pa.timestamp('us', tz='UTC'),
+        'list<string>': pa.list_(pa.string()),
+    }[type_name]
+
+
+def _timestamp(value):
+    # ISO 8601 strings such as '2024-05-01T12:00:00Z', or None if the value is not one
+    if not isinstance(value, str) or not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    return parsed.astimezone(timezone.utc) if parsed.tzinfo else parsed
+
+
+def _date(value):
+    parsed = _timestamp(value)
+    return parsed.date() if isinstance(parsed, datetime) else None
+
+
+def _int(value):
+    return value if isinstance(value, int) and not isinstance(value, bool) else None
+
+
+def _items(output, key: str = None) -> list:
+    # The items of an output: the output itself if it is a list, else one of its keys, e.g. 'items' for the
+    # YouTube responses or 'body' for the requests responses serialized by the lake
+    if isinstance(output, dict):
+        for candidate in [key, 'body']:
+            if candidate and candidate in output:
+                return _items(output[candidate], key)
+        return []
+    return output if isinstance(output, list) else []
+
+
+def _args(record: dict) -> dict:
+    return (record.get('input') or {}).get('args') or {}
+
+
+def _flatten_github_issues(record: dict):
+    repo_name = _args(record).get('repo_name') or _args(record).get('repo')
+    for issue in _items(record.get('output')):
+        if not isinstance(issue, dict):
+            continue
+        yield {
+            'repo_name': repo_name,
+            'id': _int(issue.get('id')),
+            'number': _int(issue.get('number')),
+            'title': issue.get('title'),
+            'state': issue.get('state'),
+            'user_login': (issue.get('user') or {}).get('login'),
+            'labels': [label.get('name') for label in issue.get('labels') or [] if isinstance(label, dict)],
+            'comments': _int(issue.get('comments')),
+            'is_pull_request': 'pull_request' in issue or 'merged_at' in issue,
+            'created_at': _timestamp(issue.get('created_at')),
+            'updated_at': _timestamp(issue.get('updated_at')),
+            'closed_at': _timestamp(issue.get('closed_at')),
+            'body': issue.get('body'),
+            'html_url': issue.get('html_url'),
+        }
+
+
+def _flatten_github_commits(record: dict):
+    repo_name = _args(record).get('repo_name') or _args(record).get('repo')
+    for commit in _items(record.get('output')):
+        if not isinstance(commit, dict):
+            continue
+        details = commit.get('commit') or {}
+        author = details.get('author') or {}
+        committer = details.get('committer') or {}
+        yield {
+            'repo_name': repo_name,
+            'sha': commit.get('sha'),
+            'author_login': (commit.get('author') or {}).get('login'),
+            'author_name': author.get('name'),
+            'author_email': author.get('email'),
+            'author_date': _timestamp(author.get('date')),
+            'committer_name': committer.get('name'),
+            'committer_date': _timestamp(committer.get('date')),
+            'message': details.get('message'),
+            'html_url': commit.get('html_url'),
+        }
+
+
+def _flatten_youtube_comment_threads(record: dict):
+    video_id = _args(record).get('video_id')
+    for thread in _items(record.get('output'), 'items'):
+        if isinstance(thread, str):
+            # Comments fetched without their metadata are only their text
+            yield {'video_id': video_id, 'text': thread}
+            continue
+        if not isinstance(thread, dict):
+            continue
+        snippet = thread.get('snippet') or {}
+        comment = snippet.get('topLevelComment') or {}
+        comment_snippet = comment.get('snippet') or {}
+        yield {
+            'video_id': snippet.get('videoId') or video_id,
+            'thread_id': thread.get('id'),
+            'comment_id': comment.get('id'),
+            'channel_id': snippet.get('channelId'),
+            'author': comment_snippet.get('authorDisplayName'),
+            'text': comment_snippet.get('textOriginal') or comment_snippet.get('textDisplay'),
+            'like_count': _int(comment_snippet.get('likeCount')),
+            'reply_count': _int(snippet.get('totalReplyCount')),
+            'published_at': _timestamp(comment_snippet.get('publishedAt')),
+            'updated_at': _timestamp(comment_snippet.get('updatedAt')),
+        }
+
+
+def _flatten_job_postings(record: dict):
+    args = _args(record)
+    search_query = args.get('search_query') or args.get('job_title')
+    source = record.get('function', '').partition('.')[0]
+    for posting in _items(record.get('output')):
+        if not isinstance(posting, dict):
+            continue
+        # LinkedIn gives the posting date as 'YYYY-MM-DD', Indeed and Glassdoor as text such as '3d'
+        posted = posting.get('time') or posting.get('date')
+        yield {
+            'source': source,
+            'search_query': search_query,
+            'title': posting.get('title'),
+            'company': posting.get('company'),
+            'location': posting.get('location'),
+            'salary': posting.get('salary'),
+            'snippet': posting.get('snippet'),
+            'posted': posted,
+            'posted_date': _date(posted),
+            'link': posting.get('link'),
+            'full_description': posting.get('full_description'),
+        }
+
+
+SHAPES = [
+    Shape('github_issues',
+          ['GithubAPI.get_repo_issues', 'GithubAPI.get_all_repo_issues',
+           'GithubAPI.get_repo_pulls', 'GithubAPI.get_all_repo_pull_requests',
+           'AsyncGithubAPI.get_repo_issues', 'AsyncGithubAPI.get_all_repo_issues',
+           'AsyncGithubAPI.get_repo_pulls', 'AsyncGithubAPI.get_all_repo_pull_requests'],
+          [('repo_name', 'string'), ('id', 'int64'), ('number', 'int64'), ('title', 'string'), ('state', 'string'),
+           ('user_login', 'string'), ('labels', 'list<string>'), ('comments', 'int64'), ('is_pull_request', 'bool'),
+           ('created_at', 'timestamp_utc'), ('updated_at', 'timestamp_utc'), ('closed_at', 'timestamp_utc'),
+           ('body', 'string'), ('html_url', 'string')],
+          _flatten_github_issues),
+    Shape('github_commits',
+          ['GithubAPI.get_repo_commits', 'GithubAPI.get_all_repo_commits',
+           'AsyncGithubAPI.get_repo_commits', 'AsyncGithubAPI.get_all_repo_commits'],
+          [('repo_name', 'string'), ('sha', 'string'), ('author_login', 'string'), ('author_name', 'string'),
+           ('author_email', 'string'), ('author_date', 'timestamp_utc'), ('committer_name', 'string'),
+           ('committer_date', 'timestamp_utc'), ('message', 'string'), ('html_url', 'string')],
+          _flatten_github_commits),
+    Shape('youtube_comment_threads',
+          ['YoutubeAPI.get_comments', 'YoutubeAPI.get_all_comments',
+           'AsyncYoutubeAPI.get_comments', 'AsyncYoutubeAPI.get_all_comments'],
+          [('video_id', 'string'), ('thread_id', 'string'), ('comment_id', 'string'), ('channel_id', 'string'),
+           ('author', 'string'), ('text', 'string'), ('like_count', 'int64'), ('reply_count', 'int64'),
+           ('published_at', 'timestamp_utc'), ('updated_at', 'timestamp_utc')],
+          _flatten_youtube_comment_threads),
+    Shape('job_postings',
+          ['LinkedInAPI.get_job_postings_data', 'AsyncLinkedInAPI.get_job_postings_data', 'IndeedAPI.get_job_postings_data',
+           'Glassdoor.get_job_postings_data'],
+          [('source', 'string'), ('search_query', 'string'), ('title', 'string'), ('company', 'string'),
+           ('location', 'string'), ('salary', 'string'), ('snippet', 'string'), ('posted', 'string'),
+           ('posted_date', 'date'), ('link', 'string'), ('full_description', 'string')],
+          _flatten_job_postings),
+]
+
+
+def _calls_row(record: dict, flattened: bool) -> dict:
+    return {
+        'id': record.get('id'),
+        'parent_id': record.get('parent_id'),
+        'function': record.get('function'),
+        'start_time': _timestamp(record.get('start_time')),
+        'end_time': _timestamp(record.get('end_time')),
+        'error': record.get('error'),
+        'error_log': record.get('error_log'),
+        'args_json': json.dumps(_args(record), default=str),
+        # The outputs of the known shapes are in their own tables
+        'output_json': None if flattened else json.dumps(record.get('output'), default=str),
+    }
+
+
+_CALLS_COLUMNS = [('id', 'string'), ('parent_id', 'string'), ('function', 'string'), ('start_time', 'timestamp'),
+                  ('end_time', 'timestamp'), ('error', 'bool'), ('error_log', 'string'), ('args_json', 'string'),
+                  ('output_json', 'string')]
+
+
+def _schema(columns: list):
+    import pyarrow as pa
+
+    return pa.schema([(name, _arrow_type(type_name)) for name, type_name in columns])
+
+
+class _TableWriter:
+    """Writes the rows of a table to a Parquet file, in row groups of bounded size."""
+
+    def __init__(self, path: str, columns: list, row_group_size: int, compression: str):
+        self.path = path
+        self.schema = _schema(columns)
+        self.row_group_size = row_group_size
+        self.compression = compression
+        self.rows = []
+        self.n_rows = 0
+        self._writer = None
+
+    def write(self, row: dict):
+        self.rows.append(row)
+        if len(self.rows) >= self.row_group_size:
+            self.flush()
+
+    def flush(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if not self.rows:
+            return
+        if self._writer is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._writer = pq.ParquetWriter(f"{self.path}.tmp", self.schema, compression=self.compression,
+                                            write_statistics=True)
+        self._writer.write_table(pa.Table.from_pylist(self.rows, schema=self.schema),
+                                 row_group_size=self.row_group_size)
+        self.n_rows += len(self.rows)
+        self.rows = []
+
+    def close(self) -> bool:
+        self.flush()
+        if self._writer is None:
+            return False
+        self._writer.close()
+        os.replace(f"{self.path}.tmp", self.path)
+        return True
+
+    def abort(self):
+        if self._writer is not None:
+            self._writer.close()
+            os.remove(f"{self.path}.tmp")
+
+
+def _output_name(relative_path: str) -> str:
+    # 'source=github/.../part.seg-20240101T000000000000.jsonl.gz' -> 'source=github/.../part.seg-20240101T000000000000.jsonl.gz.parquet'
+    # The extensions are kept, so 'X.json' and 'X.jsonl' are not exported to the same file
+    return relative_path + '.parquet'
+
+
+def export_file(file_path: str, output_dir: str, relative_path: str, row_group_size: int = 100000,
+                compression: str = 'zstd') -> dict:
+    """
+    Export the records of a single lake file to Parquet: the rows of the known record shapes go to a table
+    per shape, e.g. '<output_dir>/github_issues/<relative_path>.parquet', and every call to the 'calls' table.
+
+    Args:
+        file_path (str): The lake file.
+        output_dir (str): The root directory of the exported tables.
+        relative_path (str): The path of the lake file relative to the lake, used to name the Parquet files.
+        row_group_size (int): Maximum number of rows per row group.
+        compression (str): The Parquet compression codec.
+
+    Returns:
+        dict: The number of exported rows per table.
+    """
+    shapes_by_function = {function: shape for shape in SHAPES for function in shape.functions}
+    output_name = _output_name(relative_path)
+    writers = {}
+
+    def writer(table: str, columns: list) -> _TableWriter:
+        if table not in writers:
+            writers[table] = _TableWriter(os.path.join(output_dir, table, output_name), columns, row_group_size,
+                                          compression)
+        return writers[table]
+
+    blob_store = blob_store_for(file_path)
+    try:
+        for record in iter_file_entries(file_path):
+            if blob_store is not None:
+                record = blob_store.resolve(record)
+            shape = shapes_by_function.get(record.get('function'))
+            writer(CALLS_TABLE, _CALLS_COLUMNS).write(_calls_row(record, shape is not None))
+            if shape is None:
+                continue
+            # The output of a parent, e.g. get_all_comments, repeats the ones of its children of the same shape,
+            # e.g. its get_comments pages, which are exported instead
+            if any(shapes_by_function.get(function) is shape for function in record.get('children_functions', ())):
+                continue
+            call_columns = {'call_id': record.get('id'), 'parent_id': record.get('parent_id'),
+                            'function': record.get('function'),
+                            'call_start_time': _timestamp(record.get('start_time'))}
+            table_writer = writer(shape.name, _CALL_COLUMNS + shape.columns)
+            for row in shape.flatten(record):
+                table_writer.write({**call_columns, **row})
+    except BaseException:
+        for table_writer in writers.values():
+            table_writer.abort()
+        raise
+
+    for table_writer in writers.values():
+        table_writer.close()
+    return {table: table_writer.n_rows for table, table_writer in writers.items()}
+
+
+def _load_state(output_dir: str) -> dict:
+    try:
+        with open(os.path.join(output_dir, EXPORT_STATE_FILE_NAME)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def _save_state(output_dir: str, state: dict):
+    path = os.path.join(output_dir, EXPORT_STATE_FILE_NAME)
+    with open(f"{path}.tmp", 'w') as f:
+        json.dump(state, f, indent=1, sort_keys=True)
+    os.replace(f"{path}.tmp", path)
+
+
+def export_parquet(lake_dir: str, output_dir: str, incremental: bool = True, row_group_size: int = 100000,
+                   compression: str = 'zstd') -> dict:
+    """
+    Export the records of a lake to columnar Parquet tables, for analytics tools such as pandas, DuckDB or Spark.
+
+    The outputs of the known record shapes (GitHub issues and commits, YouTube comment threads, LinkedIn,
+    Indeed and Glassdoor job postings, see `SHAPES`) are flattened into typed columns, one table per shape,
+    and every call goes to the 'calls' table with its arguments and, for the other functions, its output as
+    JSON. Each lake file is exported to its own Parquet file, keeping the partitions of partitioned lakes,
+    so the exported tables mirror the lake.
+
+    Args:
+        lake_dir (str): The base directory of the lake, e.g. LAKES_BASE_DIR.
+        output_dir (str): The root directory of the exported tables.
+        incremental (bool): Only export the lake files that changed since the last export, i.e. the new
+            segments and the files still being written. Closed segments are exported only once.
+        row_group_size (int): Maximum number of rows per row group.
+        compression (str): The Parquet compression codec.
+
+    Returns:
+        dict: The number of 'exported', 'skipped' and 'removed' lake files, and the number of exported
+            'rows' per table.
+    """
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        raise ImportError("The Parquet export requires pyarrow. Install it with `pip install api_crawler[parquet]`.")
+
+    state = _load_state(output_dir)
+    seen = set()
+    stats = {'exported': 0, 'skipped': 0, 'removed': 0, 'rows': {}}
+    for file_path in select_lake_files(lake_dir):
+        relative_path = os.path.relpath(file_path, lake_dir)
+        seen.add(relative_path)
+        stat = os.stat(file_path)
+        signature = [stat.st_size, stat.st_mtime_ns]
+        if incremental and relative_path in state and state[relative_path]['signature'] == signature:
+            stats['skipped'] += 1
+            continue
+
+        _remove_outputs(output_dir, state.pop(relative_path, None))
+        rows = export_file(file_path, output_dir, relative_path, row_group_size=row_group_size,
+                           compression=compression)
+        state[relative_path] = {'signature': signature, 'tables': sorted(rows), 'output': _output_name(relative_path)}
+        for table, n_rows in rows.items():
+            stats['rows'][table] = stats['rows'].get(table, 0) + n_rows
+        stats['exported'] += 1
+        os.makedirs(output_dir, exist_ok=True)
+        _save_state(output_dir, state)
+
+    # The lake files removed since the last export, e.g. rotated or compacted into segments
+    for relative_path in sorted(set(state) - seen):
+        _remove_outputs(output_dir, state.pop(relative_path))
+        stats['removed'] += 1
+    if stats['removed']:
+        _save_state(output_dir, state)
+    return stats
+
+
+def _remove_outputs(output_dir: str, exported: dict):
+    # Remove the Parquet files exported from a lake file
+    if not exported:
+        return
+    for table in exported['tables']:
+        path = os.path.join(output_dir, table, exported['output'])
+        if os.path.exists(path):
+            os.remove(path)
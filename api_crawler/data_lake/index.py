@@ -0,0 +1,287 @@
+import gzip
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Union
+from .storage import COMPRESSED_EXTENSION, iter_file_entries, parse_lake_file_name
+from .reader import _as_timestamp, select_lake_files
+from .blobs import blob_store_for
+
+
+INDEX_FILE_NAME = 'lake_index.sqlite'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS calls (
+    id TEXT PRIMARY KEY,
+    function TEXT,
+    start_time TEXT,
+    end_time TEXT,
+    error INTEGER,
+    args_hash TEXT,
+    path TEXT,
+    offset INTEGER,
+    length INTEGER
+);
+CREATE TABLE IF NOT EXISTS call_args (
+    call_id TEXT,
+    name TEXT,
+    value_hash TEXT,
+    PRIMARY KEY (call_id, name)
+);
+CREATE INDEX IF NOT EXISTS calls_function_start_time ON calls (function, start_time);
+CREATE INDEX IF NOT EXISTS calls_args_hash ON calls (args_hash);
+CREATE INDEX IF NOT EXISTS calls_path ON calls (path);
+CREATE INDEX IF NOT EXISTS call_args_value ON call_args (name, value_hash);
+"""
+
+
+def hash_value(value) -> str:
+    """
+    Hash a JSON serializable value, independently of the order of its dictionary keys.
+    """
+    canonical = json.dumps(value, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def hash_arguments(args: dict) -> str:
+    """
+    Hash the bound arguments of a call. The instance the method was called on ('self') is left out,
+    so calls with the same arguments on different instances share the same hash.
+    """
+    return hash_value({name: value for name, value in args.items() if name != 'self'})
+
+
+class LakeIndex:
+    """
+    SQLite index of the calls logged in the data lake.
+
+    For every call, the index stores its id, function, start and end time, error flag, a hash of its bound
+    arguments (and of each argument) and the location of its record: the lake file and, for JSON Lines
+    files, the byte offset and length of its line. Queries therefore read only the matching records
+    instead of scanning the lake.
+
+    The index is shared by the threads and processes writing to the lake; SQLite handles the locking.
+
+    Args:
+        db_path (str): The path of the SQLite database. The paths of the lake files are stored relative
+            to its directory, so the lake can be moved together with its index.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.base_dir = os.path.dirname(os.path.abspath(db_path))
+        self._local = threading.local()
+        os.makedirs(self.base_dir, exist_ok=True)
+        self._connection.executescript(_SCHEMA)
+
+
+    @property
+    def _connection(self) -> sqlite3.Connection:
+        # SQLite connections cannot be shared between threads, so every thread opens its own
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or getattr(self._local, 'pid', None) != os.getpid():
+            connection = sqlite3.connect(self.db_path, timeout=60)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+
+    def _relative(self, path: str) -> str:
+        return os.path.relpath(os.path.abspath(path), self.base_dir)
+
+
+    def _absolute(self, path: str) -> str:
+        return os.path.join(self.base_dir, path)
+
+
+    def add(self, entries: list, file_path: str, locations: list):
+        """
+        Index records written to a lake file.
+
+        Args:
+            entries (list): The records, as logged by `log_io_to_json`.
+            file_path (str): The lake file the records were written to.
+            locations (list): The (byte offset, byte length) of each record in the file, or (None, None) if unknown.
+        """
+        path = self._relative(file_path)
+        calls = []
+        call_args = []
+        for entry, (offset, length) in zip(entries, locations):
+            args = (entry.get('input') or {}).get('args') or {}
+            calls.append((entry['id'], entry.get('function'), entry.get('start_time'), entry.get('end_time'),
+                          int(bool(entry.get('error'))), hash_arguments(args), path, offset, length))
+            call_args.extend((entry['id'], name, hash_value(value)) for name, value in args.items() if name != 'self')
+
+        with self._connection as connection:
+            connection.executemany('INSERT OR REPLACE INTO calls VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', calls)
+            connection.executemany('INSERT OR REPLACE INTO call_args VALUES (?, ?, ?)', call_args)
+
+
+    def move(self, old_path: str, new_path: str):
+        """
+        Point the records of a lake file to its new path, e.g. after it was rotated into a segment.
+        The byte offsets are kept, since they refer to the uncompressed content.
+        """
+        with self._connection as connection:
+            connection.execute('UPDATE calls SET path = ? WHERE path = ?',
+                               (self._relative(new_path), self._relative(old_path)))
+
+
+    def remove(self, file_path: str):
+        """
+        Forget the records of a lake file, e.g. after it was compacted into other files.
+        """
+        with self._connection as connection:
+            connection.execute('DELETE FROM call_args WHERE call_id IN (SELECT id FROM calls WHERE path = ?)',
+                               (self._relative(file_path),))
+            connection.execute('DELETE FROM calls WHERE path = ?', (self._relative(file_path),))
+
+
+    def index_file(self, file_path: str) -> int:
+        """
+        Index the records of an existing lake file, e.g. one written before the index was enabled.
+
+        Returns:
+            int: The number of indexed records.
+        """
+        parsed = parse_lake_file_name(os.path.basename(file_path))
+        if parsed is not None and parsed.extension == '.json':
+            entries = list(iter_file_entries(file_path))
+            self.add(entries, file_path, [(None, None)] * len(entries))
+            return len(entries)
+
+        opener = gzip.open if file_path.endswith(COMPRESSED_EXTENSION) else open
+        entries, locations = [], []
+        offset = 0
+        n_indexed = 0
+        with opener(file_path, 'rb') as f:
+            for line in f:
+                if line.strip():
+                    try:
+                        entries.append(json.loads(line))
+                        locations.append((offset, len(line)))
+                    except json.JSONDecodeError:
+                        pass
+                offset += len(line)
+                if len(entries) >= 1000:
+                    self.add(entries, file_path, locations)
+                    n_indexed += len(entries)
+                    entries, locations = [], []
+        self.add(entries, file_path, locations)
+        return n_indexed + len(entries)
+
+
+    def index_directory(self, directory: str) -> int:
+        """
+        Index every lake file of a directory, including the files of its partitions.
+
+        Returns:
+            int: The number of indexed records.
+        """
+        return sum(self.index_file(path) for path in select_lake_files(directory))
+
+
+    def query(self, function: str = None, args: dict = None, args_hash: str = None,
+              start_time: Union[str, datetime] = None, end_time: Union[str, datetime] = None,
+              error: bool = None) -> list:
+        """
+        Find the calls matching the given criteria.
+
+        Args:
+            function (str): The qualified name of the function, e.g. 'GithubAPI.get_repo_issues'.
+            args (dict): Argument values the calls must have been made with, e.g. {'repo_name': 'jxnl/instructor'}.
+                Arguments that are not given can have any value.
+            args_hash (str): The hash of the whole set of bound arguments, as returned by `hash_arguments`.
+            start_time (str or datetime): Only the calls started at or after this time.
+            end_time (str or datetime): Only the calls started before this time.
+            error (bool): Only the failed calls if True, or the successful ones if False.
+
+        Returns:
+            list: A dict per matching call, ordered by start time, with the location of its record.
+        """
+        conditions, parameters = [], []
+        if function is not None:
+            conditions.append('function = ?')
+            parameters.append(function)
+        if args_hash is not None:
+            conditions.append('args_hash = ?')
+            parameters.append(args_hash)
+        if start_time is not None:
+            conditions.append('start_time >= ?')
+            parameters.append(_as_timestamp(start_time))
+        if end_time is not None:
+            conditions.append('start_time < ?')
+            parameters.append(_as_timestamp(end_time))
+        if error is not None:
+            conditions.append('error = ?')
+            parameters.append(int(error))
+        for name, value in (args or {}).items():
+            conditions.append('id IN (SELECT call_id FROM call_args WHERE name = ? AND value_hash = ?)')
+            parameters.extend([name, hash_value(value)])
+
+        sql = 'SELECT id, function, start_time, end_time, error, args_hash, path, offset, length FROM calls'
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sql += ' ORDER BY start_time, rowid'
+
+        columns = ['id', 'function', 'start_time', 'end_time', 'error', 'args_hash', 'path', 'offset', 'length']
+        rows = []
+        for row in self._connection.execute(sql, parameters):
+            row = dict(zip(columns, row))
+            row['error'] = bool(row['error'])
+            row['path'] = self._absolute(row['path'])
+            rows.append(row)
+        return rows
+
+
+    def fetch(self, **kwargs):
+        """
+        Read the records of the calls matching the criteria of `query`, seeking directly to each record.
+
+        Yields:
+            dict: The matching records, ordered by start time.
+        """
+        rows = self.query(**kwargs)
+        # Read the records file by file to reuse the open files, then give them back in the query order
+        by_path = {}
+        for row in rows:
+            by_path.setdefault(row['path'], []).append(row)
+
+        records = {}
+        for path, path_rows in by_path.items():
+            records.update(self._read_records(path, path_rows))
+
+        blob_store = blob_store_for(self.base_dir)
+        for row in rows:
+            if row['id'] in records:
+                record = records[row['id']]
+                yield blob_store.resolve(record) if blob_store is not None else record
+
+
+    def _read_records(self, path: str, rows: list) -> dict:
+        records = {}
+        if any(row['offset'] is None for row in rows):
+            wanted = {row['id'] for row in rows}
+            for record in iter_file_entries(path):
+                if record.get('id') in wanted:
+                    records[record['id']] = record
+            return records
+
+        opener = gzip.open if path.endswith(COMPRESSED_EXTENSION) else open
+        with opener(path, 'rb') as f:
+            for row in sorted(rows, key=lambda row: row['offset']):
+                f.seek(row['offset'])
+                records[row['id']] = json.loads(f.read(row['length']))
+        return records
+
+
+    def close(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
@@ -1,30 +1,469 @@
-import json
 import functools
 import os
+import contextvars
+import random
 from datetime import datetime
 import uuid
 from decouple import config
 import inspect
+from .storage import lake_file_path, append_entries, read_entries, shard_id, RotationPolicy
+from .writer import LakeWriter
+from .index import LakeIndex, INDEX_FILE_NAME
+from .blobs import BlobStore, BLOBS_DIR_NAME, blob_store_for
+from .cache import ResponseCache, CACHE_DIR_NAME
+from .serialization import serialize_data, dumps, EncodedJSON
+from .partitions import LAYOUTS, partition_file_path
 
-LAKES_BASE_DIR = config("LAKES_BASE_DIR")
+# Base directory of the lake files, read from the configuration at first use so that importing the
+# package does not require it
+LAKES_BASE_DIR = None
+# Storage format of the lake files: 'json' (single JSON array, rewritten on every call)
+# or 'jsonl' (append-only JSON Lines, one record per line)
+LAKE_FORMAT = config("LAKE_FORMAT", default="json")
+# Layout of the lake files: 'flat' (one file per function at the root of the lake) or 'partitioned'
+# ('source=<source>/method=<method>/date=<YYYY-MM-DD>/part.<json|jsonl>', one directory per day)
+LAKE_LAYOUT = config("LAKE_LAYOUT", default="flat")
+# Write the records from a background thread instead of the caller's thread
+LAKE_ASYNC_WRITES = config("LAKE_ASYNC_WRITES", default=False, cast=bool)
+LAKE_FLUSH_INTERVAL = config("LAKE_FLUSH_INTERVAL", default=1.0, cast=float)
+LAKE_BATCH_SIZE = config("LAKE_BATCH_SIZE", default=500, cast=int)
+LAKE_QUEUE_SIZE = config("LAKE_QUEUE_SIZE", default=10000, cast=int)
+# 'never', 'batch' or 'close'. For synchronous writes, anything but 'never' syncs every write
+LAKE_FSYNC = config("LAKE_FSYNC", default="never")
+# 'none', 'process' or 'thread'. Gives every worker its own lake files, merged later with `merge_shards`
+LAKE_SHARDING = config("LAKE_SHARDING", default="none")
+# Rotation of the lake files. 0 disables the size and record limits
+LAKE_ROTATE_MAX_BYTES = config("LAKE_ROTATE_MAX_BYTES", default=0, cast=int)
+LAKE_ROTATE_MAX_RECORDS = config("LAKE_ROTATE_MAX_RECORDS", default=0, cast=int)
+LAKE_ROTATE_DAILY = config("LAKE_ROTATE_DAILY", default=False, cast=bool)
+LAKE_COMPRESS_SEGMENTS = config("LAKE_COMPRESS_SEGMENTS", default=True, cast=bool)
+# Maintain a SQLite index of the calls in '<LAKES_BASE_DIR>/lake_index.sqlite'
+LAKE_INDEX = config("LAKE_INDEX", default=False, cast=bool)
+# Store every output once in '<LAKES_BASE_DIR>/blobs' and reference it from the records by its hash
+LAKE_DEDUPLICATE = config("LAKE_DEDUPLICATE", default=False, cast=bool)
+LAKE_DEDUPLICATE_MIN_BYTES = config("LAKE_DEDUPLICATE_MIN_BYTES", default=512, cast=int)
+# Memoize the results of the decorated functions, in memory and in '<LAKES_BASE_DIR>/cache'
+LAKE_CACHE = config("LAKE_CACHE", default=False, cast=bool)
+LAKE_CACHE_TTL = config("LAKE_CACHE_TTL", default=3600, cast=float)
+LAKE_CACHE_SIZE = config("LAKE_CACHE_SIZE", default=1024, cast=int)
+LAKE_CACHE_ON_DISK = config("LAKE_CACHE_ON_DISK", default=True, cast=bool)
+# Logging of the decorated calls made by other decorated calls, e.g. get_comments called by get_all_comments:
+# 'all' logs every call, 'outermost' only the outermost calls, 'children' only the calls that made no decorated
+# call themselves, and 'linked' logs every call but leaves the output of the parents in their children records
+LAKE_NESTED_CALLS = config("LAKE_NESTED_CALLS", default="all")
+NESTED_CALLS_POLICIES = ['all', 'outermost', 'children', 'linked']
+# What is logged of the decorated calls: 'full' records, 'metadata' (arguments and timing, without the output),
+# 'errors' (only the failed calls), 'sampled' (LAKE_LOG_SAMPLE_RATE percent of the successful calls and every
+# failed call) or 'off'. LAKE_LOG_LEVELS overrides it per source, e.g. 'GithubAPI=metadata,RedditAPI=off'
+LAKE_LOG_LEVEL = config("LAKE_LOG_LEVEL", default="full")
+LAKE_LOG_SAMPLE_RATE = config("LAKE_LOG_SAMPLE_RATE", default=10, cast=float)
+LAKE_LOG_LEVELS = config("LAKE_LOG_LEVELS", default="")
+LOG_LEVELS = ['full', 'metadata', 'errors', 'sampled', 'off']
 
+_async_writer = None
+_rotation_policy = None
+_lake_index = None
+_response_cache = None
+# Logging levels set per source with `set_log_level`: {source: (level, sample_rate)}
+_log_levels = {source.strip(): (level.strip(), None)
+               for source, _, level in (item.partition('=') for item in LAKE_LOG_LEVELS.split(',') if item.strip())}
 
-def serialize_data(data):
+
+class _CallContext:
+    """State of a decorated call in progress, shared with the decorated calls it makes."""
+    __slots__ = ('_id', 'has_children', 'children_outputs')
+
+    def __init__(self):
+        self._id = None
+        self.has_children = False
+        # Whether every call of each function made by this call was logged with its output
+        self.children_outputs = {}
+
+    @property
+    def id(self) -> str:
+        # Only generated when the call is logged or makes decorated calls
+        if self._id is None:
+            self._id = str(uuid.uuid4())
+        return self._id
+
+
+_current_call = contextvars.ContextVar('api_crawler_current_call', default=None)
+
+
+def get_lakes_base_dir() -> str:
+    """
+    Get the base directory of the lake files, reading LAKES_BASE_DIR from the configuration on first use.
+
+    :return: The base directory.
+    """
+    global LAKES_BASE_DIR
+    if LAKES_BASE_DIR is None:
+        LAKES_BASE_DIR = config("LAKES_BASE_DIR")
+    return LAKES_BASE_DIR
+
+
+def enable_async_writes(**kwargs) -> LakeWriter:
+    """
+    Start a background writer for the lake records, replacing the current one if any.
+
+    The keyword arguments are passed to `LakeWriter` and default to the LAKE_* configuration variables.
+
+    :return: The started LakeWriter.
+    """
+    global _async_writer
+    disable_async_writes()
+
+    writer_kwargs = {'flush_interval': LAKE_FLUSH_INTERVAL, 'batch_size': LAKE_BATCH_SIZE,
+                     'max_queue_size': LAKE_QUEUE_SIZE, 'fsync': LAKE_FSYNC}
+    writer_kwargs.update(kwargs)
+    _async_writer = LakeWriter(**writer_kwargs)
+    return _async_writer
+
+
+def disable_async_writes():
+    """
+    Write the pending records and go back to writing them synchronously.
+    """
+    global _async_writer
+    if _async_writer is not None:
+        _async_writer.close()
+        _async_writer = None
+
+
+def flush_lake(timeout: float = None) -> bool:
+    """
+    Wait until every record logged so far has been written to disk.
+
+    :param timeout: Maximum number of seconds to wait.
+    :return: False if the timeout expired before the records were written.
+    """
+    if _async_writer is None:
+        return True
+    return _async_writer.flush(timeout)
+
+
+def get_rotation_policy() -> RotationPolicy:
+    """
+    Get the rotation policy matching the LAKE_ROTATE_* configuration variables.
+
+    :return: The RotationPolicy, or None if rotation is disabled.
+    """
+    global _rotation_policy
+    settings = (LAKE_ROTATE_MAX_BYTES, LAKE_ROTATE_MAX_RECORDS, LAKE_ROTATE_DAILY, LAKE_COMPRESS_SEGMENTS)
+    if not any(settings[:3]):
+        return None
+
+    # The policy is reused between calls since it caches the record count of the files
+    if _rotation_policy is None or _rotation_policy[0] != settings:
+        _rotation_policy = (settings, RotationPolicy(*settings))
+    return _rotation_policy[1]
+
+
+def get_lake_index() -> LakeIndex:
+    """
+    Get the index of the calls logged in LAKES_BASE_DIR.
+
+    :return: The LakeIndex, or None if LAKE_INDEX is disabled.
+    """
+    global _lake_index
+    if not LAKE_INDEX:
+        return None
+
+    db_path = os.path.join(get_lakes_base_dir(), INDEX_FILE_NAME)
+    if _lake_index is None or _lake_index.db_path != db_path:
+        _lake_index = LakeIndex(db_path)
+    return _lake_index
+
+
+def get_blob_store() -> BlobStore:
+    """
+    Get the store of the deduplicated outputs of LAKES_BASE_DIR.
+
+    :return: The BlobStore, or None if LAKE_DEDUPLICATE is disabled.
+    """
+    if not LAKE_DEDUPLICATE:
+        return None
+    return BlobStore(os.path.join(get_lakes_base_dir(), BLOBS_DIR_NAME), min_bytes=LAKE_DEDUPLICATE_MIN_BYTES)
+
+
+def enable_response_cache(**kwargs) -> ResponseCache:
+    """
+    Start memoizing the results of the decorated functions, replacing the current cache if any.
+
+    The keyword arguments are passed to `ResponseCache` and default to the LAKE_CACHE_* configuration variables.
+
+    :return: The ResponseCache.
+    """
+    global _response_cache
+    cache_kwargs = {'directory': os.path.join(get_lakes_base_dir(), CACHE_DIR_NAME) if LAKE_CACHE_ON_DISK else None,
+                    'max_entries': LAKE_CACHE_SIZE, 'default_ttl': LAKE_CACHE_TTL}
+    cache_kwargs.update(kwargs)
+    _response_cache = ResponseCache(**cache_kwargs)
+    return _response_cache
+
+
+def disable_response_cache():
+    """
+    Stop memoizing the results of the decorated functions.
+    """
+    global _response_cache
+    _response_cache = None
+
+
+def get_response_cache() -> ResponseCache:
+    """
+    Get the response cache of the decorated functions.
+
+    :return: The ResponseCache, or None if the cache is disabled.
+    """
+    if _response_cache is None and LAKE_CACHE:
+        enable_response_cache()
+    return _response_cache
+
+
+def set_log_level(level: str, source: str = None, sample_rate: float = None):
+    """
+    Set what is logged of the decorated calls, globally or for a single source.
+
+    :param level: 'full', 'metadata', 'errors', 'sampled' or 'off'. None removes the level of the source.
+    :param source: The class name of the source, e.g. 'GithubAPI', or the qualified name of a method,
+        e.g. 'GithubAPI.get_repo_issues'. None sets the global level.
+    :param sample_rate: The percentage of the successful calls logged with the 'sampled' level.
+        Defaults to LAKE_LOG_SAMPLE_RATE.
+    """
+    global LAKE_LOG_LEVEL, LAKE_LOG_SAMPLE_RATE
+    if level is not None and level not in LOG_LEVELS:
+        raise ValueError(f"Invalid log level {level}. Choose from {LOG_LEVELS}.")
+    if source is None:
+        if level is None:
+            raise ValueError("The global log level cannot be removed")
+        LAKE_LOG_LEVEL = level
+        if sample_rate is not None:
+            LAKE_LOG_SAMPLE_RATE = sample_rate
+    elif level is None:
+        _log_levels.pop(source, None)
+    else:
+        _log_levels[source] = (level, sample_rate)
+
+
+def get_log_level(qualname: str) -> tuple:
+    """
+    Get the logging level of a decorated function: the level of the method if set, else the level of
+    its class, else the global level.
+
+    :param qualname: The qualified name of the function, e.g. 'GithubAPI.get_repo_issues'.
+    :return: The level and the sample rate.
+    """
+    level, sample_rate = _log_levels.get(qualname) or _log_levels.get(qualname.rpartition('.')[0]) or (LAKE_LOG_LEVEL, None)
+    if level not in LOG_LEVELS:
+        raise ValueError(f"Invalid log level {level}. Choose from {LOG_LEVELS}.")
+    return level, LAKE_LOG_SAMPLE_RATE if sample_rate is None else sample_rate
+
+
+def _binding_plan(func):
+    """
+    Build a function binding the arguments of a call to the parameters of `func`, like
+    `inspect.signature(func).bind(*args, **kwargs)` followed by `apply_defaults()`.
+
+    The signature is inspected once, when the function is decorated. Calls to functions without
+    positional-only or variadic positional parameters are bound with plain dict operations, and the
+    others, as well as the invalid calls, go through `Signature.bind`.
+
+    :param func: The decorated function.
+    :return: A function of (args, kwargs) returning the dict of the bound arguments.
     """
-    Attempt to JSON serialize the data, converting non-serializable objects to strings.
+    sig = inspect.signature(func)
+
+    def bind_with_signature(args, kwargs):
+        bound_args = sig.bind(*args, **kwargs)
+        bound_args.apply_defaults()
+        return dict(bound_args.arguments)
+
+    parameters = list(sig.parameters.values())
+    if any(p.kind in (p.POSITIONAL_ONLY, p.VAR_POSITIONAL) for p in parameters):
+        return bind_with_signature
+
+    positional = tuple(p.name for p in parameters if p.kind is p.POSITIONAL_OR_KEYWORD)
+    keyword_only = tuple(p.name for p in parameters if p.kind is p.KEYWORD_ONLY)
+    var_keyword = next((p.name for p in parameters if p.kind is p.VAR_KEYWORD), None)
+    names = set(positional + keyword_only)
+    defaults = {p.name: p.default for p in parameters if p.default is not p.empty}
+
+    def bind(args, kwargs):
+        if len(args) > len(positional):
+            return bind_with_signature(args, kwargs)
+        arguments = dict(zip(positional, args))
+        n_keywords = 0
+        for name in positional[len(args):] + keyword_only:
+            if name in kwargs:
+                arguments[name] = kwargs[name]
+                n_keywords += 1
+            elif name in defaults:
+                arguments[name] = defaults[name]
+            else:
+                return bind_with_signature(args, kwargs)
+
+        if var_keyword is not None:
+            arguments[var_keyword] = {key: value for key, value in kwargs.items() if key not in names}
+            n_keywords += len(arguments[var_keyword])
+        if n_keywords != len(kwargs):
+            # Unexpected keyword arguments, or given both positionally and by keyword
+            return bind_with_signature(args, kwargs)
+        return arguments
+
+    return bind
+
+
+def lake_file_path_for(qualname: str, start_time: datetime = None) -> str:
     """
-    if isinstance(data, (dict, list, tuple)):
-        if isinstance(data, dict):
-            return {key: serialize_data(value) for key, value in data.items()}
+    Get the lake file the calls of a function are logged to, following the LAKE_LAYOUT, LAKE_FORMAT and
+    LAKE_SHARDING configuration variables.
+
+    :param qualname: The qualified name of the function, e.g. 'GithubAPI.get_repo_issues'.
+    :param start_time: The start time of the call, which selects the date partition. Defaults to now.
+    :return: The path of the lake file.
+    """
+    if LAKE_LAYOUT not in LAYOUTS:
+        raise ValueError(f"Invalid LAKE_LAYOUT {LAKE_LAYOUT}. Choose from {LAYOUTS}.")
+    shard = shard_id(LAKE_SHARDING)
+    if LAKE_LAYOUT == 'partitioned':
+        return partition_file_path(get_lakes_base_dir(), qualname, (start_time or datetime.now()).date(),
+                                   LAKE_FORMAT, shard=shard)
+    return lake_file_path(get_lakes_base_dir(), qualname, LAKE_FORMAT, shard=shard)
+
+
+def write_log_entry(file_path: str, log_data: dict):
+    """
+    Write a record to a lake file, through the background writer when async writes are enabled.
+    """
+    if _async_writer is None and LAKE_ASYNC_WRITES:
+        enable_async_writes()
+
+    rotation = get_rotation_policy()
+    index = get_lake_index()
+    blobs = get_blob_store()
+    if _async_writer is not None:
+        _async_writer.submit(file_path, log_data, LAKE_FORMAT, rotation=rotation, index=index, blobs=blobs)
+    else:
+        append_entries(file_path, [log_data], LAKE_FORMAT, fsync=LAKE_FSYNC != 'never', rotation=rotation,
+                       index=index, blobs=blobs)
+
+
+class _LoggedCall:
+    """
+    A call of a decorated function, from the lookup of its memoized result to the writing of its record.
+
+    Shared by the synchronous and asynchronous wrappers of `log_io_to_json`, which only differ in how
+    they call the function.
+    """
+
+    def __init__(self, qualname, bind_arguments, args, kwargs):
+        self.qualname = qualname
+        self.level, self.sample_rate = get_log_level(qualname)
+        self.response_cache = get_response_cache()
+        # Neither logged nor memoized, the function is simply called
+        self.bypass = self.level == 'off' and self.response_cache is None
+        self.hit = False
+        self.cached_output = None
+        if self.bypass:
+            return
+
+        # Bind the passed arguments to the function's parameters
+        self.arguments = bind_arguments(args, kwargs)
+
+        # Look up the memoized result, if any, which is returned without calling the function nor logging the call
+        if self.response_cache is not None:
+            self.cache_key = self.response_cache.key(self.arguments)
+            self.hit, self.cached_output = self.response_cache.get(qualname, self.cache_key)
+
+
+    def enter(self):
+        """
+        Start the call, tracking it so the decorated calls it makes know their parent.
+
+        Returns:
+            The token to pass to `_current_call.reset` once the function returns.
+        """
+        # Capture the start time
+        self.start_time = datetime.now()
+        self.parent_call = _current_call.get()
+        self.call = _CallContext()
+        return _current_call.set(self.call)
+
+
+    def finish(self, output_data, exception_instance):
+        """
+        Memoize the result of the call and log it, according to the logging level and the nested calls policy.
+        """
+        # Capture the end time
+        end_time = datetime.now()
+        error = exception_instance is not None
+        error_log = str(exception_instance) if error else ''
+        parent_call, call, level = self.parent_call, self.call, self.level
+
+        if parent_call is not None:
+            parent_call.has_children = True
+
+        if self.response_cache is not None and not error:
+            self.response_cache.set(self.qualname, self.cache_key, output_data)
+
+        if LAKE_NESTED_CALLS not in NESTED_CALLS_POLICIES:
+            raise ValueError(f"Invalid LAKE_NESTED_CALLS policy {LAKE_NESTED_CALLS}. Choose from {NESTED_CALLS_POLICIES}.")
+        skip_log = ((LAKE_NESTED_CALLS == 'outermost' and parent_call is not None) or
+                    (LAKE_NESTED_CALLS == 'children' and call.has_children and not error) or
+                    level == 'off' or
+                    (level == 'errors' and not error) or
+                    (level == 'sampled' and not error and random.random() * 100 >= self.sample_rate))
+        # With the 'linked' policy, the output of a parent is left in the records of its children
+        output_in_children = LAKE_NESTED_CALLS == 'linked' and call.has_children and not error
+        # With the 'metadata' level, only the arguments and timing of the call are logged
+        output_omitted = level == 'metadata' and not error
+
+        if parent_call is not None:
+            logged_output = not (skip_log or output_in_children or output_omitted or output_data is None)
+            outputs = parent_call.children_outputs
+            outputs[self.qualname] = outputs.get(self.qualname, True) and logged_output
+        if skip_log:
+            return
+
+        # Transform the bound arguments into a dictionary with parameter names as keys
+        args_dict = {param_name: serialize_data(param_value) for param_name, param_value in self.arguments.items()}
+        serialized_input = {'args': args_dict}
+
+        # The output, usually the bulk of the record, is encoded once here and embedded as is when writing
+        if output_in_children or output_omitted or output_data is None:
+            serialized_output = None
         else:
-            return [serialize_data(item) for item in data]
-    try:
-        json.dumps(data)
-        return data
-    except (TypeError, ValueError):
-        return str(data)
+            serialized_output = EncodedJSON(dumps(output_data))
+
+        # Store the input, output data, and timing information
+        log_data = {
+            'id': call.id,
+            'function': self.qualname,
+            'start_time': self.start_time.isoformat(timespec='seconds'),
+            'end_time': end_time.isoformat(timespec='seconds'),
+            'input': serialized_input,
+            'output': serialized_output,
+            'error': error,
+            'error_log': error_log
+        }
+        if parent_call is not None:
+            log_data['parent_id'] = parent_call.id
+        if output_in_children:
+            log_data['output_in_children'] = True
+        if output_omitted:
+            log_data['output_omitted'] = True
+        # The functions whose calls all logged their output, e.g. the pages of a listing, so readers can tell
+        # that the output of this call repeats theirs
+        children_functions = sorted(function for function, logged in call.children_outputs.items() if logged)
+        if children_functions:
+            log_data['children_functions'] = children_functions
 
+        # Determine the file path using the function's __qualname__ and prepend the base directory
+        file_path = lake_file_path_for(self.qualname, self.start_time)
 
+        # Append the new log entry using the configured storage format
+        write_log_entry(file_path, log_data)
 
 
 def log_io_to_json(func):
@@ -35,85 +474,83 @@ def log_io_to_json(func):
     logging all interactions with data sources. It captures and logs the function's
     input arguments and output, along with execution time and any errors encountered.
     
+    What is logged depends on the logging level of the function, see `set_log_level`.
+    Coroutine functions are supported: the call is logged once awaited, and the decorated calls
+    awaited inside it, including from the tasks it creates, are logged as its children.
+
     :param func: The function to be decorated.
     :return: The wrapper function which extends the functionality of 'func' with logging.
     """
+    # The signature is inspected once here rather than on every call
+    bind_arguments = _binding_plan(func)
+    qualname = func.__qualname__
+
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            logged_call = _LoggedCall(qualname, bind_arguments, args, kwargs)
+            if logged_call.bypass:
+                return await func(*args, **kwargs)
+            if logged_call.hit:
+                return logged_call.cached_output
+
+            # Call the original coroutine function
+            token = logged_call.enter()
+            try:
+                output_data = await func(*args, **kwargs)
+                exception_instance = None
+            except Exception as e:
+                output_data = None
+                exception_instance = e
+            finally:
+                _current_call.reset(token)
+
+            logged_call.finish(output_data, exception_instance)
+            if exception_instance is not None:
+                raise exception_instance
+            return output_data
+        return async_wrapper
+
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
-        # Generate a unique identifier for the function call
-        call_id = str(uuid.uuid4())
-        # Capture the start time
-        start_time = datetime.now().isoformat(timespec='seconds')
-        
+        logged_call = _LoggedCall(qualname, bind_arguments, args, kwargs)
+        if logged_call.bypass:
+            return func(*args, **kwargs)
+        if logged_call.hit:
+            return logged_call.cached_output
+
         # Call the original function
+        token = logged_call.enter()
         try:
             output_data = func(*args, **kwargs)
-            error = False
-            error_log = ''
             exception_instance = None
         except Exception as e:
             output_data = None
-            error = True
-            error_log = str(e)
             exception_instance = e
-        # Capture the end time
-        end_time = datetime.now().isoformat(timespec='seconds')
+        finally:
+            _current_call.reset(token)
 
-        # Get the function's signature and bind the passed arguments to it
-        sig = inspect.signature(func)
-        bound_args = sig.bind(*args, **kwargs)
-        bound_args.apply_defaults()
-
-        # Transform bound_args.arguments into a dictionary with parameter names as keys
-        args_dict = {param_name: serialize_data(param_value) for param_name, param_value in bound_args.arguments.items()}
-        serialized_input = {'args': args_dict}
-
-        serialized_output = serialize_data(output_data)
-
-        # Store the input, output data, and timing information
-        log_data = {
-            'id': call_id,
-            'start_time': start_time,
-            'end_time': end_time,
-            'input': serialized_input,
-            'output': serialized_output,
-            'error': error,
-            'error_log': error_log
-        }
-        
-        # Determine the file path using the function's __name__ and prepend the base directory
-        file_path = os.path.join(LAKES_BASE_DIR, f"{func.__qualname__.replace('.','_')}.json")
-        
-        # Check if the directory exists, create it if not
-        os.makedirs(os.path.dirname(file_path), exist_ok=True)
-        
-        # Read the existing data, if any, and append the new log entry
-        try:
-            with open(file_path, 'r') as f:
-                log_entries = json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            log_entries = []
-        
-        log_entries.append(log_data)
-        
-        # Write the updated log entries list to the file
-        with open(file_path, 'w') as f:
-            json.dump(log_entries, f, indent = 1)
-
-        if error:
+        logged_call.finish(output_data, exception_instance)
+        if exception_instance is not None:
             raise exception_instance
-        else:
-            return output_data
+        return output_data
     return wrapper
 
 
 def read_log(json_file_path):
     """
-    Reads the content of a JSON file and returns the data.
+    Reads the content of a lake file and returns the data.
+
+    Both the legacy JSON array files and the JSON Lines files are supported. The records written
+    to the shards of the file and to the segments closed by rotation are included as well.
+    Deduplicated outputs are loaded back into the records.
 
-    :param json_file_path: The path to the JSON file.
-    :return: The data contained in the JSON file.
+    :param json_file_path: The path to the lake file.
+    :return: The list of records contained in the file.
     """
-    with open(json_file_path, 'r') as file:
-        return json.load(file)
+    entries = read_entries(json_file_path)
+    blob_store = blob_store_for(json_file_path)
+    if blob_store is not None:
+        entries = [blob_store.resolve(entry) for entry in entries]
+    return entries
 
@@ -0,0 +1,118 @@
+import os
+from datetime import date
+from typing import Union
+from .storage import JSON_FORMAT, lake_file_path
+
+
+# 'flat' stores the records of a function in '<stem>.<json|jsonl>' files at the root of the lake, and
+# 'partitioned' in 'source=<source>/method=<method>/date=<YYYY-MM-DD>/part.<json|jsonl>' files
+LAYOUTS = ['flat', 'partitioned']
+PARTITION_KEYS = ['source', 'method', 'date']
+PART_FILE_STEM = 'part'
+
+
+def source_name(name: str) -> str:
+    """
+    Get the value of the source partition of a data source, e.g. 'github' for 'GithubAPI'.
+    Functions that are not methods of a class go to the 'functions' source.
+    """
+    name = name.lower()
+    if name.endswith('api') and len(name) > len('api'):
+        name = name[:-len('api')]
+    return name or 'functions'
+
+
+def partition_values(qualname: str) -> tuple:
+    """
+    Get the source and method partition values of a function.
+
+    Args:
+        qualname (str): The qualified name of the function, e.g. 'GithubAPI.get_repo_issues'.
+
+    Returns:
+        tuple: The source and the method, e.g. ('github', 'get_repo_issues').
+    """
+    owner, _, method = qualname.rpartition('.')
+    return source_name(owner.rpartition('.')[2]), method
+
+
+def partition_dir(base_dir: str, qualname: str, day: Union[str, date]) -> str:
+    """
+    Build the path of the partition holding the calls of a function started on a given day.
+    """
+    source, method = partition_values(qualname)
+    day = day.strftime('%Y-%m-%d') if isinstance(day, date) else day[:10]
+    return os.path.join(base_dir, f"source={source}", f"method={method}", f"date={day}")
+
+
+def partition_file_path(base_dir: str, qualname: str, day: Union[str, date], file_format: str = JSON_FORMAT,
+                        shard: str = None) -> str:
+    """
+    Build the path of the lake file of a partition, e.g.
+    '<base_dir>/source=github/method=get_repo_issues/date=2024-06-01/part.jsonl'.
+
+    Args:
+        base_dir (str): The base directory of the data lake.
+        qualname (str): The qualified name of the logged function.
+        day (str or date): The day the calls were started.
+        file_format (str): Either 'json' (single JSON array) or 'jsonl' (one record per line).
+        shard (str): The shard identifier of the writer, as returned by `shard_id`.
+
+    Returns:
+        str: The path of the lake file.
+    """
+    return lake_file_path(partition_dir(base_dir, qualname, day), PART_FILE_STEM, file_format, shard=shard)
+
+
+def parse_partition(path: str) -> dict:
+    """
+    Get the partition values of a path, e.g. {'source': 'github', 'method': 'get_repo_issues', 'date': '2024-06-01'}.
+    """
+    values = {}
+    for component in os.path.normpath(path).split(os.sep):
+        key, separator, value = component.partition('=')
+        if separator and key in PARTITION_KEYS:
+            values[key] = value
+    return values
+
+
+def select_partitions(path: str, source: str = None, method: str = None, start_time: str = None,
+                      end_time: str = None) -> list:
+    """
+    List the date partitions under a directory that can hold matching calls, looking only at the names
+    of the directories.
+
+    Args:
+        path (str): The base directory of the lake, or a source or method partition.
+        source (str): Only the partitions of this source, e.g. 'github' or 'GithubAPI'.
+        method (str): Only the partitions of this method, e.g. 'get_repo_issues'.
+        start_time (str): Skip the days before the day of this ISO 8601 time.
+        end_time (str): Skip the days starting at or after this ISO 8601 time.
+
+    Returns:
+        list: The paths of the date partitions, in chronological order within each source and method.
+    """
+    start_day = start_time[:10] if start_time else None
+    wanted = {'source': source_name(source) if source else None, 'method': method}
+
+    def keep(key: str, value: str) -> bool:
+        if key == 'date':
+            return (start_day is None or value >= start_day) and (end_time is None or value < end_time)
+        return wanted[key] is None or value == wanted[key]
+
+    key = os.path.basename(os.path.normpath(path)).partition('=')[0]
+    level = PARTITION_KEYS.index(key) + 1 if key in PARTITION_KEYS else 0
+    if level == len(PARTITION_KEYS):
+        # A date partition is read as a flat directory
+        return []
+
+    directories = [path]
+    for key in PARTITION_KEYS[level:]:
+        prefix = f"{key}="
+        selected = []
+        for directory in directories:
+            with os.scandir(directory) as entries:
+                names = sorted(entry.name for entry in entries if entry.is_dir() and entry.name.startswith(prefix))
+            selected.extend(os.path.join(directory, name) for name in names if keep(key, name[len(prefix):]))
+        directories = selected
+    return directories
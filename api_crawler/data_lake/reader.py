@@ -0,0 +1,122 @@
+import os
+from datetime import datetime
+from typing import Union
+from .storage import iter_file_entries, lake_files, parse_lake_file_name, resolve_lake_files
+from .blobs import blob_store_for
+from .partitions import PART_FILE_STEM, partition_values, select_partitions, source_name
+
+
+def _as_timestamp(value: Union[str, datetime]) -> str:
+    # Records store their times as ISO 8601 strings, which sort in chronological order
+    if isinstance(value, datetime):
+        return value.isoformat(timespec='seconds')
+    return value
+
+
+def _segment_end_time(segment: str) -> str:
+    # Segments are named after the time they were closed, e.g. '20240101T120000123456'
+    return datetime.strptime(segment, '%Y%m%dT%H%M%S%f').isoformat(timespec='seconds')
+
+
+def _directory_lake_files(directory: str, stem: str = None) -> list:
+    # The lake files directly in a directory, each with its shards and segments. The segments are listed
+    # with every format of their lake file, and kept once
+    groups = {}
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            parsed = parse_lake_file_name(entry.name)
+            if parsed is None or (stem and parsed.stem not in (stem, PART_FILE_STEM)):
+                continue
+            groups.setdefault((parsed.stem, parsed.extension), entry.path)
+    paths = [file_path for key in sorted(groups) for file_path in lake_files(groups[key])]
+    return list(dict.fromkeys(paths))
+
+
+def select_lake_files(path: str, function: str = None, start_time: Union[str, datetime] = None,
+                      end_time: Union[str, datetime] = None, source: str = None) -> list:
+    """
+    List the lake files to read for a path, skipping the ones that cannot hold matching records.
+
+    The partitions of a partitioned lake are pruned by source, method and date before any file is opened.
+
+    :param path: A lake file (read with its shards and segments), a single shard or segment, or a directory
+        of lake files, partitioned or not.
+    :param function: Only keep the files of this function, e.g. 'GithubAPI.get_repo_issues'.
+    :param start_time: Skip the segments closed and the partitions of the days before this time.
+    :param end_time: Skip the partitions of the days starting at or after this time.
+    :param source: Only keep the partitions of this source, e.g. 'github' or 'GithubAPI'.
+    :return: The list of paths.
+    """
+    stem = function.replace('.', '_') if function else None
+    start_time = _as_timestamp(start_time)
+    end_time = _as_timestamp(end_time)
+
+    if os.path.isdir(path):
+        paths = _directory_lake_files(path, stem)
+        if function:
+            function_source, method = partition_values(function)
+            if source and source_name(source) != function_source:
+                return []
+            source = function_source
+        else:
+            method = None
+        for partition in select_partitions(path, source=source, method=method, start_time=start_time,
+                                           end_time=end_time):
+            paths.extend(_directory_lake_files(partition))
+    else:
+        paths = resolve_lake_files(path)
+
+    selected = []
+    for file_path in paths:
+        parsed = parse_lake_file_name(os.path.basename(file_path))
+        if parsed is not None:
+            if stem and parsed.stem not in (stem, PART_FILE_STEM):
+                continue
+            # Every record of a segment was written before the segment was closed
+            if start_time and parsed.segment and _segment_end_time(parsed.segment) < start_time[:19]:
+                continue
+        selected.append(file_path)
+    return selected
+
+
+def iter_log(path: str, start_time: Union[str, datetime] = None, end_time: Union[str, datetime] = None,
+             error: bool = None, function: str = None, source: str = None, resolve_blobs: bool = True):
+    """
+    Iterate over the records of the data lake one at a time, with constant memory.
+
+    Unlike `read_log`, the files are never loaded whole, so lakes larger than the memory can be scanned.
+    JSON Lines files, legacy JSON array files and gzip compressed segments are all supported.
+
+    Args:
+        path (str): A lake file (read with its shards and segments), a single shard or segment, or a directory
+            of lake files such as LAKES_BASE_DIR. The partitions of a partitioned lake that cannot hold matching
+            calls are skipped without being opened.
+        start_time (str or datetime): Only yield the calls started at or after this time.
+        end_time (str or datetime): Only yield the calls started before this time.
+        error (bool): Only yield the failed calls if True, or the successful ones if False.
+        function (str): Only yield the calls of this function, e.g. 'GithubAPI.get_repo_issues'.
+        source (str): Only yield the calls of this data source, e.g. 'github' or 'GithubAPI'.
+        resolve_blobs (bool): Replace the references to deduplicated outputs by the outputs themselves.
+
+    Yields:
+        dict: The records matching the filters.
+    """
+    start_time = _as_timestamp(start_time)
+    end_time = _as_timestamp(end_time)
+    source = source_name(source) if source else None
+    blob_store = blob_store_for(path) if resolve_blobs else None
+
+    for file_path in select_lake_files(path, function=function, start_time=start_time, end_time=end_time,
+                                       source=source):
+        for record in iter_file_entries(file_path):
+            if start_time and record.get('start_time', '') < start_time:
+                continue
+            if end_time and record.get('start_time', '') >= end_time:
+                continue
+            if error is not None and record.get('error') != error:
+                continue
+            if function and record.get('function', function) != function:
+                continue
+            if source and 'function' in record and partition_values(record['function'])[0] != source:
+                continue
+            yield blob_store.resolve(record) if blob_store is not None else record
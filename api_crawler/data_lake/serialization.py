@@ -0,0 +1,162 @@
+import base64
+import json
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from enum import Enum
+from pathlib import PurePath
+from uuid import UUID
+from decouple import config
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# JSON encoder of the lake records: 'auto' uses orjson when it is installed, 'json' always uses the standard library
+LAKE_JSON_BACKEND = config("LAKE_JSON_BACKEND", default="auto")
+
+_JSON_TYPES = (str, int, float, bool, type(None))
+
+
+class EncodedJSON(bytes):
+    """
+    A value that was already encoded to JSON. `encode_entry` embeds it as is instead of encoding it again.
+    """
+
+
+def _convert_response(response) -> dict:
+    try:
+        body = response.json()
+    except ValueError:
+        body = response.text
+    return {'status_code': response.status_code, 'url': response.url,
+            'headers': dict(response.headers), 'body': body}
+
+
+def _convert_praw_model(model) -> dict:
+    # The attributes fetched from Reddit, without the client and the other private attributes
+    return {key: value for key, value in vars(model).items() if not key.startswith('_')}
+
+
+def _convert_bytes(value: bytes):
+    try:
+        return value.decode()
+    except UnicodeDecodeError:
+        return base64.b64encode(value).decode()
+
+
+# Converters of the types of the optional dependencies, looked up by name so that they are never imported here
+_CONVERTERS_BY_NAME = {
+    'requests.models.Response': _convert_response,
+    'bs4.element.Tag': str,
+    'praw.models.reddit.base.RedditBase': _convert_praw_model,
+}
+
+_CONVERTERS_BY_TYPE = {
+    datetime: lambda value: value.isoformat(),
+    date: lambda value: value.isoformat(),
+    time: lambda value: value.isoformat(),
+    timedelta: lambda value: value.total_seconds(),
+    Decimal: float,
+    UUID: str,
+    PurePath: str,
+    Enum: lambda value: value.value,
+    set: list,
+    frozenset: list,
+    tuple: list,
+    bytes: _convert_bytes,
+    bytearray: _convert_bytes,
+}
+
+# Converter of every type met so far, so the class hierarchy of a type is only walked once
+_converters = {}
+
+
+def _find_converter(cls):
+    for base in cls.__mro__:
+        converter = _CONVERTERS_BY_TYPE.get(base) or _CONVERTERS_BY_NAME.get(f"{base.__module__}.{base.__qualname__}")
+        if converter is not None:
+            return converter
+    return str
+
+
+def to_jsonable(value):
+    """
+    Convert a value the JSON encoder does not support to one it does.
+
+    Known types get a proper converter: datetimes become ISO 8601 strings, `requests.Response` objects
+    a dict with their status, URL, headers and body, BeautifulSoup tags their HTML, praw models a dict of
+    their fetched attributes, and so on. Any other value is converted to its string representation.
+    """
+    cls = type(value)
+    converter = _converters.get(cls)
+    if converter is None:
+        converter = _converters[cls] = _find_converter(cls)
+    return converter(value)
+
+
+def serialize_data(data):
+    """
+    Convert data to a structure made only of JSON types, in a single pass.
+
+    Dicts, lists and tuples are copied recursively and the other values are converted with `to_jsonable`.
+    """
+    cls = type(data)
+    if cls is str or cls is int or cls is float or cls is bool or data is None:
+        return data
+    if cls is dict:
+        return {key: serialize_data(value) for key, value in data.items()}
+    if cls is list or cls is tuple:
+        return [serialize_data(item) for item in data]
+    if isinstance(data, _JSON_TYPES) and not isinstance(data, Enum):
+        return data
+    if isinstance(data, dict):
+        return {key: serialize_data(value) for key, value in data.items()}
+    if isinstance(data, (list, tuple)):
+        return [serialize_data(item) for item in data]
+    return serialize_data(to_jsonable(data))
+
+
+def _use_orjson() -> bool:
+    if LAKE_JSON_BACKEND not in ['auto', 'json', 'orjson']:
+        raise ValueError(f"Invalid LAKE_JSON_BACKEND {LAKE_JSON_BACKEND}. Choose from 'auto', 'json', 'orjson'.")
+    if LAKE_JSON_BACKEND == 'orjson' and orjson is None:
+        raise ImportError("LAKE_JSON_BACKEND is 'orjson' but orjson is not installed. Install it with `pip install orjson`.")
+    return orjson is not None and LAKE_JSON_BACKEND != 'json'
+
+
+def dumps(data) -> bytes:
+    """
+    Encode data to compact JSON in a single pass, converting the unsupported values with `to_jsonable`.
+    """
+    if _use_orjson():
+        try:
+            return orjson.dumps(data, default=to_jsonable, option=orjson.OPT_NON_STR_KEYS)
+        except (orjson.JSONEncodeError, TypeError):
+            # e.g. integers larger than 64 bits, which the standard library supports
+            pass
+    return json.dumps(data, default=to_jsonable, separators=(',', ':')).encode()
+
+
+def encode_entry(entry: dict) -> bytes:
+    """
+    Encode a lake record to JSON, embedding its output as is when it was already encoded.
+    """
+    output = entry.get('output')
+    if not isinstance(output, EncodedJSON):
+        return dumps(entry)
+
+    head = dumps({key: value for key, value in entry.items() if key != 'output'})
+    separator = b',' if head != b'{}' else b''
+    return head[:-1] + separator + b'"output":' + output + b'}'
+
+
+def decode_entry(entry: dict) -> dict:
+    """
+    Turn a lake record whose output was already encoded into plain JSON types.
+    """
+    output = entry.get('output')
+    if isinstance(output, EncodedJSON):
+        return {**entry, 'output': json.loads(output)}
+    return entry
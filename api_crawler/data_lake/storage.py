@@ -0,0 +1,596 @@
+import contextlib
+import gzip
+import json
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import warnings
+from collections import namedtuple
+from datetime import datetime, date
+from .serialization import encode_entry, decode_entry, to_jsonable
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+JSON_FORMAT = 'json'
+JSONL_FORMAT = 'jsonl'
+
+FILE_EXTENSIONS = {
+    JSON_FORMAT: '.json',
+    JSONL_FORMAT: '.jsonl',
+}
+COMPRESSED_EXTENSION = '.gz'
+SEGMENT_PREFIX = 'seg-'
+
+# Lake file names follow '<stem>[.<shard>][.seg-<timestamp>].<json|jsonl>[.gz]'
+LakeFileName = namedtuple('LakeFileName', ['stem', 'shard', 'segment', 'extension', 'compressed'])
+
+
+SHARDING_MODES = ['none', 'process', 'thread']
+
+
+def shard_id(sharding: str = 'none') -> str:
+    """
+    Identify the shard the current worker writes to.
+
+    :param sharding: 'none' (a single file shared by every worker), 'process' (one file per host and process)
+        or 'thread' (one file per host, process and thread).
+    :return: The shard identifier, or None when sharding is disabled.
+    """
+    if sharding not in SHARDING_MODES:
+        raise ValueError(f"Invalid sharding mode {sharding}. Choose from {SHARDING_MODES}.")
+    if sharding == 'none':
+        return None
+
+    shard = f"{socket.gethostname().replace('.', '-')}-{os.getpid()}"
+    if sharding == 'thread':
+        shard += f"-{threading.get_ident()}"
+    return shard
+
+
+def lake_file_path(base_dir: str, qualname: str, file_format: str = JSON_FORMAT, shard: str = None) -> str:
+    """
+    Build the path of the lake file that stores the records of a function.
+
+    :param base_dir: The base directory of the data lake.
+    :param qualname: The qualified name of the logged function, e.g. 'GithubAPI.get_repo_issues'.
+    :param file_format: Either 'json' (single JSON array) or 'jsonl' (one record per line).
+    :param shard: The shard identifier of the writer, as returned by `shard_id`.
+    :return: The path of the lake file.
+    """
+    if file_format not in FILE_EXTENSIONS:
+        raise ValueError(f"Invalid lake format {file_format}. Choose from {list(FILE_EXTENSIONS)}.")
+
+    file_name = qualname.replace('.', '_')
+    if shard:
+        file_name += f".{shard}"
+    return os.path.join(base_dir, f"{file_name}{FILE_EXTENSIONS[file_format]}")
+
+
+def parse_lake_file_name(file_name: str) -> LakeFileName:
+    """
+    Split a lake file name into its stem, shard, segment, extension and compression flag.
+
+    :param file_name: The base name of the file, e.g. 'GithubAPI_get_repo_issues.host-42.seg-20240101T000000000000.jsonl.gz'.
+    :return: The parsed LakeFileName, or None if the name is not the name of a lake file.
+    """
+    compressed = file_name.endswith(COMPRESSED_EXTENSION)
+    if compressed:
+        file_name = file_name[:-len(COMPRESSED_EXTENSION)]
+
+    name, extension = os.path.splitext(file_name)
+    if extension not in FILE_EXTENSIONS.values():
+        return None
+
+    stem, *parts = name.split('.')
+    segment = None
+    if parts and parts[-1].startswith(SEGMENT_PREFIX):
+        segment = parts.pop()[len(SEGMENT_PREFIX):]
+    if len(parts) > 1:
+        return None
+    return LakeFileName(stem, parts[0] if parts else None, segment, extension, compressed)
+
+
+def _lake_file_sort_key(parsed: LakeFileName):
+    # Closed segments first, in the order they were rotated, then the files still being written
+    return (parsed.segment is None, parsed.segment or '', parsed.shard or '')
+
+
+def lake_files(file_path: str) -> list:
+    """
+    List every file holding records of a lake file: the file itself, the shards of the other workers
+    and the closed segments left by rotation, oldest segments first. The segments are listed whatever
+    their format, since the compaction rewrites the JSON array files into JSON Lines segments.
+
+    :param file_path: The path of the lake file, e.g. '<LAKES_BASE_DIR>/GithubAPI_get_repo_issues.jsonl'.
+    :return: The list of existing paths.
+    """
+    directory, file_name = os.path.split(file_path)
+    target = parse_lake_file_name(file_name)
+    if target is None:
+        return [file_path] if os.path.exists(file_path) else []
+
+    files = []
+    try:
+        entries = os.scandir(directory or '.')
+    except FileNotFoundError:
+        return []
+    with entries:
+        for entry in entries:
+            parsed = parse_lake_file_name(entry.name)
+            if (parsed is not None and parsed.stem == target.stem and
+                    (parsed.extension == target.extension or parsed.segment is not None)):
+                files.append((_lake_file_sort_key(parsed), entry.path))
+    return [path for _, path in sorted(files)]
+
+
+def shard_paths(file_path: str) -> list:
+    """
+    List the shard files written next to a lake file, e.g. 'GithubAPI_get_repo_issues.<host>-<pid>.jsonl'
+    for 'GithubAPI_get_repo_issues.jsonl', including their closed segments.
+    """
+    return [path for path in lake_files(file_path)
+            if parse_lake_file_name(os.path.basename(path)).shard is not None]
+
+
+def open_lake_file(file_path: str):
+    """
+    Open a lake file for reading as text, decompressing it transparently if it is gzip compressed.
+    """
+    if file_path.endswith(COMPRESSED_EXTENSION):
+        return gzip.open(file_path, 'rt')
+    return open(file_path, 'r')
+
+
+def compress_file(file_path: str) -> str:
+    """
+    Gzip compress a file, replacing it with '<file>.gz'.
+
+    :return: The path of the compressed file.
+    """
+    compressed_path = file_path + COMPRESSED_EXTENSION
+    temp_path = compressed_path + '.tmp'
+    with open(file_path, 'rb') as source, gzip.open(temp_path, 'wb') as target:
+        shutil.copyfileobj(source, target)
+    os.replace(temp_path, compressed_path)
+    os.remove(file_path)
+    return compressed_path
+
+
+def count_records(file_path: str) -> int:
+    """
+    Count the records of a single lake file.
+    """
+    with open_lake_file(file_path) as f:
+        if detect_format(f) == JSON_FORMAT:
+            return len(json.load(f))
+        return sum(1 for line in f if line.strip())
+
+
+class RotationPolicy:
+    """
+    Decides when the lake file being written is closed and a new one is started.
+
+    A closed file is renamed to '<stem>[.<shard>].seg-<timestamp>.<ext>' and, if `compress` is set,
+    gzip compressed. Readers such as `read_log` read across every segment.
+
+    Args:
+        max_bytes (int): Rotate once the file reaches this size. 0 disables the limit.
+        max_records (int): Rotate before the file would exceed this number of records. 0 disables the limit.
+        daily (bool): Rotate when the file was last written on a previous day.
+        compress (bool): Gzip compress the closed segments.
+    """
+
+    def __init__(self, max_bytes: int = 0, max_records: int = 0, daily: bool = False, compress: bool = True):
+        self.max_bytes = max_bytes
+        self.max_records = max_records
+        self.daily = daily
+        self.compress = compress
+        # Record counts of the files being written, keyed by path and validated against their size
+        # and modification time, so the files are only recounted after another process wrote to them
+        self._record_counts = {}
+
+
+    def should_rotate(self, file_path: str, n_new_records: int = 1) -> bool:
+        try:
+            stat = os.stat(file_path)
+        except FileNotFoundError:
+            return False
+
+        if self.daily and date.fromtimestamp(stat.st_mtime) != date.today():
+            return True
+        if self.max_bytes and stat.st_size >= self.max_bytes:
+            return True
+        if self.max_records:
+            n_records = self._count_records(file_path, stat)
+            if n_records and n_records + n_new_records > self.max_records:
+                return True
+        return False
+
+
+    def rotate(self, file_path: str) -> str:
+        """
+        Close the file being written, turning it into a segment.
+
+        :return: The path of the new segment.
+        """
+        name, extension = os.path.splitext(file_path)
+        segment_path = f"{name}.{SEGMENT_PREFIX}{datetime.now().strftime('%Y%m%dT%H%M%S%f')}{extension}"
+        os.replace(file_path, segment_path)
+        self._record_counts.pop(file_path, None)
+        if self.compress:
+            segment_path = compress_file(segment_path)
+        return segment_path
+
+
+    def record_appended(self, file_path: str, n_new_records: int):
+        """
+        Update the cached record count of a file after records were appended to it.
+        """
+        if not self.max_records:
+            return
+        stat = os.stat(file_path)
+        cached = self._record_counts.get(file_path)
+        n_records = cached[2] if cached else 0
+        self._record_counts[file_path] = (stat.st_size, stat.st_mtime_ns, n_records + n_new_records)
+
+
+    def _count_records(self, file_path: str, stat) -> int:
+        cached = self._record_counts.get(file_path)
+        if cached and cached[:2] == (stat.st_size, stat.st_mtime_ns):
+            return cached[2]
+        n_records = count_records(file_path)
+        self._record_counts[file_path] = (stat.st_size, stat.st_mtime_ns, n_records)
+        return n_records
+
+
+@contextlib.contextmanager
+def file_lock(file_path: str):
+    """
+    Hold an exclusive advisory lock on a lake file, shared by every thread and process of the host.
+
+    The lock is taken on a '.lock' file next to the lake file, so the lake file itself can be replaced
+    while the lock is held.
+    """
+    with open(f"{file_path}.lock", 'a') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        else:
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def fsync_file(file_path: str):
+    """
+    Force the data written to a file to be flushed to disk.
+    """
+    fd = os.open(file_path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def load_json_array(file_path: str) -> list:
+    """
+    Load a lake file holding a single JSON array.
+
+    A file that cannot be decoded is moved aside to '<file>.corrupt-<timestamp>' instead of being
+    overwritten, so no record is lost, and an empty list is returned.
+    """
+    try:
+        with open(file_path, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return []
+    except json.JSONDecodeError as e:
+        corrupt_path = f"{file_path}.corrupt-{datetime.now().strftime('%Y%m%dT%H%M%S%f')}"
+        os.replace(file_path, corrupt_path)
+        warnings.warn(f"Could not decode {file_path} ({e}). The file was moved to {corrupt_path}.")
+        return []
+
+
+def write_json_array(file_path: str, log_entries: list, fsync: bool = False):
+    """
+    Atomically replace a lake file with a JSON array, so readers never see a partially written file.
+    """
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(file_path) or '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(log_entries, f, indent = 1, default = to_jsonable)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(temp_path, file_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def append_json_array(file_path: str, entries: list, fsync: bool = False):
+    """
+    Append entries to a lake file holding a single JSON array.
+
+    The whole file is read and rewritten, so the cost of each call grows with the size of the file.
+
+    :return: The locations of the entries, which are unknown in a JSON array: a (None, None) pair per entry.
+    """
+    log_entries = load_json_array(file_path)
+    log_entries.extend(decode_entry(entry) for entry in entries)
+    write_json_array(file_path, log_entries, fsync=fsync)
+    return [(None, None)] * len(entries)
+
+
+def append_json_lines(file_path: str, entries: list, fsync: bool = False):
+    """
+    Append entries to a JSON Lines lake file, one record per line.
+
+    The file is only ever opened in append mode, so the cost of each call does not depend on the size of the file.
+
+    :return: The (byte offset, byte length) of the line written for each entry.
+    """
+    lines = [encode_entry(entry) + b'\n' for entry in entries]
+
+    with open(file_path, 'ab') as f:
+        offset = f.tell()
+        f.write(b''.join(lines))
+        if fsync:
+            f.flush()
+            os.fsync(f.fileno())
+
+    locations = []
+    for line in lines:
+        locations.append((offset, len(line)))
+        offset += len(line)
+    return locations
+
+
+APPENDERS = {
+    JSON_FORMAT: append_json_array,
+    JSONL_FORMAT: append_json_lines,
+}
+
+
+def append_entries(file_path: str, entries: list, file_format: str = JSON_FORMAT, fsync: bool = False,
+                   rotation: RotationPolicy = None, index=None, blobs=None):
+    """
+    Append entries to a lake file using the given storage format.
+
+    The file is locked while the entries are appended, so several threads and processes can append
+    to the same file.
+
+    :param file_path: The path of the lake file.
+    :param entries: The log entries to append.
+    :param file_format: Either 'json' or 'jsonl'.
+    :param fsync: Whether to force the written data to disk before returning.
+    :param rotation: The rotation policy of the file, if any. It is applied before appending.
+    :param index: The LakeIndex to record the location of the entries in, if any.
+    :param blobs: The BlobStore to move the outputs of the entries to, if any.
+    """
+    os.makedirs(os.path.dirname(file_path) or '.', exist_ok=True)
+    if blobs is not None:
+        entries = [blobs.externalize(entry) for entry in entries]
+    with file_lock(file_path):
+        if rotation is not None and rotation.should_rotate(file_path, len(entries)):
+            segment_path = rotation.rotate(file_path)
+            if index is not None:
+                index.move(file_path, segment_path)
+        locations = APPENDERS[file_format](file_path, entries, fsync=fsync)
+        if rotation is not None:
+            rotation.record_appended(file_path, len(entries))
+        if index is not None:
+            index.add(entries, file_path, locations)
+
+
+def detect_format(f) -> str:
+    """
+    Detect the storage format of an open lake file by peeking at its first non-whitespace character.
+    The file position is restored afterwards.
+    """
+    position = f.tell()
+    first_char = ''
+    while True:
+        chunk = f.read(1024)
+        if not chunk:
+            break
+        stripped = chunk.lstrip()
+        if stripped:
+            first_char = stripped[0]
+            break
+    f.seek(position)
+    return JSON_FORMAT if first_char == '[' else JSONL_FORMAT
+
+
+def iter_json_lines(f):
+    """
+    Iterate over the records of an open JSON Lines lake file, one line at a time.
+
+    A trailing line that cannot be decoded (e.g. a write interrupted by a crash) is skipped.
+    """
+    pending_error = None
+    for line in f:
+        line = line.strip()
+        if not line:
+            continue
+        if pending_error is not None:
+            raise pending_error
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError as e:
+            pending_error = e
+
+
+def iter_json_array(f, chunk_size: int = 1 << 16):
+    """
+    Iterate over the elements of an open file holding a single JSON array without loading the whole file.
+
+    The file is read in chunks and the elements are decoded one at a time, so the memory used only
+    depends on the size of the largest element. A truncated array (e.g. a write interrupted by a crash)
+    stops the iteration with a warning after its last complete element.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    read_size = chunk_size
+    eof = False
+    started = False
+
+    def read_more():
+        nonlocal buffer, position, eof
+        chunk = f.read(read_size)
+        if not chunk:
+            eof = True
+            return False
+        buffer = buffer[position:] + chunk
+        position = 0
+        return True
+
+    while True:
+        # Skip the whitespace, the opening bracket and the commas between the elements
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n':
+                position += 1
+            if position == len(buffer):
+                if read_more():
+                    continue
+                if started:
+                    warnings.warn(f"Truncated JSON array in {getattr(f, 'name', 'lake file')}.")
+                return
+            char = buffer[position]
+            if not started:
+                if char != '[':
+                    raise ValueError("The file does not hold a JSON array")
+                started = True
+                position += 1
+            elif char == ',':
+                position += 1
+            elif char == ']':
+                return
+            else:
+                break
+
+        try:
+            element, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            end = None
+        # An element is only complete once the comma or bracket after it is read. Otherwise it may be cut
+        # in the middle, e.g. '12.' decodes as 12 while the chunk boundary fell inside '12.5'
+        following = end
+        while following is not None and following < len(buffer) and buffer[following] in ' \t\r\n':
+            following += 1
+        complete = following is not None and following < len(buffer) and buffer[following] in ',]'
+        if not complete and not eof:
+            # Grow the reads while the element does not fit, so that huge elements are not decoded over and over
+            read_size *= 2
+            if read_more():
+                continue
+        if end is None:
+            # The rest of the file is not JSON, e.g. an element cut by a crash or trailing garbage
+            warnings.warn(f"Truncated JSON array in {getattr(f, 'name', 'lake file')}.")
+            return
+
+        read_size = chunk_size
+        position = end
+        yield element
+        if position > chunk_size:
+            buffer = buffer[position:]
+            position = 0
+
+
+def iter_file_entries(file_path: str):
+    """
+    Iterate over the records of a single lake file, whatever its storage format and compression.
+    """
+    with open_lake_file(file_path) as f:
+        if detect_format(f) == JSON_FORMAT:
+            yield from iter_json_array(f)
+        else:
+            yield from iter_json_lines(f)
+
+
+def read_file_entries(file_path: str) -> list:
+    """
+    Read all the records of a single lake file, whatever its storage format and compression.
+    """
+    with open_lake_file(file_path) as f:
+        if detect_format(f) == JSON_FORMAT:
+            return json.load(f)
+        return list(iter_json_lines(f))
+
+
+def resolve_lake_files(file_path: str) -> list:
+    """
+    List the files to read for a lake file path: the file with its shards and segments, or only the
+    given file if it is the path of a single shard or segment.
+
+    :raises FileNotFoundError: If no file holds records of the lake file.
+    """
+    parsed = parse_lake_file_name(os.path.basename(file_path))
+    if parsed is not None and (parsed.shard is not None or parsed.segment is not None or parsed.compressed):
+        paths = [file_path] if os.path.exists(file_path) else []
+    else:
+        paths = lake_files(file_path)
+
+    if not paths:
+        raise FileNotFoundError(f"No such lake file: '{file_path}'")
+    return paths
+
+
+def read_entries(file_path: str) -> list:
+    """
+    Read all the records of a lake file, of its shards and of their closed segments, whatever their
+    storage format and compression.
+
+    :param file_path: The path of the lake file. The path of a single shard or segment only reads that file.
+    :return: The list of records.
+    """
+    paths = resolve_lake_files(file_path)
+
+    entries = []
+    for path in paths:
+        entries.extend(read_file_entries(path))
+    return entries
+
+
+def merge_shards(file_path: str, file_format: str = None, rotation: RotationPolicy = None, index=None) -> int:
+    """
+    Move the records of every shard of a lake file into the lake file itself and remove the shards.
+
+    Each shard is locked while it is merged, so workers can keep writing to their shards meanwhile.
+
+    :param file_path: The path of the lake file, e.g. '<LAKES_BASE_DIR>/GithubAPI_get_repo_issues.jsonl'.
+    :param file_format: The format of the lake file. Defaults to the one matching its extension.
+    :param rotation: The rotation policy applied to the lake file while the records are appended.
+    :param index: The LakeIndex to update with the new location of the records, if any.
+    :return: The number of merged records.
+    """
+    if file_format is None:
+        file_format = JSON_FORMAT if file_path.endswith(FILE_EXTENSIONS[JSON_FORMAT]) else JSONL_FORMAT
+
+    merged = 0
+    for path in shard_paths(file_path):
+        # Closed segments are not written to anymore, only the active shard files need to be locked
+        is_segment = parse_lake_file_name(os.path.basename(path)).segment is not None
+        with contextlib.nullcontext() if is_segment else file_lock(path):
+            if not os.path.exists(path):
+                continue
+            entries = read_file_entries(path)
+            append_entries(file_path, entries, file_format, fsync=True, rotation=rotation, index=index)
+            os.remove(path)
+        merged += len(entries)
+    return merged
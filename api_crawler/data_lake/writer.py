@@ -0,0 +1,153 @@
+import atexit
+import queue
+import threading
+import time
+import warnings
+from collections import defaultdict
+from .storage import append_entries, fsync_file, RotationPolicy
+
+
+FSYNC_POLICIES = ['never', 'batch', 'close']
+
+
+class _FlushRequest:
+    """Marker put on the queue to ask the writer thread to write everything received before it."""
+    def __init__(self):
+        self.done = threading.Event()
+
+
+_STOP = object()
+
+
+class LakeWriter:
+    """
+    Background writer that takes lake records off the caller's thread.
+
+    Records are put on a bounded queue and a daemon thread drains it, writing the records in batches
+    grouped by lake file. When the queue is full, `submit` blocks until the writer catches up, so a
+    slow disk throttles the crawl instead of exhausting the memory.
+
+    Args:
+        flush_interval (float): Maximum number of seconds a record waits in memory before being written.
+        batch_size (int): Maximum number of records written in a single batch.
+        max_queue_size (int): Maximum number of records waiting to be written.
+        fsync (str): When to force the written data to disk. 'never' leaves it to the OS, 'batch' syncs
+            the files touched by every batch and 'close' only syncs on `flush` and `close`.
+    """
+
+    def __init__(self, flush_interval: float = 1.0, batch_size: int = 500, max_queue_size: int = 10000,
+                 fsync: str = 'never'):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Invalid fsync policy {fsync}. Choose from {FSYNC_POLICIES}.")
+        if batch_size < 1:
+            raise ValueError("batch_size must be a positive integer")
+
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.fsync = fsync
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.written = 0
+        self.errors = 0
+        self._closed = False
+        self._unsynced = set()
+        self._thread = threading.Thread(target=self._run, name='LakeWriter', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+
+    def submit(self, file_path: str, entry: dict, file_format: str, rotation: RotationPolicy = None, index=None,
+               blobs=None):
+        """
+        Queue a record to be appended to a lake file. Blocks while the queue is full.
+
+        The rotation policy, the index and the blob store are applied when the record is written,
+        see `append_entries`.
+        """
+        if self._closed:
+            raise RuntimeError("Cannot submit records to a closed LakeWriter")
+        self.queue.put((file_path, file_format, rotation, index, blobs, entry))
+
+
+    def flush(self, timeout: float = None) -> bool:
+        """
+        Wait until every record submitted so far has been written.
+
+        Returns:
+            bool: False if the timeout expired before the records were written.
+        """
+        if not self._thread.is_alive():
+            return self.queue.empty()
+        request = _FlushRequest()
+        self.queue.put(request)
+        return request.done.wait(timeout)
+
+
+    def close(self, timeout: float = None):
+        """
+        Write the pending records and stop the writer thread. Called automatically at interpreter exit.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        atexit.unregister(self.close)
+        if self._thread.is_alive():
+            self.queue.put(_STOP)
+            self._thread.join(timeout)
+
+
+    def _run(self):
+        pending = []
+        deadline = None
+
+        while True:
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is None or item is _STOP or isinstance(item, _FlushRequest):
+                self._write(pending, fsync=self.fsync == 'batch')
+                pending = []
+                deadline = None
+                if item is not None and self.fsync == 'close':
+                    self._sync_written_files()
+                if isinstance(item, _FlushRequest):
+                    item.done.set()
+                elif item is _STOP:
+                    return
+                continue
+
+            pending.append(item)
+            if deadline is None:
+                deadline = time.monotonic() + self.flush_interval
+            if len(pending) >= self.batch_size:
+                self._write(pending, fsync=self.fsync == 'batch')
+                pending = []
+                deadline = None
+
+
+    def _write(self, items: list, fsync: bool = False):
+        batches = defaultdict(list)
+        for file_path, file_format, *options, entry in items:
+            batches[(file_path, file_format, *options)].append(entry)
+
+        for (file_path, file_format, rotation, index, blobs), entries in batches.items():
+            try:
+                append_entries(file_path, entries, file_format, fsync=fsync, rotation=rotation, index=index,
+                               blobs=blobs)
+                self.written += len(entries)
+                if self.fsync == 'close':
+                    self._unsynced.add(file_path)
+            except Exception as e:
+                self.errors += len(entries)
+                warnings.warn(f"LakeWriter could not write {len(entries)} records to {file_path}: {e}")
+
+
+    def _sync_written_files(self):
+        for file_path in self._unsynced:
+            try:
+                fsync_file(file_path)
+            except OSError as e:
+                warnings.warn(f"LakeWriter could not sync {file_path}: {e}")
+        self._unsynced.clear()
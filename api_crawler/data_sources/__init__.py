@@ -1,13 +1,56 @@
-from ._base import BaseAPI, BaseRestfulAPI, BaseSearchAPI, BaseSeleniumAPI
-from .apify import ApifyAPI
-from .brave import BraveSearchAPI
-from .github import GithubAPI
-from .glassdoor import Glassdoor
-from .reddit import RedditAPI
-from .serp_api import GoogleTrends, GoogleJobs, TrendingNow
-from .youtube import YoutubeAPI
-from .linked_in import LinkedInAPI
-from .indeed import IndeedAPI
-from .salary import SalaryAPI
-from .news import GoogleNewsAPI
+import importlib
 
+
+# Module defining each class. The modules are imported on first access (PEP 562), so that importing the
+# package does not load the third-party clients (selenium, praw, apify_client, ...) of the unused sources
+_SOURCES = {
+    "BaseAPI": "._base",
+    "BaseRestfulAPI": "._base",
+    "BaseSearchAPI": "._base",
+    "BaseSeleniumAPI": "._base",
+    "AsyncBaseRestfulAPI": "._base",
+    "RateLimiter": "._rate_limit",
+    "get_rate_limiter": "._rate_limit",
+    "set_rate_limiter": "._rate_limit",
+    "RetryPolicy": "._retry",
+    "get_retry_policy": "._retry",
+    "set_retry_policy": "._retry",
+    "get_retry_metrics": "._retry",
+    "HttpCache": "._http_cache",
+    "get_http_cache": "._http_cache",
+    "set_http_cache": "._http_cache",
+    "SyncState": "._sync_state",
+    "get_sync_state": "._sync_state",
+    "set_sync_state": "._sync_state",
+    "ApifyAPI": ".apify",
+    "BraveSearchAPI": ".brave",
+    "GithubAPI": ".github",
+    "AsyncGithubAPI": ".github",
+    "Glassdoor": ".glassdoor",
+    "RedditAPI": ".reddit",
+    "GoogleTrends": ".serp_api",
+    "GoogleJobs": ".serp_api",
+    "TrendingNow": ".serp_api",
+    "YoutubeAPI": ".youtube",
+    "AsyncYoutubeAPI": ".youtube",
+    "LinkedInAPI": ".linked_in",
+    "AsyncLinkedInAPI": ".linked_in",
+    "IndeedAPI": ".indeed",
+    "SalaryAPI": ".salary",
+    "GoogleNewsAPI": ".news",
+}
+
+__all__ = list(_SOURCES)
+
+
+def __getattr__(name):
+    if name not in _SOURCES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_SOURCES[name], __name__), name)
+    # Cache the class so later accesses do not go through __getattr__
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_SOURCES))
@@ -1,17 +1,63 @@
 import requests
+from requests.adapters import HTTPAdapter
 from abc import ABC, abstractmethod
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options
-from selenium.common.exceptions import NoSuchElementException
-from webdriver_manager.chrome import ChromeDriverManager
-from bs4 import BeautifulSoup
-from selenium.webdriver.common.by import By
+from decouple import config
+from typing import Union
 from ..exceptions import NoAPIKeyException
+from ._rate_limit import get_rate_limiter
+from ._retry import RetryPolicy, get_retry_policy
+from ._http_cache import HttpCache, HTTP_CACHE, get_http_cache, requests_response, httpx_response
+from urllib.parse import urlsplit
 import os
+import threading
 import warnings
 
 
+# Connection pool shared by the RESTful sources: number of hosts it keeps connections to, number of
+# connections kept alive per host, and whether requests wait for a free connection when they are all in use
+HTTP_POOL_CONNECTIONS = config("HTTP_POOL_CONNECTIONS", default=32, cast=int)
+HTTP_POOL_MAXSIZE = config("HTTP_POOL_MAXSIZE", default=16, cast=int)
+HTTP_POOL_BLOCK = config("HTTP_POOL_BLOCK", default=False, cast=bool)
+# Default timeouts of the requests, in seconds
+HTTP_CONNECT_TIMEOUT = config("HTTP_CONNECT_TIMEOUT", default=10, cast=float)
+HTTP_READ_TIMEOUT = config("HTTP_READ_TIMEOUT", default=60, cast=float)
+
+_shared_adapter = None
+_shared_adapter_lock = threading.Lock()
+
+
+def get_shared_adapter() -> HTTPAdapter:
+    """
+    Get the HTTP adapter shared by the sessions of the RESTful sources of the process.
+
+    The adapter holds a pool of keep-alive connections per host, so the sources reuse the connections,
+    and their TLS sessions, opened by the other instances and threads. A new adapter is created in forked
+    processes, since connections cannot be shared between processes.
+
+    Returns:
+        HTTPAdapter: The shared adapter, configured with the HTTP_POOL_* configuration variables.
+    """
+    global _shared_adapter
+    with _shared_adapter_lock:
+        if _shared_adapter is None or _shared_adapter[0] != os.getpid():
+            adapter = HTTPAdapter(pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE,
+                                  pool_block=HTTP_POOL_BLOCK)
+            _shared_adapter = (os.getpid(), adapter)
+        return _shared_adapter[1]
+
+
+def reset_shared_adapter():
+    """
+    Close the connections of the shared adapter. The next sessions get a new adapter, e.g. after the
+    HTTP_POOL_* configuration variables were changed.
+    """
+    global _shared_adapter
+    with _shared_adapter_lock:
+        if _shared_adapter is not None and _shared_adapter[0] == os.getpid():
+            _shared_adapter[1].close()
+        _shared_adapter = None
+
+
 
 class BaseAPI(ABC):
     """
@@ -84,11 +130,38 @@ class BaseRestfulAPI(BaseAPI):
     This class provides basic methods for making GET and POST requests
     using the `requests` library. Subclasses should define the `base_url`
     attribute to specify the base URL for the API.
+
+    The sessions of every instance share a per-host pool of keep-alive connections (see
+    `get_shared_adapter`), and the requests get default connect and read timeouts.
+
+    The requests go through the shared rate limiter (see `get_rate_limiter`), which holds them according
+    to the `rate_limit` the subclasses declare, as (requests, seconds), and to the rate-limit headers of
+    the responses. The requests failing with a transient error are retried according to the
+    `retry_policy` of the instance, or to the shared one (see `get_retry_policy`). When the instance
+    has an `http_cache`, its GET requests are answered from the cache for the `cache_ttl` the subclasses
+    declare, in seconds, and then made conditional on the cached responses (see `HttpCache`). With
+    HTTP_CACHE, every instance uses the shared cache (see `get_http_cache`).
+
+    Args:
+        timeout (float or tuple): The default timeout of the requests, in seconds, or a (connect, read)
+            tuple. Defaults to (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT).
+        share_connections (bool): Use the connection pool shared by the instances, or a pool of its own.
     """
     base_url: str
+    rate_limit: tuple = None
+    retry_policy: RetryPolicy = None
+    http_cache: HttpCache = None
+    cache_ttl: float = None
 
-    def __init__(self):
+    def __init__(self, timeout: Union[float, tuple] = None, share_connections: bool = True):
         self.session = requests.Session()
+        if share_connections:
+            adapter = get_shared_adapter()
+            self.session.mount('https://', adapter)
+            self.session.mount('http://', adapter)
+        self.timeout = timeout if timeout is not None else (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+        if HTTP_CACHE:
+            self.http_cache = get_http_cache()
 
 
 
@@ -97,16 +170,16 @@ class BaseRestfulAPI(BaseAPI):
         Make a GET request to the specified endpoint.
 
         Args:
-            endpoint (str): The API endpoint to send the GET request to.
+            endpoint (str): The API endpoint to send the GET request to, or an absolute URL, e.g. a pagination link.
             **kwargs: Additional arguments to pass to the `requests.Session.get` method.
 
         Returns:
             response: The response object from the GET request.
         """
-        url = f"{self.base_url}{endpoint}"
-
+        url = endpoint if endpoint.startswith(('http://', 'https://')) else f"{self.base_url}{endpoint}"
+        kwargs.setdefault('timeout', self.timeout)
 
-        response = self.session.get(url, **kwargs)
+        response = self._request('GET', url, **kwargs)
         return response
 
 
@@ -124,18 +197,170 @@ class BaseRestfulAPI(BaseAPI):
             response: The response object from the POST request.
         """
         url = f"{self.base_url}{endpoint}"
-        response = self.session.post(url, **kwargs)
+        kwargs.setdefault('timeout', self.timeout)
+        response = self._request('POST', url, **kwargs)
+        return response
+
+
+    def _request(self, method: str, url: str, **kwargs):
+        host = urlsplit(url).netloc
+        rate_limiter = get_rate_limiter()
+
+        def send():
+            # Wait for the rate limiter, then let it adjust to the rate-limit headers of the response
+            rate_limiter.acquire(host, self.rate_limit, url)
+            response = self.session.request(method, url, **kwargs)
+            rate_limiter.update(host, response.headers, url)
+            return response
+
+        retry_policy = self.retry_policy or get_retry_policy()
+        if self.http_cache is None or method != 'GET':
+            return retry_policy.call(send, method, host)
+        return self.http_cache.fetch(url, kwargs, lambda: retry_policy.call(send, method, host), requests_response,
+                                     self.cache_ttl)
+
+
+
+class AsyncBaseRestfulAPI(BaseAPI):
+    """
+    Abstract base class for the asyncio variants of the RESTful API classes.
+
+    The awaitable `get` and `post` methods send the requests with an `httpx.AsyncClient`, so a single
+    thread can fan out to hundreds of concurrent requests, e.g. with `asyncio.gather`. The client keeps
+    a pool of keep-alive connections per host, and the requests wait for a free connection once
+    `max_connections` are open. The requests go through the shared rate limiter and retry policy like the
+    ones of `BaseRestfulAPI`, waiting without blocking the event loop. Requires httpx (`pip install api_crawler[async]`).
+
+    The instances are async context managers, closing the client on exit:
+
+        async with AsyncGithubAPI() as github:
+            issues = await github.get_all_repo_issues('jxnl/instructor')
+
+    Args:
+        timeout (float or tuple): The default timeout of the requests, in seconds, or a (connect, read)
+            tuple. Defaults to (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT).
+        max_connections (int): Maximum number of connections open at once, across all hosts.
+    """
+    base_url: str
+    rate_limit: tuple = None
+    retry_policy: RetryPolicy = None
+    http_cache: HttpCache = None
+    cache_ttl: float = None
+
+    def __init__(self, timeout: Union[float, tuple] = None, max_connections: int = 100):
+        # httpx is imported here rather than at the top of the module, so that the synchronous sources do
+        # not require it
+        import httpx
+
+        self.timeout = timeout if timeout is not None else (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+        limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=HTTP_POOL_MAXSIZE)
+        self.client = httpx.AsyncClient(timeout=self._httpx_timeout(self.timeout), limits=limits)
+        if HTTP_CACHE:
+            self.http_cache = get_http_cache()
+
+
+    @staticmethod
+    def _httpx_timeout(timeout: Union[float, tuple]):
+        """
+        Convert a timeout given as for `requests`, in seconds or as a (connect, read) tuple, to an `httpx.Timeout`.
+        """
+        import httpx
+
+        if isinstance(timeout, tuple):
+            connect, read = timeout
+            return httpx.Timeout(read, connect=connect)
+        return httpx.Timeout(timeout)
+
+
+
+    async def get(self, endpoint: str = '', **kwargs):
+        """
+        Make a GET request to the specified endpoint.
+
+        Args:
+            endpoint (str): The API endpoint to send the GET request to, or an absolute URL, e.g. a pagination link.
+            **kwargs: Additional arguments to pass to the `httpx.AsyncClient.get` method.
+
+        Returns:
+            httpx.Response: The response object from the GET request.
+        """
+        url = endpoint if endpoint.startswith(('http://', 'https://')) else f"{self.base_url}{endpoint}"
+        if 'timeout' in kwargs:
+            kwargs['timeout'] = self._httpx_timeout(kwargs['timeout'])
+
+        response = await self._request('GET', url, **kwargs)
+        return response
+
+
+
+
+    async def post(self, endpoint: str = '', **kwargs):
+        """
+        Make a POST request to the specified endpoint.
+
+        Args:
+            endpoint (str): The API endpoint to send the POST request to.
+            **kwargs: Additional arguments to pass to the `httpx.AsyncClient.post` method.
+
+        Returns:
+            httpx.Response: The response object from the POST request.
+        """
+        url = f"{self.base_url}{endpoint}"
+        if 'timeout' in kwargs:
+            kwargs['timeout'] = self._httpx_timeout(kwargs['timeout'])
+        response = await self._request('POST', url, **kwargs)
         return response
 
 
+    async def _request(self, method: str, url: str, **kwargs):
+        host = urlsplit(url).netloc
+        rate_limiter = get_rate_limiter()
+
+        async def send():
+            await rate_limiter.acquire_async(host, self.rate_limit, url)
+            response = await self.client.request(method, url, **kwargs)
+            rate_limiter.update(host, response.headers, url)
+            return response
+
+        retry_policy = self.retry_policy or get_retry_policy()
+        if self.http_cache is None or method != 'GET':
+            return await retry_policy.call_async(send, method, host)
+        return await self.http_cache.fetch_async(url, kwargs, lambda: retry_policy.call_async(send, method, host),
+                                                 httpx_response, self.cache_ttl)
+
+
+    async def aclose(self):
+        """
+        Close the connections of the client.
+        """
+        await self.client.aclose()
+
+
+    async def __aenter__(self):
+        return self
+
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+
 
 class BaseSeleniumAPI(BaseAPI):
     """
     Abstract base class for Selenium API classes.
+
+    Pages should be loaded with `navigate`, which retries the navigations failing with a WebDriver error,
+    e.g. a page load timeout, according to the `retry_policy` of the instance or to the shared one.
     """
     base_url: str
+    retry_policy: RetryPolicy = None
     
     def __init__(self):
+        # Selenium is imported here rather than at the top of the module, so that importing the RESTful
+        # sources does not load it
+        from selenium import webdriver
+        from selenium.webdriver.chrome.options import Options
+
         self.options = Options()
         
         #if headless:
@@ -147,7 +372,21 @@ class BaseSeleniumAPI(BaseAPI):
         self.driver = webdriver.Chrome(options = self.options)
 
 
+    def navigate(self, url: str):
+        """
+        Load a page in the browser, retrying on WebDriver errors.
+
+        Args:
+            url (str): The URL of the page.
+        """
+        from selenium.common.exceptions import WebDriverException
+
+        (self.retry_policy or get_retry_policy()).call(lambda: self.driver.get(url), host=urlsplit(url).netloc,
+                                                       exceptions=(WebDriverException,))
+
+
     def scroll_to(self, path:str, type:str = 'xpath'):
+        from selenium.webdriver.common.by import By
 
         if type not in ['css', 'class', 'xpath']:
             raise ValueError("Invalid type specified. Type must be 'css', 'class', or 'xpath'.")
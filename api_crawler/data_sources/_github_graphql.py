@@ -0,0 +1,152 @@
+import re
+
+
+# Default selection of the issues and pull requests, and of their comments. The `id` and `number` of
+# the items are always selected, to follow the comments and to key the results.
+ISSUE_FIELDS = (
+    'databaseId', 'title', 'body', 'state', 'url', 'createdAt', 'updatedAt', 'closedAt', 'authorAssociation',
+    'author { login }',
+    'labels(first: 100) { nodes { id name color description } }',
+    'reactionGroups { content reactors { totalCount } }',
+)
+PULL_FIELDS = ISSUE_FIELDS + ('mergedAt', 'isDraft', 'headRefName', 'baseRefName')
+COMMENT_FIELDS = (
+    'id', 'databaseId', 'body', 'url', 'createdAt', 'updatedAt', 'authorAssociation',
+    'author { login }',
+    'reactionGroups { content reactors { totalCount } }',
+)
+
+# The GraphQL connection and state enum of each resource
+_CONNECTIONS = {'issues': ('issues', 'IssueState'), 'pulls': ('pullRequests', 'PullRequestState')}
+_STATES = {
+    'issues': {'open': ['OPEN'], 'closed': ['CLOSED'], 'all': None},
+    'pulls': {'open': ['OPEN'], 'closed': ['CLOSED', 'MERGED'], 'all': None},
+}
+_SORT_FIELDS = {'created': 'CREATED_AT', 'updated': 'UPDATED_AT', 'comments': 'COMMENTS'}
+_REACTIONS = {'THUMBS_UP': '+1', 'THUMBS_DOWN': '-1', 'LAUGH': 'laugh', 'HOORAY': 'hooray',
+              'CONFUSED': 'confused', 'HEART': 'heart', 'ROCKET': 'rocket', 'EYES': 'eyes'}
+# GraphQL fields whose REST name is not their snake_case name
+_REST_NAMES = {'id': 'node_id', 'databaseId': 'id', 'url': 'html_url', 'author': 'user', 'isDraft': 'draft'}
+
+
+def _comments_connection(page_size: int, after: bool = False) -> str:
+    arguments = f'first: {page_size}' + (', after: $after' if after else '')
+    return (f'comments({arguments}) {{ totalCount pageInfo {{ hasNextPage endCursor }} '
+            f'nodes {{ {" ".join(COMMENT_FIELDS)} }} }}')
+
+
+def build_query(resource: str, fields: tuple = None, comments: bool = False, comments_page_size: int = 100) -> str:
+    """
+    Build the query of a page of the issues or pull requests of a repository.
+
+    Args:
+        resource (str): 'issues' or 'pulls'.
+        fields (tuple): The GraphQL fields to select on every item. Defaults to ISSUE_FIELDS or PULL_FIELDS.
+        comments (bool): Whether to select the first page of the comments of every item, rather than their count.
+        comments_page_size (int): The number of comments selected per item.
+    """
+    connection, state_type = _CONNECTIONS[resource]
+    if fields is None:
+        fields = PULL_FIELDS if resource == 'pulls' else ISSUE_FIELDS
+    selection = ['id', 'number', *(field for field in fields if field not in ('id', 'number'))]
+    selection.append(_comments_connection(comments_page_size) if comments else 'comments { totalCount }')
+    filters = ', filterBy: $filterBy' if resource == 'issues' else ''
+    filter_variable = ', $filterBy: IssueFilters' if resource == 'issues' else ''
+    return f'''query($owner: String!, $name: String!, $first: Int!, $after: String, $states: [{state_type}!], $orderBy: IssueOrder{filter_variable}) {{
+  repository(owner: $owner, name: $name) {{
+    {connection}(first: $first, after: $after, states: $states, orderBy: $orderBy{filters}) {{
+      pageInfo {{ hasNextPage endCursor }}
+      nodes {{ {' '.join(selection)} }}
+    }}
+  }}
+}}'''
+
+
+def build_comments_query(comments_page_size: int = 100) -> str:
+    """
+    Build the query of the next page of the comments of an issue or pull request, given its node id.
+    """
+    comments = _comments_connection(comments_page_size, after=True)
+    return f'''query($id: ID!, $after: String) {{
+  node(id: $id) {{
+    ... on Issue {{ {comments} }}
+    ... on PullRequest {{ {comments} }}
+  }}
+}}'''
+
+
+def query_variables(repo_name: str, resource: str, params: dict = None) -> dict:
+    """
+    Translate the parameters of a REST listing into the variables of `build_query`.
+
+    The supported parameters are `state`, `sort`, `direction` and `per_page`, and `since` and `labels`
+    for the issues.
+
+    Raises:
+        ValueError: If a parameter has no GraphQL equivalent.
+    """
+    params = dict(params or {})
+    owner, _, name = repo_name.partition('/')
+    state = params.pop('state', 'open')
+    if state not in _STATES[resource]:
+        raise ValueError(f"Unsupported state {state!r}. Expected one of {list(_STATES[resource])}.")
+    sort = params.pop('sort', 'created')
+    if sort not in _SORT_FIELDS:
+        raise ValueError(f"Unsupported sort {sort!r}. Expected one of {list(_SORT_FIELDS)}.")
+    variables = {
+        'owner': owner,
+        'name': name,
+        'first': min(int(params.pop('per_page', 100)), 100),
+        'after': None,
+        'states': _STATES[resource][state],
+        'orderBy': {'field': _SORT_FIELDS[sort], 'direction': params.pop('direction', 'desc').upper()},
+    }
+    if resource == 'issues':
+        filter_by = {}
+        if 'since' in params:
+            filter_by['since'] = params.pop('since')
+        if 'labels' in params:
+            filter_by['labels'] = [label.strip() for label in params.pop('labels').split(',')]
+        variables['filterBy'] = filter_by or None
+    if params:
+        raise ValueError(f"Parameters {sorted(params)} are not supported by the GraphQL backend.")
+    return variables
+
+
+def _snake_case(name: str) -> str:
+    return re.sub(r'(?<!^)(?=[A-Z])', '_', name).lower()
+
+
+def _reactions(groups: list) -> dict:
+    reactions = dict.fromkeys(_REACTIONS.values(), 0)
+    for group in groups:
+        if group['content'] in _REACTIONS:
+            reactions[_REACTIONS[group['content']]] = group['reactors']['totalCount']
+    return {'total_count': sum(reactions.values()), **reactions}
+
+
+def normalize_node(node: dict) -> dict:
+    """
+    Convert an issue, pull request or comment node into the dict shape of the REST API, e.g. `databaseId`
+    becomes `id`, `url` becomes `html_url`, `author` becomes `user`, the labels become a list and the
+    reaction groups the `reactions` counts. The comments connection becomes the `comments` count, and the
+    `comments_thread` when the comments were selected. The other fields are renamed to snake_case.
+    """
+    item = {}
+    for field, value in node.items():
+        if field == 'labels':
+            item['labels'] = [normalize_node(label) for label in value['nodes']]
+        elif field == 'reactionGroups':
+            item['reactions'] = _reactions(value)
+        elif field == 'comments':
+            item['comments'] = value['totalCount']
+            if 'nodes' in value:
+                item['comments_thread'] = [normalize_node(comment) for comment in value['nodes']]
+        elif field == 'state':
+            # Merged pull requests are closed ones in the REST API
+            item['state'] = 'open' if value == 'OPEN' else 'closed'
+        elif field in ('headRefName', 'baseRefName'):
+            item[field[:4]] = {'ref': value}
+        else:
+            item[_REST_NAMES.get(field, _snake_case(field))] = value
+    return item
@@ -0,0 +1,511 @@
+import asyncio
+import contextlib
+import gzip
+import hashlib
+import os
+import pickle
+import threading
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode, urlsplit
+from decouple import config
+from ..exceptions import OfflineCacheMissException
+
+
+# Directory of the HTTP cache, shared by the processes using it and kept across runs. Without it, the responses
+# are cached in the memory of the process only, and are lost when it exits
+HTTP_CACHE_DIR = config("HTTP_CACHE_DIR", default=None)
+# Maximum size of the bodies cached in memory, when there is no cache directory
+HTTP_CACHE_MEMORY_BYTES = config("HTTP_CACHE_MEMORY_BYTES", default=64 * 1024 ** 2, cast=int)
+# Whether every RESTful source caches its GET responses, not only GithubAPI
+HTTP_CACHE = config("HTTP_CACHE", default=False, cast=bool)
+# Number of seconds the responses are served from the cache without any request. With 0, they are only revalidated
+HTTP_CACHE_TTL = config("HTTP_CACHE_TTL", default=0, cast=float)
+# TTLs per host or URL prefix, e.g. 'salary.com=86400,www.googleapis.com/youtube/v3/commentThreads=3600'
+HTTP_CACHE_TTLS = config("HTTP_CACHE_TTLS", default='')
+# Number of seconds an expired response is still served while it is refreshed in the background
+HTTP_CACHE_STALE_WHILE_REVALIDATE = config("HTTP_CACHE_STALE_WHILE_REVALIDATE", default=0, cast=float)
+# Maximum size of the cache directory, the least recently used responses are evicted beyond it
+HTTP_CACHE_MAX_BYTES = config("HTTP_CACHE_MAX_BYTES", default=1024 ** 3, cast=int)
+# Serve the cached response when the server cannot be reached or fails, rather than raising the error
+HTTP_CACHE_STALE_IF_ERROR = config("HTTP_CACHE_STALE_IF_ERROR", default=False, cast=bool)
+# Serve every request from the cache, whatever the age of the responses, and never go to the network
+HTTP_CACHE_OFFLINE = config("HTTP_CACHE_OFFLINE", default=False, cast=bool)
+# Whether GithubAPI sends conditional requests, revalidating the responses it cached
+GITHUB_CONDITIONAL_REQUESTS = config("GITHUB_CONDITIONAL_REQUESTS", default=True, cast=bool)
+
+# The response headers kept with the cached bodies, so the replayed responses can be decoded and paginated
+_STORED_HEADERS = ['content-type', 'content-encoding', 'etag', 'last-modified', 'link']
+_ENTRY_SUFFIX = '.pkl.gz'
+
+
+def parse_cache_ttls(value: str) -> dict:
+    """
+    Parse TTLs given as 'prefix=seconds,...', where the prefix is a host or a URL without its scheme.
+
+    Returns:
+        dict: The TTL of each prefix.
+    """
+    ttls = {}
+    for item in filter(None, (item.strip() for item in value.split(','))):
+        prefix, _, seconds = item.partition('=')
+        try:
+            ttls[prefix.strip()] = float(seconds)
+        except ValueError:
+            raise ValueError(f"Invalid cache TTL {item!r}. Expected 'prefix=seconds'.")
+    return ttls
+
+
+class HttpCache:
+    """
+    Cache of HTTP responses, keyed on the method, URL, query parameters and selected request headers.
+
+    The successful GET responses are stored with their body, for the TTL of their URL: the longest
+    prefix of the URL (without its scheme) found in `ttls`, or else the TTL declared by the source, or
+    `default_ttl`. During the TTL, the requests are answered from the cache without going to the network.
+    Then, for `stale_while_revalidate` seconds, the cached response is still served while a background
+    request refreshes it.
+
+    The responses carrying a validator (an `ETag` or `Last-Modified` header) are stored even without a
+    TTL. The next request for the same resource is sent with the `If-None-Match` and `If-Modified-Since`
+    headers, and when the server answers `304 Not Modified` the stored body is served instead. GitHub
+    does not count these requests against the rate limit, and they transfer no body. With
+    `stale_if_error`, the cached response is served as well when the server cannot be reached or fails.
+
+    The entries are stored gzip compressed in `directory`, shared by the processes and kept across
+    restarts, or, when no directory is given, in the memory of the process only, so they are lost when it
+    exits. Beyond `max_bytes` on disk, or `max_entries` and `max_memory_bytes` in memory, the least
+    recently used entries are evicted. In `offline` mode, every request is answered from the cache, whatever the age
+    of the response, so crawls can be replayed without network access.
+
+    Args:
+        directory (str): The directory of the cached responses, or None to only cache in memory.
+        vary_headers (tuple): The request headers that are part of the key, since the response depends on them.
+        max_entries (int): Maximum number of responses kept in memory, when there is no directory.
+        max_memory_bytes (int): Maximum size of the bodies kept in memory, when there is no directory.
+        default_ttl (float): The TTL of the URLs without one, in seconds.
+        ttls (dict): TTLs per host or URL prefix, e.g. {'salary.com': 86400}. With a TTL of 0, the responses are
+            only revalidated, and with None, they are served from the cache forever.
+        stale_while_revalidate (float): Number of seconds an expired response is served while it is refreshed.
+        max_bytes (int): Maximum size of the cache directory.
+        offline (bool): Answer every request from the cache, raising `OfflineCacheMissException` on a miss.
+        stale_if_error (bool): Answer with the cached response, whatever its age, when the request raises or
+            the server answers with a 5xx status. Off by default, so outages are not mistaken for fresh data.
+    """
+
+    def __init__(self, directory: str = None, vary_headers: tuple = ('Accept', 'Authorization'),
+                 max_entries: int = 1024, default_ttl: float = 0, ttls: dict = None,
+                 stale_while_revalidate: float = 0, max_bytes: int = 1024 ** 3, offline: bool = False,
+                 max_memory_bytes: int = 64 * 1024 ** 2, stale_if_error: bool = False):
+        self.directory = directory
+        self.vary_headers = vary_headers
+        self.max_entries = max_entries
+        self.max_memory_bytes = max_memory_bytes
+        self.default_ttl = default_ttl
+        self.ttls = dict(ttls or {})
+        self.stale_while_revalidate = stale_while_revalidate
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self.stale_if_error = stale_if_error
+        self.counters = Counter()
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self._disk_bytes = None
+        self._revalidating = set()
+        self._tasks = set()
+
+
+    def key(self, method: str, url: str, params: dict = None, headers: dict = None) -> str:
+        """
+        Build the cache key of a request. The query parameters are sorted and those set to None are left
+        out, like `requests` does, and the values of the `vary_headers` are hashed with the rest.
+        """
+        params = sorted((name, value) for name, value in (params or {}).items() if value is not None)
+        headers = {name.lower(): value for name, value in (headers or {}).items()}
+        vary = [headers.get(name.lower()) for name in self.vary_headers]
+        canonical = '\n'.join([method.upper(), url, urlencode(params, doseq=True), repr(vary)])
+        return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+    def ttl(self, url: str, source_ttl: float = None) -> float:
+        """
+        Get the TTL of a URL: the one of its longest prefix in `ttls`, or else the TTL declared by the
+        source, or `default_ttl`.
+        """
+        parts = urlsplit(url)
+        location = parts.netloc + parts.path
+        prefixes = [prefix for prefix in self.ttls if location.startswith(prefix)]
+        if prefixes:
+            return self.ttls[max(prefixes, key=len)]
+        return source_ttl if source_ttl is not None else self.default_ttl
+
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key[2:]}{_ENTRY_SUFFIX}")
+
+
+    def get(self, key: str) -> dict:
+        """
+        Look up the cached response of a request.
+
+        Returns:
+            dict: The entry, with the 'status', 'headers' and 'content' of the response and the time it was
+            'stored' at, or None.
+        """
+        if self.directory is None:
+            with self._lock:
+                entry = self._memory.get(key)
+                if entry is not None:
+                    self._memory.move_to_end(key)
+                return entry
+        path = self._path(key)
+        try:
+            with gzip.open(path, 'rb') as f:
+                entry = pickle.load(f)
+        except (FileNotFoundError, EOFError, OSError, pickle.UnpicklingError):
+            return None
+        # The modification time orders the entries for the LRU eviction
+        with contextlib.suppress(FileNotFoundError):
+            os.utime(path)
+        return entry
+
+
+    def set(self, key: str, entry: dict):
+        """
+        Store the entry of a request.
+        """
+        if self.directory is None:
+            with self._lock:
+                previous = self._memory.pop(key, None)
+                if previous is not None:
+                    self._memory_bytes -= len(previous['content'])
+                self._memory[key] = entry
+                self._memory_bytes += len(entry['content'])
+                while self._memory and (len(self._memory) > self.max_entries or self._memory_bytes > self.max_memory_bytes):
+                    _, evicted = self._memory.popitem(last=False)
+                    self._memory_bytes -= len(evicted['content'])
+                    self.counters['evicted'] += 1
+            return
+
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with gzip.open(temp_path, 'wb', compresslevel=5) as f:
+            pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+        size = os.path.getsize(temp_path)
+        try:
+            previous_size = os.path.getsize(path)
+        except FileNotFoundError:
+            previous_size = 0
+        os.replace(temp_path, path)
+
+        with self._lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = sum(size for _, size, _ in self._disk_entries())
+            else:
+                # The entry replaces the previous one, e.g. on a revalidation
+                self._disk_bytes += size - previous_size
+            over_limit = self._disk_bytes > self.max_bytes
+        if over_limit:
+            self.evict()
+
+
+    def _disk_entries(self) -> list:
+        entries = []
+        for root, _, file_names in os.walk(self.directory):
+            for file_name in file_names:
+                if file_name.endswith(_ENTRY_SUFFIX):
+                    path = os.path.join(root, file_name)
+                    with contextlib.suppress(FileNotFoundError):
+                        stat = os.stat(path)
+                        entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+
+    def evict(self, max_bytes: int = None):
+        """
+        Delete the least recently used entries of the cache directory until it is below 90% of `max_bytes`,
+        so the evictions do not happen on every write.
+        """
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        entries = sorted(self._disk_entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= max_bytes * 0.9:
+                break
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+                self.counters['evicted'] += 1
+            total -= size
+        with self._lock:
+            self._disk_bytes = total
+
+
+    def delete(self, key: str):
+        """
+        Drop the entry of a request.
+        """
+        with self._lock:
+            entry = self._memory.pop(key, None)
+            if entry is not None:
+                self._memory_bytes -= len(entry['content'])
+        if self.directory is not None:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(self._path(key))
+
+
+    @staticmethod
+    def conditional_headers(entry: dict) -> dict:
+        """
+        Get the headers making a request conditional on the cached response being outdated.
+        """
+        headers = {}
+        if entry['headers'].get('etag'):
+            headers['If-None-Match'] = entry['headers']['etag']
+        if entry['headers'].get('last-modified'):
+            headers['If-Modified-Since'] = entry['headers']['last-modified']
+        return headers
+
+
+    def resolve(self, key: str, entry: dict, response, ttl: float = 0) -> dict:
+        """
+        Process the response to a request, conditional if `entry` is not None.
+
+        A `304 Not Modified` response is answered with the cached entry, whose validators and age are
+        refreshed. A successful response replaces the cached entry, if it has a validator or a TTL. With
+        `stale_if_error`, a server error is answered with the cached entry, if any.
+
+        Args:
+            key (str): The key of the request.
+            entry (dict): The entry the request was made conditional on, or None.
+            response: The `requests` or `httpx` response.
+            ttl (float): The TTL of the URL.
+
+        Returns:
+            dict: The entry whose body answers the request, or None if the response itself does.
+        """
+        headers = {name.lower(): value for name, value in response.headers.items() if name.lower() in _STORED_HEADERS}
+        if response.status_code == 304 and entry is not None:
+            self.counters['revalidated'] += 1
+            entry = {**entry, 'headers': {**entry['headers'], **headers}, 'stored': time.time()}
+            self.set(key, entry)
+            return entry
+        if response.status_code >= 500 and entry is not None and self.stale_if_error:
+            self.counters['stale_if_error'] += 1
+            return entry
+
+        self.counters['misses'] += 1
+        if response.status_code == 200 and (ttl != 0 or 'etag' in headers or 'last-modified' in headers):
+            # The body is already decompressed by the client
+            headers.pop('content-encoding', None)
+            self.set(key, {'status': response.status_code, 'headers': headers, 'content': response.content,
+                           'stored': time.time()})
+            self.counters['stored'] += 1
+        return None
+
+
+    def _lookup(self, url: str, kwargs: dict, source_ttl: float) -> tuple:
+        """
+        Look up the response cached for a GET request and decide how to answer it.
+
+        Returns:
+            tuple: The key of the request, its TTL, the cached entry or None, and whether the entry is
+            'fresh' (served as is), 'stale' (served while it is refreshed) or None (the request is sent,
+            conditional on the entry if there is one).
+        """
+        key = self.key('GET', url, kwargs.get('params'), kwargs.get('headers'))
+        ttl = self.ttl(url, source_ttl)
+        entry = self.get(key)
+        if entry is None:
+            if self.offline:
+                self.counters['offline_misses'] += 1
+                raise OfflineCacheMissException(f"No cached response for {url} with the parameters "
+                                                 f"{kwargs.get('params')}, and the HTTP cache is offline.")
+            return key, ttl, None, None
+
+        age = time.time() - entry['stored']
+        if self.offline or ttl is None or age < ttl:
+            self.counters['hits'] += 1
+            return key, ttl, entry, 'fresh'
+
+        kwargs['headers'] = {**(kwargs.get('headers') or {}), **self.conditional_headers(entry)}
+        if ttl and age < ttl + self.stale_while_revalidate:
+            self.counters['stale_hits'] += 1
+            return key, ttl, entry, 'stale'
+        return key, ttl, entry, None
+
+
+    def _start_revalidation(self, key: str) -> bool:
+        # Only one background request refreshes an entry at a time
+        with self._lock:
+            if key in self._revalidating:
+                return False
+            self._revalidating.add(key)
+            return True
+
+
+    def _revalidate(self, key: str, entry: dict, send, ttl: float):
+        try:
+            self.resolve(key, entry, send(), ttl)
+        except Exception:
+            self.counters['revalidation_errors'] += 1
+        finally:
+            with self._lock:
+                self._revalidating.discard(key)
+
+
+    def fetch(self, url: str, kwargs: dict, send, replay, source_ttl: float = None):
+        """
+        Answer a GET request from the cache, or send it and cache its response.
+
+        Args:
+            url (str): The URL of the request.
+            kwargs (dict): The arguments of the request, whose headers are completed by the conditional headers.
+            send (callable): Sends the request and returns its response.
+            replay (callable): Builds the response replaying an entry, `requests_response` or `httpx_response`.
+            source_ttl (float): The TTL declared by the source.
+        """
+        key, ttl, entry, freshness = self._lookup(url, kwargs, source_ttl)
+        if freshness == 'fresh':
+            return replay(entry, url)
+        if freshness == 'stale':
+            if self._start_revalidation(key):
+                _revalidation_pool().submit(self._revalidate, key, entry, send, ttl)
+            return replay(entry, url)
+
+        try:
+            response = send()
+        except Exception:
+            if entry is None or not self.stale_if_error:
+                raise
+            self.counters['stale_if_error'] += 1
+            return replay(entry, url)
+        resolved = self.resolve(key, entry, response, ttl)
+        return replay(resolved, url, response) if resolved is not None else response
+
+
+    async def fetch_async(self, url: str, kwargs: dict, send, replay, source_ttl: float = None):
+        """
+        Asyncio variant of `fetch`, where `send` is a coroutine function.
+        """
+        key, ttl, entry, freshness = self._lookup(url, kwargs, source_ttl)
+        if freshness == 'fresh':
+            return replay(entry, url)
+        if freshness == 'stale':
+            if self._start_revalidation(key):
+                async def revalidate():
+                    try:
+                        self.resolve(key, entry, await send(), ttl)
+                    except Exception:
+                        self.counters['revalidation_errors'] += 1
+                    finally:
+                        with self._lock:
+                            self._revalidating.discard(key)
+
+                # A reference to the task is kept until it is done, so it is not garbage collected
+                task = asyncio.ensure_future(revalidate())
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+            return replay(entry, url)
+
+        try:
+            response = await send()
+        except Exception:
+            if entry is None or not self.stale_if_error:
+                raise
+            self.counters['stale_if_error'] += 1
+            return replay(entry, url)
+        resolved = self.resolve(key, entry, response, ttl)
+        return replay(resolved, url, response) if resolved is not None else response
+
+
+    def stats(self) -> dict:
+        """
+        Get the counters of the cache: the number of requests answered from the cache without any request
+        ('hits'), while refreshing the response ('stale_hits'), after a 304 ('revalidated') or after a
+        failure ('stale_if_error'), of responses downloaded ('misses') and of those stored ('stored'),
+        and of entries evicted ('evicted').
+        """
+        return {name: self.counters[name] for name in ['hits', 'stale_hits', 'revalidated', 'stale_if_error',
+                                                       'misses', 'stored', 'evicted']}
+
+
+_revalidation_executor = None
+_revalidation_executor_lock = threading.Lock()
+
+
+def _revalidation_pool() -> ThreadPoolExecutor:
+    # Threads refreshing the stale responses of the synchronous sources in the background
+    global _revalidation_executor
+    with _revalidation_executor_lock:
+        if _revalidation_executor is None or _revalidation_executor[0] != os.getpid():
+            _revalidation_executor = (os.getpid(), ThreadPoolExecutor(max_workers=4,
+                                                                      thread_name_prefix='http-cache-revalidation'))
+        return _revalidation_executor[1]
+
+
+def requests_response(entry: dict, url: str, response=None):
+    """
+    Build the `requests` response replaying a cached entry, merging the headers of the response
+    revalidating it, if any.
+    """
+    import requests
+
+    headers = {name: value for name, value in (response.headers.items() if response is not None else [])
+               if name.lower() not in ['content-length', 'content-encoding', 'transfer-encoding']}
+    replayed = requests.Response()
+    replayed.status_code = entry['status']
+    replayed.reason = 'OK'
+    replayed.headers = requests.structures.CaseInsensitiveDict({**headers, **entry['headers']})
+    replayed._content = entry['content']
+    replayed.url = response.url if response is not None else url
+    replayed.encoding = requests.utils.get_encoding_from_headers(replayed.headers)
+    if response is not None:
+        replayed.request = response.request
+        replayed.elapsed = response.elapsed
+    return replayed
+
+
+def httpx_response(entry: dict, url: str, response=None):
+    """
+    Build the `httpx` response replaying a cached entry, merging the headers of the response
+    revalidating it, if any.
+    """
+    import httpx
+
+    headers = {name: value for name, value in (response.headers.items() if response is not None else [])
+               if name.lower() not in ['content-length', 'content-encoding', 'transfer-encoding']}
+    request = response.request if response is not None else httpx.Request('GET', url)
+    return httpx.Response(entry['status'], headers={**headers, **entry['headers']}, content=entry['content'],
+                          request=request)
+
+
+_http_cache = None
+_http_cache_lock = threading.Lock()
+
+
+def get_http_cache() -> HttpCache:
+    """
+    Get the HTTP cache shared by the sources of the process, configured with the HTTP_CACHE_* configuration
+    variables and stored in HTTP_CACHE_DIR if it is set.
+    """
+    global _http_cache
+    with _http_cache_lock:
+        if _http_cache is None:
+            _http_cache = HttpCache(HTTP_CACHE_DIR, default_ttl=HTTP_CACHE_TTL, ttls=parse_cache_ttls(HTTP_CACHE_TTLS),
+                                    stale_while_revalidate=HTTP_CACHE_STALE_WHILE_REVALIDATE,
+                                    max_bytes=HTTP_CACHE_MAX_BYTES, offline=HTTP_CACHE_OFFLINE,
+                                    max_memory_bytes=HTTP_CACHE_MEMORY_BYTES, stale_if_error=HTTP_CACHE_STALE_IF_ERROR)
+        return _http_cache
+
+
+def set_http_cache(http_cache: HttpCache):
+    """
+    Replace the HTTP cache shared by the sources. With None, the next call creates a new one from the
+    configuration variables.
+    """
+    global _http_cache
+    with _http_cache_lock:
+        _http_cache = http_cache
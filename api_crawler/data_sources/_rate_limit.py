@@ -0,0 +1,304 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Union
+from urllib.parse import urlsplit
+from decouple import config
+from ._retry import retry_after_seconds
+
+
+# Limits of the hosts, overriding the ones declared by the sources, e.g. 'www.linkedin.com=1/10,api.github.com=30/60'
+HTTP_RATE_LIMITS = config("HTTP_RATE_LIMITS", default='')
+# SQLite database sharing the limits between the processes. Without it, they are shared between the threads only
+HTTP_RATE_LIMIT_DB = config("HTTP_RATE_LIMIT_DB", default=None)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    host TEXT PRIMARY KEY,
+    tokens REAL,
+    updated REAL,
+    remaining INTEGER,
+    reset REAL,
+    blocked_until REAL
+)
+"""
+_STATE_FIELDS = ['tokens', 'updated', 'remaining', 'reset', 'blocked_until']
+
+
+def parse_rate_limits(value: str) -> dict:
+    """
+    Parse limits given as 'host=requests/seconds,...', e.g. 'www.linkedin.com=1/10'.
+
+    Returns:
+        dict: The (requests, seconds) limit of each host.
+    """
+    limits = {}
+    for item in filter(None, (item.strip() for item in value.split(','))):
+        host, _, limit = item.partition('=')
+        requests, _, seconds = limit.partition('/')
+        try:
+            limits[host.strip()] = (float(requests), float(seconds or 1))
+        except ValueError:
+            raise ValueError(f"Invalid rate limit {item!r}. Expected 'host=requests/seconds'.")
+    return limits
+
+
+class MemoryBackend:
+    """
+    Stores the state of the buckets in memory, shared by the threads of the process.
+    """
+
+    def __init__(self):
+        self._states = {}
+        self._lock = threading.Lock()
+
+
+    @contextmanager
+    def transaction(self, host: str):
+        """
+        Lock the state of the bucket of a host, yielding it as a dictionary whose changes are saved on exit.
+        """
+        with self._lock:
+            state = self._states.setdefault(host, dict.fromkeys(_STATE_FIELDS))
+            yield state
+
+
+class SQLiteBackend:
+    """
+    Stores the state of the buckets in a SQLite database, shared by the processes using the same file.
+
+    Args:
+        db_path (str): The path of the SQLite database.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._connection.execute(_SCHEMA)
+
+
+    @property
+    def _connection(self) -> sqlite3.Connection:
+        # SQLite connections cannot be shared between threads, so every thread opens its own
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or getattr(self._local, 'pid', None) != os.getpid():
+            connection = sqlite3.connect(self.db_path, timeout=60, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+
+    @contextmanager
+    def transaction(self, host: str):
+        """
+        Lock the state of the bucket of a host, yielding it as a dictionary whose changes are saved on exit.
+        """
+        connection = self._connection
+        # Take the write lock right away, so two processes cannot read the same tokens
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute(f"SELECT {', '.join(_STATE_FIELDS)} FROM buckets WHERE host = ?", (host,)).fetchone()
+            state = dict(zip(_STATE_FIELDS, row or [None] * len(_STATE_FIELDS)))
+            yield state
+            connection.execute(f"INSERT OR REPLACE INTO buckets VALUES (?, {', '.join('?' * len(_STATE_FIELDS))})",
+                               (host, *(state[field] for field in _STATE_FIELDS)))
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+
+
+class RateLimiter:
+    """
+    Per-host token-bucket rate limiter, adjusted from the rate-limit headers of the responses.
+
+    Every host gets a bucket holding up to `requests` tokens, refilled at `requests / seconds` tokens per
+    second, and every request takes a token, waiting for one when the bucket is empty. Hosts without a
+    declared limit are not throttled, except by their responses:
+
+    - `Retry-After`, e.g. on a 429 or 503 response, holds the requests to the host for the given time.
+    - `X-RateLimit-Remaining` and `X-RateLimit-Reset`, as sent by GitHub, let the requests go until the
+      remaining quota is used up, then hold them until the reset time. When the response names the quota
+      with `X-RateLimit-Resource`, e.g. GitHub's 'core', 'search' and 'graphql' quotas, the quota is kept
+      apart from the others of the host, and the requests to the same endpoint, i.e. the same first path
+      segment such as '/search', are then held by that quota only.
+
+    The requests therefore run at the maximum rate the server allows rather than after fixed sleeps.
+
+    Args:
+        backend: Where the state of the buckets is kept. `MemoryBackend` (default) shares it between the
+            threads of the process, `SQLiteBackend` between the processes using the same database.
+        limits (dict): The (requests, seconds) limit of some hosts, overriding the limits the sources declare.
+    """
+
+    def __init__(self, backend=None, limits: dict = None):
+        self.backend = backend if backend is not None else MemoryBackend()
+        self.limits = limits or {}
+        # The quota resource named by the responses of each (host, endpoint)
+        self._resources = {}
+
+
+    @staticmethod
+    def _endpoint(path: str) -> str:
+        return urlsplit(path or '').path.strip('/').partition('/')[0]
+
+
+    def quota_key(self, host: str, path: str = None) -> str:
+        """
+        Get the key of the quota of a request: the host, or 'host#resource' once a response to the same
+        endpoint named its quota resource.
+        """
+        resource = self._resources.get((host, self._endpoint(path)))
+        return f'{host}#{resource}' if resource else host
+
+
+    @staticmethod
+    def _take_quota(state: dict, now: float) -> float:
+        # Count a request against the quota of the state, or tell how long to wait for its reset
+        if state['remaining'] is not None:
+            if now >= state['reset']:
+                # The quota was reset, the next response tells the new one
+                state['remaining'] = state['reset'] = None
+            elif state['remaining'] <= 0:
+                return state['reset'] - now
+            else:
+                state['remaining'] -= 1
+        return 0
+
+
+    def reserve(self, host: str, limit: tuple = None, path: str = None) -> float:
+        """
+        Take a token from the bucket of a host, if one is available.
+
+        Args:
+            host (str): The host the request is sent to.
+            limit (tuple): The (requests, seconds) limit declared by the source, if any.
+            path (str): The path of the request, telling which quota of the host it counts against.
+
+        Returns:
+            float: 0 if the token was taken, otherwise the number of seconds to wait before trying again.
+        """
+        limit = self.limits.get(host, limit)
+        quota_key = self.quota_key(host, path)
+        now = time.time()
+        with self.backend.transaction(host) as state:
+            if state['blocked_until'] is not None:
+                if now < state['blocked_until']:
+                    return state['blocked_until'] - now
+                state['blocked_until'] = None
+
+            if quota_key == host and state['remaining'] is not None and now < state['reset'] and state['remaining'] <= 0:
+                return state['reset'] - now
+
+            if limit is not None:
+                requests, seconds = limit
+                rate = requests / seconds
+                tokens = requests if state['tokens'] is None else state['tokens']
+                tokens = min(requests, tokens + (now - (state['updated'] or now)) * rate)
+                state['updated'] = now
+                if tokens < 1:
+                    state['tokens'] = tokens
+                    return (1 - tokens) / rate
+                state['tokens'] = tokens - 1
+
+            if quota_key == host:
+                return self._take_quota(state, now)
+
+        # The quotas of the resources of a host are kept apart, e.g. GitHub's search quota does not hold its core requests
+        with self.backend.transaction(quota_key) as state:
+            return self._take_quota(state, now)
+
+
+    def acquire(self, host: str, limit: tuple = None, path: str = None):
+        """
+        Wait until a request can be sent to a host, taking a token from its bucket.
+        """
+        while True:
+            wait = self.reserve(host, limit, path)
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+
+    async def acquire_async(self, host: str, limit: tuple = None, path: str = None):
+        """
+        Wait until a request can be sent to a host without blocking the event loop, taking a token from its bucket.
+        """
+        while True:
+            wait = self.reserve(host, limit, path)
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+
+    def update(self, host: str, headers, path: str = None):
+        """
+        Adjust the limits of a host from the headers of one of its responses.
+
+        Args:
+            host (str): The host that sent the response.
+            headers: The headers of the response, a case-insensitive mapping.
+            path (str): The path of the request, so the next requests to the same endpoint count against
+                the quota resource named by the response.
+        """
+        retry_after = headers.get('Retry-After')
+        remaining = headers.get('X-RateLimit-Remaining')
+        reset = headers.get('X-RateLimit-Reset')
+        resource = headers.get('X-RateLimit-Resource')
+        if resource:
+            self._resources[(host, self._endpoint(path))] = resource
+        now = time.time()
+
+        if retry_after is not None:
+            seconds = retry_after_seconds(retry_after, now)
+            if seconds is not None and seconds > 0:
+                with self.backend.transaction(host) as state:
+                    state['blocked_until'] = max(state['blocked_until'] or 0, now + seconds)
+
+        if remaining is not None and reset is not None:
+            try:
+                remaining, reset = int(remaining), float(reset)
+            except ValueError:
+                return
+            with self.backend.transaction(f'{host}#{resource}' if resource else host) as state:
+                if state['reset'] is not None and reset == state['reset']:
+                    # Responses to concurrent requests may arrive out of order, the lowest count is the latest
+                    remaining = min(remaining, state['remaining'])
+                state['remaining'], state['reset'] = remaining, reset
+
+
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    """
+    Get the rate limiter shared by the RESTful sources of the process.
+
+    The limits of HTTP_RATE_LIMITS override the ones declared by the sources. When HTTP_RATE_LIMIT_DB is
+    set, the state of the buckets is kept in that SQLite database, so the processes using it share the limits.
+
+    Returns:
+        RateLimiter: The shared rate limiter.
+    """
+    global _rate_limiter
+    with _rate_limiter_lock:
+        if _rate_limiter is None:
+            backend = SQLiteBackend(HTTP_RATE_LIMIT_DB) if HTTP_RATE_LIMIT_DB else MemoryBackend()
+            _rate_limiter = RateLimiter(backend, parse_rate_limits(HTTP_RATE_LIMITS))
+        return _rate_limiter
+
+
+def set_rate_limiter(rate_limiter: Union[RateLimiter, None]):
+    """
+    Replace the rate limiter shared by the RESTful sources, e.g. by one with other limits or backend.
+    With None, the next request creates a new one from the configuration variables.
+    """
+    global _rate_limiter
+    with _rate_limiter_lock:
+        _rate_limiter = rate_limiter
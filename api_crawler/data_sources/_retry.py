@@ -0,0 +1,267 @@
+import asyncio
+import random
+import threading
+import time
+from collections import Counter
+from email.utils import parsedate_to_datetime
+from decouple import config
+import requests
+
+
+# Default retry policy of the sources: attempts per call, base and maximum backoff in seconds, and maximum
+# duration of a call in seconds, retries included (0 for no deadline)
+HTTP_RETRY_ATTEMPTS = config("HTTP_RETRY_ATTEMPTS", default=5, cast=int)
+HTTP_RETRY_BACKOFF = config("HTTP_RETRY_BACKOFF", default=0.5, cast=float)
+HTTP_RETRY_MAX_BACKOFF = config("HTTP_RETRY_MAX_BACKOFF", default=30, cast=float)
+HTTP_RETRY_DEADLINE = config("HTTP_RETRY_DEADLINE", default=300, cast=float)
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Transient errors of `requests`. The ones of httpx (httpx.TransportError) are retried by `RetryPolicy.call_async`
+RETRY_EXCEPTIONS = (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                    requests.exceptions.ChunkedEncodingError)
+
+
+def retry_after_seconds(value: str, now: float = None) -> float:
+    """
+    Parse a Retry-After header, either a number of seconds or an HTTP date.
+
+    Returns:
+        float: The number of seconds to wait, or None if the value is invalid.
+    """
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return parsedate_to_datetime(value).timestamp() - (time.time() if now is None else now)
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryMetrics:
+    """
+    Thread-safe counters of the calls made through the retry policies and of their retries, by host and reason.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+
+    def reset(self):
+        with self._lock:
+            self.calls = 0
+            self.retried_calls = 0
+            self.retries = Counter()
+            self.give_ups = Counter()
+
+
+    def record(self, host: str, retries: list, gave_up: bool):
+        """
+        Count a call.
+
+        Args:
+            host (str): The host the call was sent to.
+            retries (list): The reason of each retry of the call, e.g. 503 or 'ConnectionError'.
+            gave_up (bool): Whether the call still failed once out of attempts or time.
+        """
+        with self._lock:
+            self.calls += 1
+            self.retried_calls += bool(retries)
+            self.retries.update((host, str(reason)) for reason in retries)
+            if gave_up:
+                self.give_ups[host] += 1
+
+
+    def snapshot(self) -> dict:
+        """
+        Get the values of the counters.
+
+        Returns:
+            dict: The number of 'calls', of 'retried_calls', of 'retries' and of calls that gave up
+            ('give_ups'), with the retries by host and reason in 'retries_by_host' and 'retries_by_reason'.
+        """
+        with self._lock:
+            by_host, by_reason = Counter(), Counter()
+            for (host, reason), count in self.retries.items():
+                by_host[host] += count
+                by_reason[reason] += count
+            return {'calls': self.calls, 'retried_calls': self.retried_calls,
+                    'retries': sum(self.retries.values()), 'give_ups': sum(self.give_ups.values()),
+                    'retries_by_host': dict(by_host), 'retries_by_reason': dict(by_reason)}
+
+
+retry_metrics = RetryMetrics()
+
+
+class RetryPolicy:
+    """
+    Retries the calls failing with a transient error, so that long crawls do not lose the pages
+    fetched so far.
+
+    A call is retried when it raises one of `exceptions`, or when it returns a response whose status is
+    one of `statuses`. The n-th retry waits a random time between 0 and `min(max_backoff, backoff * 2 ** (n - 1))`
+    ("full jitter", so concurrent clients do not retry in lockstep), or the time given by the `Retry-After`
+    header of the response. After `max_attempts` attempts, or when the next attempt would start after
+    the deadline, the last response is returned, or the last exception raised.
+
+    Args:
+        max_attempts (int): Maximum number of attempts per call, the first one included.
+        backoff (float): Base of the exponential backoff, in seconds.
+        max_backoff (float): Maximum wait between two attempts, in seconds.
+        deadline (float): Maximum duration of a call in seconds, retries included. None or 0 for no deadline.
+        statuses (tuple): The response statuses to retry.
+        exceptions (tuple): The exception classes to retry. Defaults to the connection errors and timeouts
+            of requests, and of httpx for `call_async`.
+        methods (tuple): The HTTP methods to retry, None for all of them. The sources only send POST
+            requests for queries, so they are retried too by default.
+        metrics (RetryMetrics): Where the retries are counted. Defaults to the shared `retry_metrics`.
+    """
+
+    def __init__(self, max_attempts: int = 5, backoff: float = 0.5, max_backoff: float = 30, deadline: float = 300,
+                 statuses: tuple = RETRY_STATUSES, exceptions: tuple = None, methods: tuple = None,
+                 metrics: RetryMetrics = None):
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.deadline = deadline or None
+        self.statuses = statuses
+        self.exceptions = exceptions
+        self.methods = methods
+        self.metrics = metrics if metrics is not None else retry_metrics
+
+
+    def _delay(self, attempt: int, response) -> float:
+        delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1)))
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after is not None:
+            seconds = retry_after_seconds(retry_after)
+            if seconds is not None:
+                delay = max(seconds, 0)
+        return delay
+
+
+    def _next_delay(self, method: str, attempt: int, start: float, response, exception, exceptions: tuple):
+        """
+        Decide whether to retry after an attempt.
+
+        Returns:
+            tuple: The reason of the retry, or None if the attempt is not retried, and the number of seconds
+            to wait, or None if the attempt should be retried but the policy gives up.
+        """
+        if self.methods is not None and method is not None and method.upper() not in self.methods:
+            return None, None
+        if exception is not None:
+            if not isinstance(exception, exceptions):
+                return None, None
+            reason = type(exception).__name__
+        elif response is not None and getattr(response, 'status_code', None) in self.statuses:
+            reason = response.status_code
+        else:
+            return None, None
+
+        if attempt >= self.max_attempts:
+            return reason, None
+        delay = self._delay(attempt, response)
+        if self.deadline is not None and time.monotonic() + delay - start > self.deadline:
+            return reason, None
+        return reason, delay
+
+
+    def call(self, func, method: str = None, host: str = '', exceptions: tuple = None):
+        """
+        Call a function, retrying it while it fails with a transient error.
+
+        Args:
+            func (callable): Makes one attempt, e.g. sends a request and returns its response.
+            method (str): The HTTP method of the request, checked against `methods`.
+            host (str): The host of the request, for the metrics.
+            exceptions (tuple): The exception classes to retry, overriding the ones of the policy.
+
+        Returns:
+            The return value of the last attempt.
+        """
+        exceptions = exceptions or self.exceptions or RETRY_EXCEPTIONS
+        start = time.monotonic()
+        retries = []
+        attempt = 1
+        while True:
+            try:
+                response, exception = func(), None
+            except Exception as e:
+                response, exception = None, e
+
+            reason, delay = self._next_delay(method, attempt, start, response, exception, exceptions)
+            if reason is None or delay is None:
+                self.metrics.record(host, retries, gave_up=reason is not None)
+                if exception is not None:
+                    raise exception
+                return response
+
+            retries.append(reason)
+            time.sleep(delay)
+            attempt += 1
+
+
+    async def call_async(self, func, method: str = None, host: str = '', exceptions: tuple = None):
+        """
+        Await a coroutine function, retrying it while it fails with a transient error. See `call`.
+        """
+        if exceptions is None and self.exceptions is None:
+            import httpx
+
+            exceptions = (httpx.TransportError,)
+        exceptions = exceptions or self.exceptions
+        start = time.monotonic()
+        retries = []
+        attempt = 1
+        while True:
+            try:
+                response, exception = await func(), None
+            except Exception as e:
+                response, exception = None, e
+
+            reason, delay = self._next_delay(method, attempt, start, response, exception, exceptions)
+            if reason is None or delay is None:
+                self.metrics.record(host, retries, gave_up=reason is not None)
+                if exception is not None:
+                    raise exception
+                return response
+
+            retries.append(reason)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+
+_retry_policy = None
+_retry_policy_lock = threading.Lock()
+
+
+def get_retry_policy() -> RetryPolicy:
+    """
+    Get the retry policy of the sources that do not set one of their own, configured with the
+    HTTP_RETRY_* configuration variables.
+    """
+    global _retry_policy
+    with _retry_policy_lock:
+        if _retry_policy is None:
+            _retry_policy = RetryPolicy(max_attempts=HTTP_RETRY_ATTEMPTS, backoff=HTTP_RETRY_BACKOFF,
+                                        max_backoff=HTTP_RETRY_MAX_BACKOFF, deadline=HTTP_RETRY_DEADLINE)
+        return _retry_policy
+
+
+def set_retry_policy(retry_policy: RetryPolicy):
+    """
+    Replace the retry policy of the sources that do not set one of their own. With None, the next call
+    creates a new one from the configuration variables.
+    """
+    global _retry_policy
+    with _retry_policy_lock:
+        _retry_policy = retry_policy
+
+
+def get_retry_metrics() -> dict:
+    """
+    Get the counters of the calls made through the retry policies and of their retries, see `RetryMetrics.snapshot`.
+    """
+    return retry_metrics.snapshot()
@@ -0,0 +1,153 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Union
+from decouple import config
+
+
+# Directory of the state of the incremental syncs: the watermarks and the materialized snapshots
+SYNC_STATE_DIR = config("SYNC_STATE_DIR", default=os.path.join(os.path.expanduser('~'), '.cache', 'api_crawler', 'sync'))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS watermarks (
+    source TEXT,
+    resource TEXT,
+    watermark TEXT,
+    synced_at REAL,
+    PRIMARY KEY (source, resource)
+);
+CREATE TABLE IF NOT EXISTS items (
+    source TEXT,
+    resource TEXT,
+    key TEXT,
+    updated TEXT,
+    data TEXT,
+    PRIMARY KEY (source, resource, key)
+);
+"""
+
+
+class SyncState:
+    """
+    Local state of the incremental syncs: the high-water mark of every resource of a source, e.g. the
+    latest `updated_at` of the issues of a repository, and the snapshot of the resource materialized
+    from the deltas fetched since.
+
+    A delta and its watermark are merged in a single transaction, so an interrupted sync leaves the previous
+    state untouched and the next one fetches the delta again. The state is kept in a SQLite database,
+    shared by the processes using the same directory.
+
+    Args:
+        directory (str): The directory of the database.
+    """
+
+    def __init__(self, directory: str = SYNC_STATE_DIR):
+        self.directory = directory
+        self.db_path = os.path.join(directory, 'sync.db')
+        self._local = threading.local()
+        os.makedirs(directory, exist_ok=True)
+        self._connection.executescript(_SCHEMA)
+
+
+    @property
+    def _connection(self) -> sqlite3.Connection:
+        # SQLite connections cannot be shared between threads, so every thread opens its own
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or getattr(self._local, 'pid', None) != os.getpid():
+            connection = sqlite3.connect(self.db_path, timeout=60, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+
+    def watermark(self, source: str, resource: str) -> str:
+        """
+        Get the high-water mark of a resource, or None if it was never synced.
+        """
+        row = self._connection.execute('SELECT watermark FROM watermarks WHERE source = ? AND resource = ?',
+                                       (source, resource)).fetchone()
+        return row[0] if row else None
+
+
+    def merge(self, source: str, resource: str, items: list, key, updated, watermark: str = None) -> str:
+        """
+        Merge a delta into the snapshot of a resource, and move its watermark to the latest item.
+
+        Args:
+            source (str): The source of the resource, e.g. 'owner/repo'.
+            resource (str): The resource, e.g. 'issues'.
+            items (list): The new and updated items.
+            key (callable): Gets the key of an item in the snapshot, e.g. the number of an issue.
+            updated (callable): Gets the time an item was last updated, as an ISO 8601 string.
+            watermark (str): The watermark the delta was fetched from, kept if the delta is empty.
+
+        Returns:
+            str: The new watermark.
+        """
+        rows = [(source, resource, str(key(item)), updated(item), json.dumps(item)) for item in items]
+        watermark = max([watermark or '', *(row[3] for row in rows)]) or None
+        connection = self._connection
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.executemany('INSERT OR REPLACE INTO items VALUES (?, ?, ?, ?, ?)', rows)
+            connection.execute('INSERT OR REPLACE INTO watermarks VALUES (?, ?, ?, ?)',
+                               (source, resource, watermark, time.time()))
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        return watermark
+
+
+    def snapshot(self, source: str, resource: str) -> list:
+        """
+        Get the materialized snapshot of a resource, from the least to the most recently updated item.
+        """
+        rows = self._connection.execute('SELECT data FROM items WHERE source = ? AND resource = ? ORDER BY updated, key',
+                                        (source, resource))
+        return [json.loads(data) for data, in rows]
+
+
+    def reset(self, source: str, resource: str = None):
+        """
+        Forget the watermark and the snapshot of a resource, or of every resource of a source, so the next
+        sync fetches the whole history.
+        """
+        condition, values = ('source = ? AND resource = ?', (source, resource)) if resource else ('source = ?', (source,))
+        connection = self._connection
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute(f'DELETE FROM items WHERE {condition}', values)
+            connection.execute(f'DELETE FROM watermarks WHERE {condition}', values)
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+
+
+_sync_state = None
+_sync_state_lock = threading.Lock()
+
+
+def get_sync_state() -> SyncState:
+    """
+    Get the sync state shared by the sources of the process, stored in SYNC_STATE_DIR.
+    """
+    global _sync_state
+    with _sync_state_lock:
+        if _sync_state is None:
+            _sync_state = SyncState(SYNC_STATE_DIR)
+        return _sync_state
+
+
+def set_sync_state(sync_state: Union[SyncState, None]):
+    """
+    Replace the sync state shared by the sources, e.g. by one in another directory. With None, the next
+    call creates a new one from the configuration variables.
+    """
+    global _sync_state
+    with _sync_state_lock:
+        _sync_state = sync_state
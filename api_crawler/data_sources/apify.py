@@ -1,4 +1,3 @@
-import time
 from decouple import config
 from ._base import BaseAPI
 from apify_client import ApifyClient
@@ -41,12 +40,11 @@ class ApifyAPI(BaseAPI):
 
         run_id = run['id']
 
-
-        while True:
-            status = self.get_run(run_id)['status']
-            if status == 'SUCCEEDED':
-                break
-            time.sleep(10)  # Wait for 10 seconds before checking again
+        # The Apify API holds the request until the run finishes, rather than being polled
+        run = self.client.run(run_id).wait_for_finish()
+        if run is None or run['status'] != 'SUCCEEDED':
+            status = run['status'] if run is not None else 'NOT FOUND'
+            raise RuntimeError(f"Actor run {run_id} of {actor_id} did not succeed. Status: {status}")
 
         results = self.get_run_results(run_id)
         return results
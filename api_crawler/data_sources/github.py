@@ -1,24 +1,59 @@
-import requests
 from decouple import config
 from datetime import datetime, timedelta
 from ..data_lake.logger import log_io_to_json
-from ._base import BaseSearchAPI, BaseRestfulAPI
-import os
-from ..exceptions import NoAPIKeyException
+from ._base import BaseSearchAPI, BaseRestfulAPI, AsyncBaseRestfulAPI
+from ._http_cache import GITHUB_CONDITIONAL_REQUESTS, get_http_cache
+from ._github_graphql import build_query, build_comments_query, query_variables, normalize_node
+from ._sync_state import get_sync_state
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+import asyncio
+import contextvars
+from ..exceptions import GraphQLException
 
 GITHUB_API_KEY = config('GITHUB_API_KEY', default=None)
+# Maximum number of pages of a listing fetched concurrently by the get_all_* methods
+GITHUB_PAGE_WORKERS = config('GITHUB_PAGE_WORKERS', default=8, cast=int)
+# Maximum number of comment threads of issues or pull requests fetched concurrently
+GITHUB_COMMENT_WORKERS = config('GITHUB_COMMENT_WORKERS', default=8, cast=int)
+# Backend of the get_all_repo_issues and get_all_repo_pull_requests methods, 'rest' or 'graphql'
+GITHUB_BACKEND = config('GITHUB_BACKEND', default='rest')
+
+
+def _page_number(url) -> int:
+    '''Get the page number of a pagination link, or None'''
+    values = parse_qs(urlsplit(str(url)).query).get('page')
+    return int(values[0]) if values else None
+
+
+def _unique(items:list, key) -> list:
+    '''Drop the items fetched twice, e.g. shifted to the next page while paginating, keeping the first one'''
+    unique = {}
+    for item in items:
+        unique.setdefault(key(item), item)
+    return list(unique.values())
 
 
 class GithubAPI(BaseRestfulAPI, BaseSearchAPI):
-    def __init__(self, api_key: str = GITHUB_API_KEY):
+    page_workers: int = GITHUB_PAGE_WORKERS
+    comment_workers: int = GITHUB_COMMENT_WORKERS
+
+    def __init__(self, api_key: str = GITHUB_API_KEY, backend: str = GITHUB_BACKEND):
         super().__init__()
 
+        if backend not in ('rest', 'graphql'):
+            raise ValueError(f"backend must be 'rest' or 'graphql'. Got {backend}")
+        self.backend = backend
         api_key = self._get_api_key(api_key, "GITHUB_API_KEY",
                                     message = """No API key found for Github API. Please set the GITHUB_API_KEY environment variable.
 See how to get you API key by following this link: https://docs.github.com/en/rest/quickstart?apiVersion=2022-11-28&tool=curl""")
     
         self.api_key = api_key
         self.base_url = 'https://api.github.com/'
+        # The responses are revalidated with conditional requests, whose 304 answers cost no rate limit. The
+        # validators are kept in the memory of the process, or across runs in HTTP_CACHE_DIR when it is set
+        if GITHUB_CONDITIONAL_REQUESTS:
+            self.http_cache = get_http_cache()
         self.headers = {
             "Accept": "application/vnd.github+json",
             "Authorization": f"Bearer {self.api_key}",
@@ -41,66 +76,160 @@ See how to get you API key by following this link: https://docs.github.com/en/re
 
         repo_endpoint = f'repos/{repo_name}/{endpoint}'
         return self.get(repo_endpoint, **kwargs)
-    
 
 
-    @log_io_to_json
-    def get_repo_issues(self, repo_name:str, params = None, comments = False, **kwargs):
-        if not comments:
-            return self._get_repos(repo_name, 'issues', params = params, **kwargs).json()
+    def _get_all_pages(self, repo_name:str, endpoint:str, params = None, **kwargs):
+        '''
+        Get every item of a paginated listing, 100 items per page.
+
+        The pagination follows the Link header of the responses: once the first page tells the last one,
+        the remaining pages are fetched concurrently by up to `page_workers` threads, and kept in order.
+        Otherwise the `next` links are followed as given, e.g. cursor links without a page number.
+        '''
+        params = {'per_page': 100, **(params or {})}
+
+        def get_page(page):
+            response = self._get_repos(repo_name, endpoint, params={**params, 'page': page}, **kwargs)
+            response.raise_for_status()
+            return response
+
+        response = get_page(1)
+        pages = [response.json()]
+        last_page = _page_number(response.links.get('last', {}).get('url'))
+        if last_page is not None and last_page > 1:
+            with ThreadPoolExecutor(max_workers=min(self.page_workers, last_page - 1)) as executor:
+                # Every page runs in a copy of the context of the call, e.g. to link its logs to the call
+                futures = [executor.submit(contextvars.copy_context().run, get_page, page)
+                           for page in range(2, last_page + 1)]
+                try:
+                    pages.extend(future.result().json() for future in futures)
+                except BaseException:
+                    # Do not wait for the queued pages, e.g. held by the rate limiter, once one failed
+                    for future in futures:
+                        future.cancel()
+                    raise
         else:
-            issues = self._get_repos(repo_name, 'issues', params = params, **kwargs).json()
+            # Without a last page, the next pages are followed one at a time. Their links carry the query
+            while 'next' in response.links:
+                response = self.get(response.links['next']['url'], **kwargs)
+                response.raise_for_status()
+                pages.append(response.json())
+        return [item for page in pages for item in page]
+
+
+    def graphql(self, query:str, variables = None, **kwargs):
+        '''Send a GraphQL query, returning its data. Raises a GraphQLException if the query returns errors'''
+        response = self.post('graphql', json={'query': query, 'variables': variables or {}}, headers=self.headers, **kwargs)
+        response.raise_for_status()
+        result = response.json()
+        if result.get('errors'):
+            raise GraphQLException(result['errors'])
+        return result['data']
+
+
+    def _iter_graphql_pages(self, repo_name:str, resource:str, params = None, comments = False, fields = None, **kwargs):
+        '''
+        Yield the pages of the issues or pull requests of a repository fetched with the GraphQL API, in the
+        dict shape of the REST API. A single query per page selects the `fields` of the items, their labels
+        and reactions, and the first page of their comments, whose next pages are followed by cursor.
+        '''
+        if '/' not in repo_name or len(repo_name.split('/')) != 2:
+            raise ValueError(f"repo_name must be in '{{owner}}/{{repo}}' format. Got {repo_name}")
 
-            for issue in issues:
-                issue['comments_thread'] = self._get_repos(repo_name, f'issues/{issue["number"]}/comments').json()
-            return issues
+        query = build_query(resource, fields, comments)
+        variables = query_variables(repo_name, resource, params)
+        while True:
+            data = self.graphql(query, variables, **kwargs)
+            [connection] = data['repository'].values()
+            nodes = connection['nodes']
+            if comments:
+                for node in nodes:
+                    thread = node['comments']
+                    while thread['pageInfo']['hasNextPage']:
+                        thread_page = self.graphql(build_comments_query(), {'id': node['id'], 'after': thread['pageInfo']['endCursor']},
+                                                   **kwargs)['node']['comments']
+                        thread['nodes'].extend(thread_page['nodes'])
+                        thread['pageInfo'] = thread_page['pageInfo']
+            yield [normalize_node(node) for node in nodes]
+            if not connection['pageInfo']['hasNextPage']:
+                break
+            variables['after'] = connection['pageInfo']['endCursor']
+
+
+    def _get_all_items(self, repo_name:str, resource:str, params = None, comments = False, fields = None, **kwargs):
+        '''Get every issue or pull request of a repository, with the backend of the API'''
+        if self.backend == 'graphql':
+            return [item for page in self._iter_graphql_pages(repo_name, resource, params, comments, fields, **kwargs) for item in page]
+        if fields is not None:
+            raise ValueError("fields can only be selected with the 'graphql' backend")
+        items = self._get_all_pages(repo_name, resource, params, **kwargs)
+        if comments:
+            self._get_comments_threads(repo_name, resource, items)
+        return items
+
+
+    def _get_comments_threads(self, repo_name:str, endpoint:str, items:list):
+        '''
+        Set the `comments_thread` of the issues or pull requests, fetched concurrently by up to
+        `comment_workers` threads. The issues without comments are skipped, and every page of a thread is fetched.
+        '''
+        def get_thread(item):
+            # Only the issues tell their comments count, the pull requests listing does not
+            if endpoint == 'issues' and item.get('comments') == 0:
+                return []
+            return self._get_all_pages(repo_name, f'{endpoint}/{item["number"]}/comments')
+
+        if not items:
+            return items
+        with ThreadPoolExecutor(max_workers=min(self.comment_workers, len(items))) as executor:
+            futures = [executor.submit(contextvars.copy_context().run, get_thread, item) for item in items]
+            try:
+                for item, future in zip(items, futures):
+                    item['comments_thread'] = future.result()
+            except BaseException:
+                # Do not wait for the queued threads once one failed
+                for future in futures:
+                    future.cancel()
+                raise
+        return items
     
 
-    @log_io_to_json
-    def get_all_repo_issues(self, repo, params = None, **kwargs):
 
-        if params is None:
-            params = {}
+    @log_io_to_json
+    def get_repo_issues(self, repo_name:str, params = None, comments = False, **kwargs):
+        issues = self._get_repos(repo_name, 'issues', params = params, **kwargs).json()
+        if comments:
+            self._get_comments_threads(repo_name, 'issues', issues)
+        return issues
+    
 
-        all_issues = []
-        page = 1
-        while True:
-            params = {'per_page': 100, 'page': page, **params}
-            issues = self.get_repo_issues(repo, params=params, **kwargs)
-            if len(issues) == 0:
-                break
-            all_issues.extend(issues)
-            page += 1
-        return all_issues
+    @log_io_to_json
+    def get_all_repo_issues(self, repo, params = None, comments = False, fields = None, **kwargs):
+        '''
+        Get every issue of a repository. With the 'graphql' backend, `fields` selects the GraphQL fields of
+        the issues (see `ISSUE_FIELDS`), and the listing excludes the pull requests, unlike the REST one.
+        `fields` is GraphQL only, and raises a ValueError with the 'rest' backend.
+        '''
+        return self._get_all_items(repo, 'issues', params, comments, fields, **kwargs)
 
 
     
     @log_io_to_json
     def get_repo_pulls(self, repo_name: str, comments = False, **kwargs):
-        if not comments:
-            return self._get_repos(repo_name, 'pulls', **kwargs).json()
-        else:
-            pulls = self._get_repos(repo_name, 'pulls', **kwargs).json()
-            for pull in pulls:
-                pull['comments_thread'] = self._get_repos(repo_name, f'pulls/{pull["number"]}/comments').json()
-            return pulls
+        pulls = self._get_repos(repo_name, 'pulls', **kwargs).json()
+        if comments:
+            self._get_comments_threads(repo_name, 'pulls', pulls)
+        return pulls
     
     
     @log_io_to_json
-    def get_all_repo_pull_requests(self, repo, params = None, **kwargs):
-        if params is None:
-            params = {}
-
-        all_pulls = []
-        page = 1
-        while True:
-            params = {'per_page': 100, 'page': page, **params}
-            pulls = self.get_repo_pulls(repo, params=params, **kwargs)
-            if len(pulls) == 0:
-                break
-            all_pulls.extend(pulls)
-            page += 1
-        return all_pulls
+    def get_all_repo_pull_requests(self, repo, params = None, comments = False, fields = None, **kwargs):
+        '''
+        Get every pull request of a repository. With the 'graphql' backend, `fields` selects the GraphQL fields
+        of the pull requests (see `PULL_FIELDS`), and the `comments_thread` holds their conversation comments
+        rather than their review comments. `fields` is GraphQL only, and raises a ValueError with the 'rest' backend.
+        '''
+        return self._get_all_items(repo, 'pulls', params, comments, fields, **kwargs)
 
 
     @log_io_to_json
@@ -109,19 +238,7 @@ See how to get you API key by following this link: https://docs.github.com/en/re
     
     @log_io_to_json
     def get_all_repo_commits(self, repo, params = None, **kwargs):
-        if params is None:
-            params = {}
-
-        all_commits = []
-        page = 1
-        while True:
-            params = {'per_page': 100, 'page': page, **params}
-            commits = self.get_repo_commits(repo, params=params, **kwargs).json()
-            if len(commits) == 0:
-                break
-            all_commits.extend(commits)
-            page += 1
-        return all_commits
+        return self._get_all_pages(repo, 'commits', params, **kwargs)
         
 
     @log_io_to_json
@@ -130,19 +247,47 @@ See how to get you API key by following this link: https://docs.github.com/en/re
 
     @log_io_to_json
     def get_all_repo_comments(self, repo, params = None, **kwargs):
-        if params is None:
-            params = {}
-
-        all_comments = []
-        page = 1
-        while True:
-            params = {'per_page': 100, 'page': page, **params}
-            comments = self.get_repo_comments(repo, params=params, **kwargs).json()
-            if len(comments) == 0:
-                break
-            all_comments.extend(comments)
-            page += 1
-        return all_comments
+        return self._get_all_pages(repo, 'comments', params, **kwargs)
+
+
+    # The syncs are not decorated with log_io_to_json, whose memoized results would skip the delta
+    def sync_repo_issues(self, repo, comments = False, **kwargs):
+        '''
+        Fetch the issues of a repository updated since the last sync, newest first, and merge them into its
+        local snapshot (see `get_repo_snapshot`). The watermark is the latest `updated_at` of the synced issues,
+        and the first sync fetches the whole history. Returns the new and updated issues.
+        '''
+        sync_state = get_sync_state()
+        since = sync_state.watermark(repo, 'issues')
+        # The pages are fetched concurrently, so an issue updated meanwhile shifts the others. Newest first,
+        # they shift to the next pages and are fetched twice, while the updated issue is after the watermark
+        params = {'state': 'all', 'sort': 'updated', 'direction': 'desc'}
+        if since is not None:
+            params['since'] = since
+        issues = _unique(self._get_all_items(repo, 'issues', params, comments, **kwargs), lambda issue: issue['number'])
+        sync_state.merge(repo, 'issues', issues, key=lambda issue: issue['number'],
+                         updated=lambda issue: issue['updated_at'], watermark=since)
+        return issues
+
+
+    def sync_repo_commits(self, repo, **kwargs):
+        '''
+        Fetch the commits of a repository committed since the last sync, and merge them into its local snapshot
+        (see `get_repo_snapshot`). The watermark is the latest committer date of the synced commits, so commits
+        pushed with an older date, e.g. by a rebase, are only found by a full sync. Returns the new commits.
+        '''
+        sync_state = get_sync_state()
+        since = sync_state.watermark(repo, 'commits')
+        commits = self._get_all_pages(repo, 'commits', {'since': since} if since is not None else None, **kwargs)
+        commits = _unique(commits, lambda commit: commit['sha'])
+        sync_state.merge(repo, 'commits', commits, key=lambda commit: commit['sha'],
+                         updated=lambda commit: commit['commit']['committer']['date'], watermark=since)
+        return commits
+
+
+    def get_repo_snapshot(self, repo, resource:str):
+        '''Get the local snapshot of the 'issues' or 'commits' of a repository, from the least to the most recently updated'''
+        return get_sync_state().snapshot(repo, resource)
 
 
 
@@ -203,4 +348,190 @@ See how to get you API key by following this link: https://docs.github.com/en/re
         response = self.search_repositories(query, params = {'sort':'stars', 'order':'desc'})
 
         data = response.json()
-        return data.get('items', [])
\ No newline at end of file
+        return data.get('items', [])
+
+
+class AsyncGithubAPI(AsyncBaseRestfulAPI, BaseSearchAPI):
+    """
+    Asyncio variant of `GithubAPI`. The methods are coroutines returning the same data, except that
+    `get_repo_commits` and `get_repo_comments` return the decoded JSON rather than the response. The pages
+    of the listings can be consumed in order as they arrive with the `iter_*` async generators, and once
+    the Link header tells the last page, up to `page_workers` pages are fetched concurrently. The comments
+    of the issues and pull requests are fetched concurrently as well.
+
+    Args:
+        api_key (str): The GitHub API key. Defaults to the GITHUB_API_KEY environment variable.
+        **kwargs: Additional arguments to pass to `AsyncBaseRestfulAPI`, e.g. timeout or max_connections.
+    """
+    base_url: str = 'https://api.github.com/'
+    page_workers: int = GITHUB_PAGE_WORKERS
+    comment_workers: int = GITHUB_COMMENT_WORKERS
+
+    def __init__(self, api_key: str = GITHUB_API_KEY, **kwargs):
+        super().__init__(**kwargs)
+
+        api_key = self._get_api_key(api_key, "GITHUB_API_KEY",
+                                    message = """No API key found for Github API. Please set the GITHUB_API_KEY environment variable.
+See how to get you API key by following this link: https://docs.github.com/en/rest/quickstart?apiVersion=2022-11-28&tool=curl""")
+
+        self.api_key = api_key
+        if GITHUB_CONDITIONAL_REQUESTS:
+            self.http_cache = get_http_cache()
+        self.headers = {
+            "Accept": "application/vnd.github+json",
+            "Authorization": f"Bearer {self.api_key}",
+            "X-GitHub-Api-Version": "2022-11-28"
+        }
+
+    async def get(self, endpoint:str, **kwargs):
+        '''Get method of the Restful API'''
+        kwargs['headers'] = self.headers
+
+        return await super().get(endpoint, **kwargs)
+
+
+    async def _get_repos(self, repo_name:str, endpoint:str, **kwargs):
+
+        if '/' not in repo_name or len(repo_name.split('/')) != 2:
+            raise ValueError(f"repo_name must be in '{{owner}}/{{repo}}' format. Got {repo_name}")
+
+
+        repo_endpoint = f'repos/{repo_name}/{endpoint}'
+        return await self.get(repo_endpoint, **kwargs)
+
+
+    async def _iter_pages(self, repo_name:str, endpoint:str, params = None, **kwargs):
+        '''Yield the pages of a listing in order, 100 items per page, following the Link header of the responses'''
+        params = {'per_page': 100, **(params or {})}
+        semaphore = asyncio.Semaphore(self.page_workers)
+
+        async def get_page(page):
+            async with semaphore:
+                response = await self._get_repos(repo_name, endpoint, params={**params, 'page': page}, **kwargs)
+            response.raise_for_status()
+            return response
+
+        response = await get_page(1)
+        yield response.json()
+        last_page = _page_number(response.links.get('last', {}).get('url'))
+        if last_page is not None and last_page > 1:
+            tasks = [asyncio.ensure_future(get_page(page)) for page in range(2, last_page + 1)]
+            try:
+                for task in tasks:
+                    yield (await task).json()
+            finally:
+                # The consumer may stop before the last page
+                for task in tasks:
+                    task.cancel()
+        else:
+            # The next links carry the query, and may have a cursor rather than a page number
+            while 'next' in response.links:
+                async with semaphore:
+                    response = await self.get(response.links['next']['url'], **kwargs)
+                response.raise_for_status()
+                yield response.json()
+
+
+    async def _get_comments_threads(self, repo_name:str, endpoint:str, items:list):
+        '''
+        Set the `comments_thread` of the issues or pull requests, fetched concurrently up to `comment_workers`
+        at a time. The issues without comments are skipped, and every page of a thread is fetched.
+        '''
+        semaphore = asyncio.Semaphore(self.comment_workers)
+
+        async def get_thread(item):
+            # Only the issues tell their comments count, the pull requests listing does not
+            if endpoint == 'issues' and item.get('comments') == 0:
+                return []
+            async with semaphore:
+                return [comment async for page in self._iter_pages(repo_name, f'{endpoint}/{item["number"]}/comments')
+                        for comment in page]
+
+        threads = await asyncio.gather(*[get_thread(item) for item in items])
+        for item, thread in zip(items, threads):
+            item['comments_thread'] = thread
+        return items
+
+
+    @log_io_to_json
+    async def get_repo_issues(self, repo_name:str, params = None, comments = False, **kwargs):
+        issues = (await self._get_repos(repo_name, 'issues', params = params, **kwargs)).json()
+        if comments:
+            await self._get_comments_threads(repo_name, 'issues', issues)
+        return issues
+
+
+    async def iter_repo_issues(self, repo, params = None, comments = False, **kwargs):
+        '''Async generator of the pages of the issues of a repository'''
+        async for issues in self._iter_pages(repo, 'issues', params, **kwargs):
+            if comments:
+                await self._get_comments_threads(repo, 'issues', issues)
+            yield issues
+
+
+    @log_io_to_json
+    async def get_all_repo_issues(self, repo, params = None, comments = False, **kwargs):
+        return [issue async for page in self.iter_repo_issues(repo, params, comments, **kwargs) for issue in page]
+
+
+    @log_io_to_json
+    async def get_repo_pulls(self, repo_name: str, comments = False, **kwargs):
+        pulls = (await self._get_repos(repo_name, 'pulls', **kwargs)).json()
+        if comments:
+            await self._get_comments_threads(repo_name, 'pulls', pulls)
+        return pulls
+
+
+    async def iter_repo_pull_requests(self, repo, params = None, comments = False, **kwargs):
+        '''Async generator of the pages of the pull requests of a repository'''
+        async for pulls in self._iter_pages(repo, 'pulls', params, **kwargs):
+            if comments:
+                await self._get_comments_threads(repo, 'pulls', pulls)
+            yield pulls
+
+
+    @log_io_to_json
+    async def get_all_repo_pull_requests(self, repo, params = None, comments = False, **kwargs):
+        return [pull async for page in self.iter_repo_pull_requests(repo, params, comments, **kwargs) for pull in page]
+
+
+    @log_io_to_json
+    async def get_repo_commits(self, repo_name: str, **kwargs):
+        return (await self._get_repos(repo_name, 'commits', **kwargs)).json()
+
+
+    def iter_repo_commits(self, repo, params = None, **kwargs):
+        '''Async generator of the pages of the commits of a repository'''
+        return self._iter_pages(repo, 'commits', params, **kwargs)
+
+
+    @log_io_to_json
+    async def get_all_repo_commits(self, repo, params = None, **kwargs):
+        return [commit async for page in self.iter_repo_commits(repo, params, **kwargs) for commit in page]
+
+
+    @log_io_to_json
+    async def get_repo_comments(self, repo_name: str, **kwargs):
+        return (await self._get_repos(repo_name, 'comments', **kwargs)).json()
+
+
+    def iter_repo_comments(self, repo, params = None, **kwargs):
+        '''Async generator of the pages of the commit comments of a repository'''
+        return self._iter_pages(repo, 'comments', params, **kwargs)
+
+
+    @log_io_to_json
+    async def get_all_repo_comments(self, repo, params = None, **kwargs):
+        return [comment async for page in self.iter_repo_comments(repo, params, **kwargs) for comment in page]
+
+
+    async def search(self, endpoint, query, **kwargs):
+
+        response = await self.get(f"search/{endpoint}?q={query}", **kwargs)
+        return response
+
+
+    async def search_repositories(self, query, **kwargs):
+
+        response = await self.search('repositories', query, **kwargs)
+        return response
\ No newline at end of file
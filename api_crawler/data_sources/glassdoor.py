@@ -93,7 +93,7 @@ class Glassdoor(BaseSearchAPI, BaseSeleniumAPI):
     def search(self, job_title: str, **kwargs):
         
         search_url = Glassdoor.create_job_search_url(job_title, **kwargs)
-        self.driver.get(search_url)
+        self.navigate(search_url)
 
         wait = WebDriverWait(self.driver, 10)
 
@@ -120,7 +120,7 @@ class Glassdoor(BaseSearchAPI, BaseSeleniumAPI):
         if not url or not isinstance(url, str):
             return None
 
-        self.driver.get(url)
+        self.navigate(url)
 
         show_more_button = self.driver.find_element(By.XPATH, "//button[starts-with(@class, 'JobDetails_showMore__')]")
         show_more_button.click()
@@ -84,7 +84,7 @@ class IndeedAPI(BaseSeleniumAPI, BaseSearchAPI):
         """
 
         url = self.create_job_search_url(search_query, location, start_from, **kwargs)
-        self.driver.get(url)
+        self.navigate(url)
 
         if any(phrase in self.driver.page_source for phrase in [
             "Verify you are human by completing the action below",
@@ -177,7 +177,7 @@ class IndeedAPI(BaseSeleniumAPI, BaseSearchAPI):
 
     def _get_full_job_description(self, url:str):
 
-        self.driver.get(url)
+        self.navigate(url)
 
         page_source  = self.driver.page_source
         soup = BeautifulSoup(page_source, 'html.parser')
@@ -1,13 +1,33 @@
 from bs4 import BeautifulSoup
-from ._base import BaseRestfulAPI
+from ._base import BaseRestfulAPI, AsyncBaseRestfulAPI
 from ..data_lake.logger import log_io_to_json
-import warnings
-import time
 
 
+JOB_SEARCH_ENDPOINT = 'jobs-guest/jobs/api/seeMoreJobPostings/search'
+
+
+def parse_job_posting(result) -> dict:
+    '''Extract the details of a job posting from an item of the job search results'''
+    title = result.find('h3', class_='base-search-card__title')
+    company = result.find('h4', class_='base-search-card__subtitle')
+    location = result.find('span', class_='job-search-card__location')
+    time_element = result.find('time')
+    link = result.find('a', class_='base-card__full-link')
+
+    return {
+        'title': title.text.strip() if title else None,
+        'company': company.text.strip() if company else None,
+        'location': location.text.strip() if location else None,
+        'time': time_element.get('datetime') if time_element else None,
+        'link': link.get('href') if link else None
+    }
+
 
 class LinkedInAPI(BaseRestfulAPI):
     base_url:str = 'https://www.linkedin.com/'
+    # LinkedIn blocks the guest job searches sent faster than a page every 10 seconds
+    rate_limit: tuple = (1, 10)
+    cache_ttl: float = 3600
 
 
     def __init__(self):
@@ -76,10 +96,9 @@ class LinkedInAPI(BaseRestfulAPI):
     
     def search(self, search_query: str, **kwargs):
     
-        endpoint = 'jobs-guest/jobs/api/seeMoreJobPostings/search'
         params = self.create_job_search_params(search_query, **kwargs)
 
-        soup = self.get(endpoint, params=params)
+        soup = self.get(JOB_SEARCH_ENDPOINT, params=params)
         return soup
 
 
@@ -99,23 +118,67 @@ class LinkedInAPI(BaseRestfulAPI):
                 if len(job_listings) >= n_listings:
                     break  # Stop if we have enough listings
 
-                title = result.find('h3', class_='base-search-card__title')
-                company = result.find('h4', class_='base-search-card__subtitle')
-                location = result.find('span', class_='job-search-card__location')
-                time_element = result.find('time')
-                link = result.find('a', class_='base-card__full-link')
+                job_listings.append(parse_job_posting(result))
+
+            start += len(results_list)  # Move to the next page
+
+        return job_listings
+
+
 
-                result_dict = {
-                    'title': title.text.strip() if title else None,
-                    'company': company.text.strip() if company else None,
-                    'location': location.text.strip() if location else None,
-                    'time': time_element.get('datetime') if time_element else None,
-                    'link': link.get('href') if link else None
-                }
+class AsyncLinkedInAPI(AsyncBaseRestfulAPI):
+    """
+    Asyncio variant of `LinkedInAPI`. The methods are coroutines returning the same data, and the pages of
+    the job search results can be consumed as they arrive with `iter_job_postings`.
 
-                job_listings.append(result_dict)
+    Args:
+        **kwargs: Additional arguments to pass to `AsyncBaseRestfulAPI`, e.g. timeout or max_connections.
+    """
+    base_url:str = LinkedInAPI.base_url
+    rate_limit: tuple = LinkedInAPI.rate_limit
+    cache_ttl: float = LinkedInAPI.cache_ttl
+    create_job_search_params = staticmethod(LinkedInAPI.create_job_search_params)
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+
+
+    async def get(self, endpoint, **kwargs):
+        response = await super().get(endpoint, **kwargs)
+        soup = BeautifulSoup(response.content, 'html.parser')
+        return soup
+
+
+    async def search(self, search_query: str, **kwargs):
+        params = self.create_job_search_params(search_query, **kwargs)
+
+        soup = await self.get(JOB_SEARCH_ENDPOINT, params=params)
+        return soup
+
+
+    async def iter_job_postings(self, search_query: str, **kwargs):
+        '''Async generator of the pages of job postings matching a search, until no more results are found'''
+        start = 0
+
+        while True:
+            soup = await self.search(search_query, start=start, **kwargs)
+            results_list = soup.find_all('li')
+
+            if not results_list:
+                break
+
+            yield [parse_job_posting(result) for result in results_list]
+
+            start += len(results_list)  # Move to the next page
+
+
+    @log_io_to_json
+    async def get_job_postings_data(self, search_query: str, n_listings=10, **kwargs):
+        job_listings = []
 
-            start += len(results_list)
-            time.sleep(10)  # Move to the next page
+        async for page in self.iter_job_postings(search_query, **kwargs):
+            job_listings.extend(page[:n_listings - len(job_listings)])
+            if len(job_listings) >= n_listings:
+                break  # Stop if we have enough listings
 
-        return job_listings
\ No newline at end of file
+        return job_listings
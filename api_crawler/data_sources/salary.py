@@ -6,6 +6,8 @@ import requests
 
 class SalaryAPI(BaseRestfulAPI):
     base_url = "https://salary.com"
+    # The salary calculator pages change rarely, so they are served from the HTTP cache for a day
+    cache_ttl = 86400
 
 
     def __init__(self):
@@ -76,9 +76,7 @@ class GoogleJobs(BaseSerpAPI):
     @log_io_to_json
     def search_job_postings(self, search_query: str, **kwargs):
         response = super().get(q=search_query, **kwargs)
-        
-        if 200 <= response.status_code < 300:
-            return response.json()
-        else:
-            error_message = f"Request failed with status code: {response.status_code}"
-            return {"error": error_message}
\ No newline at end of file
+
+        # The transient errors were already retried, the remaining ones are logged as errors of the call
+        response.raise_for_status()
+        return response.json()
\ No newline at end of file
@@ -1,4 +1,4 @@
-from ._base import BaseSearchAPI, BaseRestfulAPI
+from ._base import BaseSearchAPI, BaseRestfulAPI, AsyncBaseRestfulAPI
 from ..data_lake.logger import log_io_to_json
 import youtubesearchpython as yts
 from ..exceptions import NoAPIKeyException
@@ -12,6 +12,33 @@ import warnings
 YOUTUBE_API_KEY = config('YOUTUBE_API_KEY', None)
 
 
+def comment_threads_params(video_id:str, max_results:int = 20, include_replies:bool = True, order = 'relevance',
+                           text_format = 'plainText', search_terms:str = None, **kwargs) -> dict:
+    '''Validate the arguments of a commentThreads request and build its parameters'''
+    if order not in ['relevance', 'time']:
+        raise ValueError("Order must be either 'relevance' or 'time'")
+
+    if text_format not in ['html', 'plainText']:
+        raise ValueError("textFormat must be either 'html' or 'plainText'")
+
+    part = 'snippet, replies' if include_replies else 'snippet'
+
+
+    params = {'videoId': video_id, 'part': part,
+              'maxResults': max_results, 'order':order,
+              'textFormat':text_format, 'searchTerms':search_terms,
+              **kwargs
+              }
+
+    # Remove None values
+    return {k: v for k, v in params.items() if v is not None}
+
+
+def comments_text(api_response: dict) -> list:
+    '''Get the original text of the top level comments of a commentThreads response'''
+    return [comment.get('snippet',{}).get('topLevelComment',{}).get('snippet',{}).get('textOriginal','') for comment in api_response.get('items',{})]
+
+
 class YoutubeAPI(BaseRestfulAPI, BaseSearchAPI):
     base_url: str = 'https://www.googleapis.com/youtube/v3/'
     api_error_message: str = "An API key is necessary for this method. Please visit the YouTube Data API v3 to obtain one: https://developers.google.com/youtube/v3/"
@@ -103,29 +130,13 @@ Please set the YOUTUBE_API_KEY environment variable using os.environ['YOUTUBE_AP
         '''Get comments from a given YouTube video. Comment replies not included'''
         self._check_api_key()
 
-        if order not in ['relevance', 'time']:
-            raise ValueError("Order must be either 'relevance' or 'time'")
-
-        if text_format not in ['html', 'plainText']:
-            raise ValueError("textFormat must be either 'html' or 'plainText'")
-
-        part = 'snippet, replies' if include_replies else 'snippet'
-
-
-        params = {'videoId': video_id, 'part': part,
-                  'maxResults': max_results, 'order':order,
-                  'textFormat':text_format, 'searchTerms':search_terms,
-                  **kwargs
-                  }
-
-        # Remove None values
-        params = {k: v for k, v in params.items() if v is not None}
+        params = comment_threads_params(video_id, max_results, include_replies, order, text_format, search_terms, **kwargs)
 
         if include_metadata:
             response = self.get('commentThreads', params = params).json()
         else:
             api_response = self.get('commentThreads', params = params).json()
-            response = [comment.get('snippet',{}).get('topLevelComment',{}).get('snippet',{}).get('textOriginal','') for comment in api_response.get('items',{})]
+            response = comments_text(api_response)
      
         return response
 
@@ -185,4 +196,108 @@ Please set the YOUTUBE_API_KEY environment variable using os.environ['YOUTUBE_AP
             if not next_page_token:
                 break
                 
-        return all_comments
\ No newline at end of file
+        return all_comments
+
+
+class AsyncYoutubeAPI(AsyncBaseRestfulAPI):
+    """
+    Asyncio variant of the YouTube Data API methods of `YoutubeAPI`. The methods are coroutines returning
+    the same data, and the pages of the comments can be consumed as they arrive with the `iter_*` async
+    generators. The methods backed by youtube-search-python, e.g. `search` or `get_transcript`, are only
+    available on `YoutubeAPI`.
+
+    Args:
+        api_key (str): The YouTube Data API v3 key. Defaults to the YOUTUBE_API_KEY environment variable.
+        **kwargs: Additional arguments to pass to `AsyncBaseRestfulAPI`, e.g. timeout or max_connections.
+    """
+    base_url: str = YoutubeAPI.base_url
+    api_error_message: str = YoutubeAPI.api_error_message
+
+    def __init__(self, api_key: str = YOUTUBE_API_KEY, **kwargs):
+
+        api_key = self._get_api_key(api_key, "YOUTUBE_API_KEY",
+                                    action='warn',
+                                    message="""No Youtube V3 API key provided. Some methods may not work.
+Please set the YOUTUBE_API_KEY environment variable using os.environ['YOUTUBE_API_KEY'] or pass it to the object via the api_key parameter.""")
+
+        self.api_key = api_key
+        super().__init__(**kwargs)
+
+
+    _check_api_key = YoutubeAPI._check_api_key
+
+
+    async def get(self, endpoint, params=None, **kwargs):
+        if params is None:
+            params = {}
+        params['key'] = self.api_key
+        return await super().get(endpoint, params=params, **kwargs)
+
+
+    @log_io_to_json
+    async def get_comments(self, video_id:str, max_results:int = 20, include_replies:bool = True, order = 'relevance',
+                           text_format = 'plainText', search_terms:str = None, include_metadata:bool = False, **kwargs):
+        '''Get comments from a given YouTube video. Comment replies not included'''
+        self._check_api_key()
+
+        params = comment_threads_params(video_id, max_results, include_replies, order, text_format, search_terms, **kwargs)
+        api_response = (await self.get('commentThreads', params = params)).json()
+
+        return api_response if include_metadata else comments_text(api_response)
+
+
+    async def iter_comments(self, video_id:str, **kwargs):
+        '''Async generator of the pages of the comment threads of a given YouTube video, with their metadata'''
+        self._check_api_key()
+
+        next_page_token = None
+        while True:
+            response = await self.get_comments(video_id, max_results=100, pageToken=next_page_token, include_metadata = True, **kwargs)
+            yield response.get('items', [])
+            next_page_token = response.get('nextPageToken')
+
+            if not next_page_token:
+                break
+
+
+    @log_io_to_json
+    async def get_all_comments(self, video_id:str, include_metadata:bool = False, **kwargs):
+        '''Get all comments from a given YouTube video. Replies not included'''
+        all_comments = [comment async for page in self.iter_comments(video_id, **kwargs) for comment in page]
+
+        if include_metadata:
+            return all_comments
+        else:
+            return [comment['snippet']['topLevelComment']['snippet']['textDisplay'] for comment in all_comments]
+
+
+    @log_io_to_json
+    async def get_comment_replies(self, comment_id:str, max_results:int = 20, **kwargs):
+        self._check_api_key()
+
+        params = {'parentId': comment_id, 'part': 'snippet',
+                  'maxResults': max_results, **kwargs}
+
+        comments_response = await self.get('comments', params = params)
+
+        return comments_response.json()
+
+
+    async def iter_comment_replies(self, comment_id: str, **kwargs):
+        '''Async generator of the pages of the replies to a given YouTube comment'''
+        self._check_api_key()
+
+        next_page_token = None
+        while True:
+            response = await self.get_comment_replies(comment_id, max_results=100, pageToken=next_page_token, **kwargs)
+            yield response.get('items', [])
+            next_page_token = response.get('nextPageToken')
+
+            if not next_page_token:
+                break
+
+
+    @log_io_to_json
+    async def get_all_comment_replies(self, comment_id: str, **kwargs):
+        '''Retrieve all replies from a given YouTube comment'''
+        return [reply async for page in self.iter_comment_replies(comment_id, **kwargs) for reply in page]
\ No newline at end of file
@@ -18,4 +18,21 @@ class NoAPIKeyException(Exception):
     """Exception raised when no API key is provided."""
     def __init__(self, message="No API key provided."):
         self.message = message
+        super().__init__(self.message)
+
+
+
+class OfflineCacheMissException(Exception):
+    """Exception raised when the HTTP cache is offline and has no response for a request."""
+    def __init__(self, message="No cached response for the request, and the HTTP cache is offline."):
+        self.message = message
+        super().__init__(self.message)
+
+
+
+class GraphQLException(Exception):
+    """Exception raised when a GraphQL query returns errors."""
+    def __init__(self, errors, message="The GraphQL query returned errors"):
+        self.errors = errors
+        self.message = f"{message}: {'; '.join(error.get('message', str(error)) for error in errors)}"
         super().__init__(self.message)
\ No newline at end of file
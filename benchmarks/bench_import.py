@@ -0,0 +1,45 @@
+"""
+Benchmark of the import time of api_crawler, measured in fresh interpreters.
+
+Importing the package used to import every data source, and therefore selenium, praw, apify_client,
+youtubesearchpython and GoogleNews. The sources are now loaded on first access; loading all of them
+reproduces the previous eager import.
+
+Usage:
+    python benchmarks/bench_import.py [--runs 10]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+
+STATEMENTS = {
+    'import api_crawler': 'import api_crawler',
+    'from api_crawler import GithubAPI': 'from api_crawler import GithubAPI',
+    'from api_crawler.data_lake import log_io_to_json': 'from api_crawler.data_lake import log_io_to_json',
+    'every source (previous eager import)': 'import api_crawler; [getattr(api_crawler, name) for name in api_crawler.__all__]',
+}
+
+
+def import_time(statement: str) -> float:
+    code = f"import time; start = time.perf_counter(); {statement}; print(time.perf_counter() - start)"
+    # LAKES_BASE_DIR is not needed to import the package
+    env = {key: value for key, value in os.environ.items() if key != 'LAKES_BASE_DIR'}
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, env=env, check=True)
+    return float(result.stdout)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10, help='Number of interpreters started per statement.')
+    args = parser.parse_args()
+
+    for name, statement in STATEMENTS.items():
+        times = [import_time(statement) for _ in range(args.runs)]
+        print(f"{name:50} {statistics.median(times) * 1000:8.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""
+Micro-benchmark of the serialization of lake records.
+
+Compares the previous serializer, which probed every leaf with `json.dumps` before encoding the whole
+payload again, with the single-pass `dumps` of `api_crawler.data_lake.serialization`, using the
+standard library and the orjson backends.
+
+Usage:
+    pip install -e .[fast]
+    python benchmarks/bench_serialization.py
+"""
+import json
+import timeit
+from datetime import datetime, timedelta
+from decouple import config
+from api_crawler.data_lake import serialization
+
+
+def legacy_serialize_data(data):
+    if isinstance(data, (dict, list, tuple)):
+        if isinstance(data, dict):
+            return {key: legacy_serialize_data(value) for key, value in data.items()}
+        else:
+            return [legacy_serialize_data(item) for item in data]
+    try:
+        json.dumps(data)
+        return data
+    except (TypeError, ValueError):
+        return str(data)
+
+
+def legacy_dumps(data) -> bytes:
+    return json.dumps(legacy_serialize_data(data)).encode()
+
+
+def youtube_comment_threads(n: int) -> list:
+    return [{
+        'kind': 'youtube#commentThread',
+        'etag': f'etag-{i}',
+        'id': f'thread-{i}',
+        'snippet': {
+            'channelId': 'UC_x5XG1OV2P6uZZ5FSM9Ttw',
+            'videoId': 'dQw4w9WgXcQ',
+            'topLevelComment': {
+                'kind': 'youtube#comment',
+                'id': f'comment-{i}',
+                'snippet': {
+                    'textDisplay': f'Great video, thanks! Comment number {i}',
+                    'textOriginal': f'Great video, thanks! Comment number {i}',
+                    'authorDisplayName': f'@user{i}',
+                    'authorProfileImageUrl': f'https://yt3.ggpht.com/user{i}.jpg',
+                    'canRate': True,
+                    'viewerRating': 'none',
+                    'likeCount': i % 97,
+                    'publishedAt': '2024-05-01T12:00:00Z',
+                    'updatedAt': '2024-05-01T12:00:00Z',
+                },
+            },
+            'canReply': True,
+            'totalReplyCount': i % 5,
+            'isPublic': True,
+        },
+    } for i in range(n)]
+
+
+def job_postings(n: int) -> list:
+    posted = datetime(2024, 5, 1)
+    return [{
+        'title': 'Data Scientist',
+        'company': f'Company {i}',
+        'location': 'New York, NY',
+        'time': posted - timedelta(days=i % 30),
+        'link': f'https://www.linkedin.com/jobs/view/{i}',
+        'tags': ('python', 'sql', 'remote'),
+    } for i in range(n)]
+
+
+PAYLOADS = {
+    '10k YouTube comment threads': youtube_comment_threads(10000),
+    '10k job postings with datetimes': job_postings(10000),
+}
+
+
+def bench(function, payload, number: int = 5) -> float:
+    return min(timeit.repeat(lambda: function(payload), number=1, repeat=number))
+
+
+def main():
+    for name, payload in PAYLOADS.items():
+        print(name)
+        legacy = bench(legacy_dumps, payload)
+        print(f"  legacy serialize_data + json.dumps: {legacy * 1000:8.1f} ms")
+
+        serialization.LAKE_JSON_BACKEND = 'json'
+        single_pass = bench(serialization.dumps, payload)
+        print(f"  single pass (json):                 {single_pass * 1000:8.1f} ms  x{legacy / single_pass:.1f}")
+
+        if serialization.orjson is not None:
+            serialization.LAKE_JSON_BACKEND = 'orjson'
+            single_pass = bench(serialization.dumps, payload)
+            print(f"  single pass (orjson):               {single_pass * 1000:8.1f} ms  x{legacy / single_pass:.1f}")
+        serialization.LAKE_JSON_BACKEND = config("LAKE_JSON_BACKEND", default="auto")
+
+
+if __name__ == '__main__':
+    main()
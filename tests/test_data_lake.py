@@ -0,0 +1,765 @@
+import os
+import asyncio
+import json
+import warnings
+import tempfile
+import io
+import multiprocessing
+import time
+import pytest
+
+os.environ.setdefault('LAKES_BASE_DIR', tempfile.mkdtemp())
+
+from api_crawler.data_lake import logger
+from api_crawler.data_lake import (log_io_to_json, read_log, iter_log, LakeWriter, LakeIndex, BlobStore, merge_shards,
+                                  collect_garbage, bypass_cache, set_log_level)
+from api_crawler.data_lake import serialization
+from api_crawler.data_lake.storage import iter_json_array, append_entries
+from api_crawler.data_lake.partitions import partition_file_path
+from api_crawler.data_lake.reader import select_lake_files
+
+
+class DummyAPI:
+    @log_io_to_json
+    def get(self, query, page=1):
+        return {'query': query, 'page': page}
+
+    @log_io_to_json
+    def fail(self, query):
+        raise ValueError(f"Could not fetch {query}")
+
+
+@pytest.fixture
+def lake_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(logger, 'LAKES_BASE_DIR', str(tmp_path))
+    return tmp_path
+
+
+@pytest.fixture(params=['json', 'jsonl'])
+def lake_format(request, monkeypatch):
+    monkeypatch.setattr(logger, 'LAKE_FORMAT', request.param)
+    return request.param
+
+
+
+def test_log_io_to_json_appends_records(lake_dir, lake_format):
+    api = DummyAPI()
+    for page in range(1, 4):
+        api.get('python', page=page)
+
+    records = read_log(str(lake_dir / f'DummyAPI_get.{lake_format}'))
+
+    assert len(records) == 3
+    assert [record['output']['page'] for record in records] == [1, 2, 3]
+    assert records[0]['input']['args']['query'] == 'python'
+    assert all(record['error'] is False for record in records)
+
+
+
+def test_log_io_to_json_logs_errors(lake_dir, lake_format):
+    api = DummyAPI()
+    with pytest.raises(ValueError):
+        api.fail('python')
+
+    records = read_log(str(lake_dir / f'DummyAPI_fail.{lake_format}'))
+
+    assert len(records) == 1
+    assert records[0]['error'] is True
+    assert records[0]['error_log'] == 'Could not fetch python'
+
+
+
+def test_jsonl_format_writes_one_record_per_line(lake_dir, monkeypatch):
+    monkeypatch.setattr(logger, 'LAKE_FORMAT', 'jsonl')
+    api = DummyAPI()
+    api.get('python')
+    api.get('rust')
+
+    with open(lake_dir / 'DummyAPI_get.jsonl') as f:
+        lines = f.read().splitlines()
+
+    assert len(lines) == 2
+    assert json.loads(lines[1])['output']['query'] == 'rust'
+
+
+
+def test_read_log_skips_truncated_last_line(lake_dir):
+    file_path = lake_dir / 'DummyAPI_get.jsonl'
+    file_path.write_text('{"id": "1"}\n{"id": "2"}\n{"id": "3", "outp')
+
+    assert [record['id'] for record in read_log(str(file_path))] == ['1', '2']
+
+
+
+def test_async_writes_are_flushed(lake_dir, lake_format):
+    writer = logger.enable_async_writes(flush_interval=60, batch_size=1000)
+    try:
+        api = DummyAPI()
+        for page in range(10):
+            api.get('python', page=page)
+
+        assert logger.flush_lake(timeout=5)
+        records = read_log(str(lake_dir / f'DummyAPI_get.{lake_format}'))
+        assert [record['output']['page'] for record in records] == list(range(10))
+        assert writer.written == 10
+    finally:
+        logger.disable_async_writes()
+
+
+
+def test_lake_writer_writes_in_batches_and_on_close(tmp_path):
+    writer = LakeWriter(flush_interval=60, batch_size=3, max_queue_size=2, fsync='close')
+    file_path = str(tmp_path / 'DummyAPI_get.jsonl')
+    for i in range(7):
+        writer.submit(file_path, {'id': i}, 'jsonl')
+    writer.close(timeout=5)
+
+    assert [record['id'] for record in read_log(file_path)] == list(range(7))
+    with pytest.raises(RuntimeError):
+        writer.submit(file_path, {'id': 7}, 'jsonl')
+
+
+
+def _write_pages(lake_dir, lake_format, sharding, n_pages):
+    logger.LAKES_BASE_DIR = lake_dir
+    logger.LAKE_FORMAT = lake_format
+    logger.LAKE_SHARDING = sharding
+    api = DummyAPI()
+    for page in range(n_pages):
+        api.get('python', page=page)
+
+
+@pytest.mark.parametrize('sharding', ['none', 'process'])
+def test_concurrent_processes_do_not_lose_records(lake_dir, lake_format, sharding):
+    context = multiprocessing.get_context('fork')
+    workers = [context.Process(target=_write_pages, args=(str(lake_dir), lake_format, sharding, 20)) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    file_path = str(lake_dir / f'DummyAPI_get.{lake_format}')
+    assert len(read_log(file_path)) == 80
+
+    if sharding == 'process':
+        assert not os.path.exists(file_path)
+        assert merge_shards(file_path) == 80
+        assert len(read_log(file_path)) == 80
+        assert not any(name.endswith(lake_format) and name.count('.') > 1 for name in os.listdir(lake_dir))
+
+
+
+def test_corrupt_json_array_is_moved_aside(lake_dir, monkeypatch):
+    monkeypatch.setattr(logger, 'LAKE_FORMAT', 'json')
+    (lake_dir / 'DummyAPI_get.json').write_text('[{"id": "1"}, {"id": "2"')
+
+    with pytest.warns(UserWarning):
+        DummyAPI().get('python')
+
+    assert len(read_log(str(lake_dir / 'DummyAPI_get.json'))) == 1
+    assert any(name.startswith('DummyAPI_get.json.corrupt-') for name in os.listdir(lake_dir))
+
+
+
+@pytest.mark.parametrize('max_records, max_bytes', [(4, 0), (0, 400)])
+def test_rotation_compresses_closed_segments(lake_dir, lake_format, monkeypatch, max_records, max_bytes):
+    monkeypatch.setattr(logger, 'LAKE_ROTATE_MAX_RECORDS', max_records)
+    monkeypatch.setattr(logger, 'LAKE_ROTATE_MAX_BYTES', max_bytes)
+    api = DummyAPI()
+    for page in range(10):
+        api.get('python', page=page)
+
+    segments = [name for name in os.listdir(lake_dir) if name.endswith('.gz')]
+    assert len(segments) >= 2
+    assert all(name.startswith('DummyAPI_get.seg-') for name in segments)
+
+    records = read_log(str(lake_dir / f'DummyAPI_get.{lake_format}'))
+    assert [record['output']['page'] for record in records] == list(range(10))
+
+    if max_records:
+        for segment in segments:
+            assert len(read_log(str(lake_dir / segment))) == 4
+
+
+
+def test_daily_rotation(lake_dir, monkeypatch):
+    monkeypatch.setattr(logger, 'LAKE_FORMAT', 'jsonl')
+    monkeypatch.setattr(logger, 'LAKE_ROTATE_DAILY', True)
+    monkeypatch.setattr(logger, 'LAKE_COMPRESS_SEGMENTS', False)
+    api = DummyAPI()
+    api.get('python')
+    api.get('python')
+    yesterday = time.time() - 86400
+    os.utime(lake_dir / 'DummyAPI_get.jsonl', (yesterday, yesterday))
+    api.get('rust')
+
+    segments = [name for name in os.listdir(lake_dir) if '.seg-' in name and not name.endswith('.lock')]
+    assert len(segments) == 1
+    assert len(read_log(str(lake_dir / segments[0]))) == 2
+    assert len(read_log(str(lake_dir / 'DummyAPI_get.jsonl'))) == 3
+
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 1 << 16])
+def test_iter_json_array_streams_elements(chunk_size):
+    elements = [{'id': i, 'output': {'text': 'x' * i, 'values': [1.5, None, True]}} for i in range(50)] + [123, "a]b"]
+    f = io.StringIO(json.dumps(elements, indent=1))
+
+    assert list(iter_json_array(f, chunk_size=chunk_size)) == elements
+
+
+
+def test_iter_json_array_reads_numbers_cut_by_a_chunk():
+    text = '[12.5, 3, -0.25e3, 7]'
+    for chunk_size in range(1, len(text) + 1):
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            assert list(iter_json_array(io.StringIO(text), chunk_size=chunk_size)) == [12.5, 3, -250.0, 7]
+
+
+
+def test_iter_json_array_stops_at_truncated_element():
+    f = io.StringIO('[{"id": 1}, {"id": 2}, {"id": 3, "out')
+
+    with pytest.warns(UserWarning):
+        assert list(iter_json_array(f, chunk_size=4)) == [{'id': 1}, {'id': 2}]
+
+
+def test_iter_json_array_stops_at_trailing_garbage():
+    text = '[1, 2 x'
+    for chunk_size in range(1, len(text) + 1):
+        with pytest.warns(UserWarning):
+            assert list(iter_json_array(io.StringIO(text), chunk_size=chunk_size)) == [1, 2]
+
+
+def test_iter_log_filters_records(lake_dir, lake_format, monkeypatch):
+    monkeypatch.setattr(logger, 'LAKE_ROTATE_MAX_RECORDS', 3)
+    api = DummyAPI()
+    for page in range(5):
+        api.get('python', page=page)
+    with pytest.raises(ValueError):
+        api.fail('python')
+
+    file_path = str(lake_dir / f'DummyAPI_get.{lake_format}')
+    assert [record['output']['page'] for record in iter_log(file_path)] == list(range(5))
+    assert len(list(iter_log(str(lake_dir)))) == 6
+    assert [record['function'] for record in iter_log(str(lake_dir), error=True)] == ['DummyAPI.fail']
+    assert len(list(iter_log(str(lake_dir), function='DummyAPI.get', error=False))) == 5
+    assert list(iter_log(str(lake_dir), start_time='9999-01-01')) == []
+    assert list(iter_log(str(lake_dir), end_time='2000-01-01')) == []
+
+
+
+def test_lake_index_finds_records_across_segments(lake_dir, lake_format, monkeypatch):
+    monkeypatch.setattr(logger, 'LAKE_INDEX', True)
+    monkeypatch.setattr(logger, 'LAKE_ROTATE_MAX_RECORDS', 4)
+    api = DummyAPI()
+    for page in range(10):
+        api.get('python' if page % 2 else 'rust', page=page)
+    with pytest.raises(ValueError):
+        api.fail('python')
+
+    index = logger.get_lake_index()
+    assert len(index.query(function='DummyAPI.get')) == 10
+
+    records = list(index.fetch(function='DummyAPI.get', args={'query': 'python'}))
+    assert [record['output']['page'] for record in records] == [1, 3, 5, 7, 9]
+    assert [record['function'] for record in index.fetch(error=True)] == ['DummyAPI.fail']
+    assert index.query(args={'query': 'python', 'page': 3})[0]['args_hash'] == \
+        index.query(function='DummyAPI.get', args={'page': 3})[0]['args_hash']
+    assert index.query(start_time='9999-01-01') == []
+    index.close()
+
+
+
+def test_lake_index_indexes_existing_files(lake_dir, monkeypatch):
+    monkeypatch.setattr(logger, 'LAKE_FORMAT', 'jsonl')
+    api = DummyAPI()
+    for page in range(5):
+        api.get('python', page=page)
+
+    index = LakeIndex(str(lake_dir / 'lake_index.sqlite'))
+    assert index.index_directory(str(lake_dir)) == 5
+    assert [record['output']['page'] for record in index.fetch(args={'page': 2})] == [2]
+    index.close()
+
+
+
+def test_deduplicated_outputs_are_stored_once(lake_dir, lake_format, monkeypatch):
+    monkeypatch.setattr(logger, 'LAKE_DEDUPLICATE', True)
+    monkeypatch.setattr(logger, 'LAKE_DEDUPLICATE_MIN_BYTES', 0)
+    api = DummyAPI()
+    for _ in range(5):
+        api.get('python')
+    api.get('rust')
+
+    file_path = str(lake_dir / f'DummyAPI_get.{lake_format}')
+    raw_records = list(iter_log(file_path, resolve_blobs=False))
+    assert all(record['output'] is None for record in raw_records)
+    assert len({record['output_blob'] for record in raw_records}) == 2
+    assert len(list(BlobStore(str(lake_dir / 'blobs')).digests())) == 2
+
+    assert [record['output']['query'] for record in read_log(file_path)] == ['python'] * 5 + ['rust']
+    assert [record['output']['query'] for record in iter_log(str(lake_dir))] == ['python'] * 5 + ['rust']
+
+
+
+def test_collect_garbage_deletes_unreferenced_blobs(lake_dir, monkeypatch):
+    monkeypatch.setattr(logger, 'LAKE_FORMAT', 'jsonl')
+    monkeypatch.setattr(logger, 'LAKE_DEDUPLICATE', True)
+    monkeypatch.setattr(logger, 'LAKE_DEDUPLICATE_MIN_BYTES', 0)
+    DummyAPI().get('python')
+    orphan = logger.get_blob_store().put({'orphan': True})
+
+    assert collect_garbage(str(lake_dir)) == []
+    assert collect_garbage(str(lake_dir), min_age=0, dry_run=True) == [orphan]
+    assert collect_garbage(str(lake_dir), min_age=0) == [orphan]
+    assert len(read_log(str(lake_dir / 'DummyAPI_get.jsonl'))) == 1
+
+
+
+class CountingAPI:
+    def __init__(self):
+        self.calls = 0
+
+    @log_io_to_json
+    def get(self, query, page=1):
+        self.calls += 1
+        return {'query': query, 'page': page, 'items': []}
+
+
+@pytest.fixture
+def response_cache(lake_dir):
+    cache = logger.enable_response_cache(default_ttl=60)
+    yield cache
+    logger.disable_response_cache()
+
+
+
+def test_response_cache_memoizes_calls(lake_dir, response_cache):
+    api = CountingAPI()
+    first = api.get('python')
+    first['items'].append('modified by the caller')
+
+    assert api.get('python') == {'query': 'python', 'page': 1, 'items': []}
+    assert api.get(query='python', page=1)['page'] == 1
+    api.get('python', page=2)
+
+    assert api.calls == 2
+    assert response_cache.stats('CountingAPI.get') == {'hits': 2, 'memory_hits': 2, 'disk_hits': 0,
+                                                       'misses': 2, 'bypasses': 0}
+    assert len(read_log(str(lake_dir / 'CountingAPI_get.json'))) == 2
+
+    # A new process only finds the results in the on-disk tier
+    other_cache = logger.enable_response_cache(default_ttl=60)
+    assert api.get('python') == {'query': 'python', 'page': 1, 'items': []}
+    assert api.calls == 2
+    assert other_cache.stats()['disk_hits'] == 1
+
+
+
+def test_response_cache_bypass_ttl_and_invalidation(lake_dir, response_cache):
+    api = CountingAPI()
+    api.get('python')
+    with bypass_cache():
+        api.get('python')
+    assert api.calls == 2
+    assert response_cache.stats()['bypasses'] == 1
+
+    response_cache.invalidate('CountingAPI.get', args={'query': 'python', 'page': 1})
+    api.get('python')
+    assert api.calls == 3
+
+    response_cache.set_ttl('CountingAPI.get', 0)
+    api.get('python')
+    assert api.calls == 4
+
+    response_cache.set_ttl('CountingAPI.get', 0.01)
+    api.get('rust')
+    time.sleep(0.05)
+    api.get('rust')
+    assert api.calls == 6
+
+    response_cache.invalidate()
+    api.get('rust')
+    assert api.calls == 7
+
+
+
+class PaginatedAPI:
+    @log_io_to_json
+    def get_page(self, page):
+        return [f'item-{page}-{i}' for i in range(2)]
+
+    @log_io_to_json
+    def get_all(self, n_pages=3):
+        items = []
+        for page in range(n_pages):
+            items.extend(self.get_page(page))
+        return items
+
+
+
+@pytest.mark.parametrize('policy, n_pages, n_parents', [('all', 3, 1), ('outermost', 0, 1), ('children', 3, 0), ('linked', 3, 1)])
+def test_nested_calls_policies(lake_dir, monkeypatch, policy, n_pages, n_parents):
+    monkeypatch.setattr(logger, 'LAKE_FORMAT', 'jsonl')
+    monkeypatch.setattr(logger, 'LAKE_NESTED_CALLS', policy)
+    api = PaginatedAPI()
+    assert len(api.get_all()) == 6
+    assert len(api.get_page(7)) == 2
+
+    pages = list(iter_log(str(lake_dir), function='PaginatedAPI.get_page'))
+    parents = list(iter_log(str(lake_dir), function='PaginatedAPI.get_all'))
+    assert len(pages) == n_pages + 1
+    assert len(parents) == n_parents
+    assert 'parent_id' not in pages[-1]
+
+    if policy in ['all', 'linked']:
+        assert all(page['parent_id'] == parents[0]['id'] for page in pages[:-1])
+    if policy == 'linked':
+        assert parents[0]['output'] is None and parents[0]['output_in_children'] is True
+    if policy == 'all':
+        assert len(parents[0]['output']) == 6
+
+
+
+class AsyncPaginatedAPI:
+    @log_io_to_json
+    async def get_page(self, page):
+        await asyncio.sleep(0.01)
+        if page < 0:
+            raise ValueError(f"Invalid page {page}")
+        return [f'item-{page}-{i}' for i in range(2)]
+
+    @log_io_to_json
+    async def get_all(self, n_pages=3):
+        pages = await asyncio.gather(*[self.get_page(page) for page in range(n_pages)])
+        return [item for page in pages for item in page]
+
+
+
+def test_log_io_to_json_logs_coroutines(lake_dir, monkeypatch):
+    monkeypatch.setattr(logger, 'LAKE_FORMAT', 'jsonl')
+    api = AsyncPaginatedAPI()
+
+    async def crawl():
+        # Two crawls run concurrently, each page must be linked to its own parent
+        return await asyncio.gather(api.get_all(), api.get_all(n_pages=2))
+
+    assert [len(items) for items in asyncio.run(crawl())] == [6, 4]
+    with pytest.raises(ValueError):
+        asyncio.run(api.get_page(-1))
+
+    parents = list(iter_log(str(lake_dir), function='AsyncPaginatedAPI.get_all'))
+    pages = list(iter_log(str(lake_dir), function='AsyncPaginatedAPI.get_page'))
+    assert sorted(len(parent['output']) for parent in parents) == [4, 6]
+    assert len(pages) == 6
+    for parent in parents:
+        children = [page for page in pages if page.get('parent_id') == parent['id']]
+        assert len(children) == len(parent['output']) // 2
+    assert pages[-1]['error'] is True and 'parent_id' not in pages[-1]
+
+
+@pytest.mark.parametrize('backend', ['json', 'orjson'])
+def test_serializer_converts_known_types(monkeypatch, backend):
+    if backend == 'orjson':
+        pytest.importorskip('orjson')
+    monkeypatch.setattr(serialization, 'LAKE_JSON_BACKEND', backend)
+    from datetime import datetime
+    from bs4 import BeautifulSoup
+
+    tag = BeautifulSoup('<p>Hello</p>', 'html.parser').p
+    data = {'time': datetime(2024, 5, 1, 12), 'tag': tag, 'ids': (1, 2), 'other': object, 'big': 2 ** 70}
+    decoded = json.loads(serialization.dumps(data))
+    assert decoded['time'] == '2024-05-01T12:00:00'
+    assert decoded['tag'] == '<p>Hello</p>'
+    assert decoded['ids'] == [1, 2]
+    assert decoded['other'] == str(object)
+    assert decoded['big'] == 2 ** 70
+    assert serialization.serialize_data(data)['time'] == '2024-05-01T12:00:00'
+
+
+def test_serializer_converts_responses():
+    import requests
+
+    response = requests.models.Response()
+    response.status_code = 200
+    response.url = 'https://example.com'
+    response._content = b'{"ok": true}'
+    decoded = json.loads(serialization.dumps({'response': response}))
+    assert decoded['response']['status_code'] == 200
+    assert decoded['response']['body'] == {'ok': True}
+
+
+def test_encode_entry_embeds_encoded_output():
+    output = serialization.EncodedJSON(serialization.dumps({'items': [1, 2]}))
+    encoded = serialization.encode_entry({'id': 'x', 'output': output})
+    assert json.loads(encoded) == {'id': 'x', 'output': {'items': [1, 2]}}
+    assert serialization.decode_entry({'id': 'x', 'output': output}) == {'id': 'x', 'output': {'items': [1, 2]}}
+
+
+
+def _signatures():
+    def plain(self, query, page=1):
+        pass
+
+    def keywords(self, repo_name, state='open', *, per_page=100, **params):
+        pass
+
+    def variadic(self, *queries, limit=10):
+        pass
+
+    return [plain, keywords, variadic]
+
+
+@pytest.mark.parametrize('args, kwargs', [
+    (('api', 'rust'), {}), (('api',), {'query': 'rust', 'page': 2}), (('api', 'rust', 3), {}),
+    (('api', 'rust'), {'state': 'closed', 'labels': 'bug'}), (('api', 'rust', 'closed'), {'per_page': 5}),
+])
+def test_binding_plan_matches_signature_bind(args, kwargs):
+    import inspect
+
+    for func in _signatures():
+        try:
+            bound_args = inspect.signature(func).bind(*args, **kwargs)
+        except TypeError:
+            with pytest.raises(TypeError):
+                logger._binding_plan(func)(args, kwargs)
+            continue
+        bound_args.apply_defaults()
+        arguments = logger._binding_plan(func)(args, kwargs)
+        assert arguments == bound_args.arguments
+        assert list(arguments) == list(bound_args.arguments)
+
+
+@pytest.mark.parametrize('args, kwargs', [(('api',), {}), (('api', 'rust'), {'query': 'go'}), (('api', 'rust'), {'size': 1})])
+def test_binding_plan_rejects_invalid_calls(args, kwargs):
+    with pytest.raises(TypeError):
+        logger._binding_plan(_signatures()[0])(args, kwargs)
+
+
+@pytest.fixture
+def log_levels(monkeypatch):
+    monkeypatch.setattr(logger, 'LAKE_FORMAT', 'jsonl')
+    monkeypatch.setattr(logger, 'LAKE_LOG_LEVEL', 'full')
+    monkeypatch.setattr(logger, '_log_levels', {})
+
+
+@pytest.mark.parametrize('level, n_records', [('full', 3), ('metadata', 3), ('errors', 1), ('off', 0)])
+def test_log_levels(lake_dir, log_levels, level, n_records):
+    set_log_level(level)
+    api = DummyAPI()
+    assert api.get('python') == {'query': 'python', 'page': 1}
+    api.get('rust', page=2)
+    with pytest.raises(ValueError):
+        api.fail('go')
+
+    records = list(iter_log(str(lake_dir)))
+    assert len(records) == n_records
+    if level == 'metadata':
+        successful = [record for record in records if not record['error']]
+        assert all(record['output'] is None and record['output_omitted'] for record in successful)
+        assert successful[1]['input']['args']['page'] == 2
+
+
+def test_sampled_log_level_per_source(lake_dir, log_levels):
+    set_log_level('off')
+    set_log_level('sampled', source='DummyAPI', sample_rate=50)
+    set_log_level('full', source='DummyAPI.fail')
+    api = DummyAPI()
+    for i in range(200):
+        api.get(f'query-{i}')
+    with pytest.raises(ValueError):
+        api.fail('go')
+    PaginatedAPI().get_page(1)
+
+    assert 50 < len(list(iter_log(str(lake_dir), function='DummyAPI.get'))) < 150
+    assert len(list(iter_log(str(lake_dir), function='DummyAPI.fail'))) == 1
+    assert list(iter_log(str(lake_dir), function='PaginatedAPI.get_page')) == []
+
+    set_log_level(None, source='DummyAPI')
+    assert logger.get_log_level('DummyAPI.get') == ('off', logger.LAKE_LOG_SAMPLE_RATE)
+    with pytest.raises(ValueError):
+        set_log_level('verbose')
+
+
+
+def test_partitioned_layout_prunes_partitions(lake_dir, monkeypatch):
+    from datetime import date
+
+    monkeypatch.setattr(logger, 'LAKE_FORMAT', 'jsonl')
+    monkeypatch.setattr(logger, 'LAKE_LAYOUT', 'partitioned')
+    monkeypatch.setattr(logger, 'LAKE_INDEX', True)
+    monkeypatch.setattr(logger, 'LAKE_DEDUPLICATE', True)
+    monkeypatch.setattr(logger, 'LAKE_DEDUPLICATE_MIN_BYTES', 0)
+    api = DummyAPI()
+    api.get('python')
+    with pytest.raises(ValueError):
+        api.fail('python')
+    PaginatedAPI().get_page(1)
+
+    today = date.today().isoformat()
+    file_path = lake_dir / 'source=dummy' / 'method=get' / f'date={today}' / 'part.jsonl'
+    assert file_path.exists()
+    old_record = {'id': 'old', 'function': 'DummyAPI.get', 'start_time': '2020-01-01T10:00:00', 'error': False,
+                  'output': {'query': 'old'}}
+    append_entries(partition_file_path(str(lake_dir), 'DummyAPI.get', '2020-01-01', 'jsonl'), [old_record], 'jsonl')
+
+    assert len(list(iter_log(str(lake_dir)))) == 4
+    assert [record['output']['query'] for record in iter_log(str(lake_dir), function='DummyAPI.get')] == ['old', 'python']
+    assert [record['id'] for record in iter_log(str(lake_dir), end_time='2020-01-02')] == ['old']
+    assert len(list(iter_log(str(lake_dir), source='DummyAPI'))) == 3
+    assert len(list(iter_log(str(lake_dir / 'source=paginated')))) == 1
+
+    assert select_lake_files(str(lake_dir), function='DummyAPI.get', start_time=today) == [str(file_path)]
+    assert select_lake_files(str(lake_dir), source='dummy', end_time='2020-01-02') == [
+        str(lake_dir / 'source=dummy' / 'method=get' / 'date=2020-01-01' / 'part.jsonl')]
+    assert select_lake_files(str(lake_dir), function='PaginatedAPI.get_page', source='dummy') == []
+
+    records = list(logger.get_lake_index().fetch(function='DummyAPI.get'))
+    assert records[0]['output'] == {'query': 'python', 'page': 1}
+
+
+
+def _legacy_records(day, n):
+    return [{'id': f'{day}-{i}', 'function': 'DummyAPI.get', 'start_time': f'{day}T10:00:{i:02d}',
+             'end_time': f'{day}T10:00:{i:02d}', 'input': {'args': {'query': 'python', 'page': i}},
+             'output': {'page': i}, 'error': False, 'error_log': ''} for i in range(n)]
+
+
+def test_compaction_converts_and_merges_files(lake_dir, monkeypatch):
+    from api_crawler.data_lake.__main__ import main
+    from api_crawler.data_lake.compaction import compact_lake
+
+    monkeypatch.setattr(logger, 'LAKE_INDEX', True)
+    monkeypatch.setattr(logger, 'LAKE_FORMAT', 'jsonl')
+    monkeypatch.setattr(logger, 'LAKE_SHARDING', 'process')
+    legacy = _legacy_records('2024-01-01', 5) + _legacy_records('2024-01-02', 3)
+    (lake_dir / 'DummyAPI_get.json').write_text(json.dumps(legacy))
+    api = DummyAPI()
+    api.get('rust')
+    api.get('go')
+    logger.get_lake_index().index_directory(str(lake_dir))
+    ids = {record['id'] for record in iter_log(str(lake_dir))}
+    assert len(ids) == 10
+    expected = sorted(call_id for call_id in ids if not call_id.startswith('2024-01-01'))
+
+    reports = compact_lake(str(lake_dir), split='day', drop_before='2024-01-02')
+    assert [(report.read, report.dropped, report.written) for report in reports] == [(10, 5, 5)]
+    assert len(reports[0].outputs) == 2
+    assert sorted(os.listdir(lake_dir)) == sorted(['lake_index.sqlite'] + [os.path.basename(path) for path in reports[0].outputs]
+                                                  + [name for name in os.listdir(lake_dir) if name.endswith(('.lock', '-wal', '-shm'))])
+    assert sorted(record['id'] for record in iter_log(str(lake_dir))) == expected
+    assert [record['id'] for record in iter_log(str(lake_dir), start_time='2024-01-03')] == [
+        record['id'] for record in iter_log(str(lake_dir)) if record['start_time'] >= '2024-01-03']
+    assert [record['output'] for record in logger.get_lake_index().fetch(args={'query': 'rust'})] == [
+        {'query': 'rust', 'page': 1}]
+    assert len(logger.get_lake_index().query()) == 5
+
+    main(['compact', str(lake_dir), '--workers', '2'])
+    files = [name for name in os.listdir(lake_dir) if name.startswith('DummyAPI_get') and not name.endswith('.lock')]
+    assert len(files) == 1 and files[0].endswith('.jsonl.gz')
+    assert sorted(record['id'] for record in iter_log(str(lake_dir))) == expected
+    assert len(logger.get_lake_index().query()) == 5
+
+
+def test_read_log_reads_a_compacted_json_lake(lake_dir, monkeypatch):
+    from api_crawler.data_lake.compaction import compact_lake
+
+    monkeypatch.setattr(logger, 'LAKE_FORMAT', 'json')
+    api = DummyAPI()
+    for query in ('python', 'rust', 'go'):
+        api.get(query)
+    file_path = str(lake_dir / 'DummyAPI_get.json')
+    compact_lake(str(lake_dir))
+    assert not os.path.exists(file_path)
+    assert [record['output']['query'] for record in read_log(file_path)] == ['python', 'rust', 'go']
+
+    # The records written after the compaction are read with the compacted ones
+    api.get('java')
+    assert [record['output']['query'] for record in read_log(file_path)] == ['python', 'rust', 'go', 'java']
+    assert len(list(iter_log(str(lake_dir)))) == 4
+
+
+class FakeGithubAPI:
+    @log_io_to_json
+    def get_repo_issues(self, repo_name, params=None):
+        page = (params or {}).get('page', 1)
+        return [{'id': page * 10 + i, 'number': page * 10 + i, 'title': f'Issue {i}', 'state': 'open',
+                 'user': {'login': 'octocat'}, 'labels': [{'name': 'bug'}], 'comments': i,
+                 'created_at': f'2024-0{page}-01T12:00:00Z', 'updated_at': None, 'closed_at': None,
+                 'body': 'Steps to reproduce', 'html_url': f'https://github.com/{repo_name}/issues/{i}'}
+                for i in range(3)]
+
+    @log_io_to_json
+    def get_all_repo_issues(self, repo_name):
+        return [issue for page in (1, 2) for issue in self.get_repo_issues(repo_name, params={'page': page})]
+
+
+def test_parquet_export_counts_rows_once(lake_dir, tmp_path_factory, monkeypatch):
+    pq = pytest.importorskip('pyarrow.parquet')
+    from api_crawler.data_lake import export
+
+    functions = ['FakeGithubAPI.get_repo_issues', 'FakeGithubAPI.get_all_repo_issues']
+    monkeypatch.setattr(export, 'SHAPES', [export.SHAPES[0]._replace(functions=functions)])
+    output_dir = tmp_path_factory.mktemp('parquet')
+    api = FakeGithubAPI()
+    # The records of the parent repeat the ones of its pages, which are exported instead
+    api.get_all_repo_issues('jxnl/instructor')
+    [parent] = read_log(str(lake_dir / 'FakeGithubAPI_get_all_repo_issues.json'))
+    assert parent['children_functions'] == ['FakeGithubAPI.get_repo_issues']
+    # A file of the same name in another format is exported to a Parquet file of its own
+    monkeypatch.setattr(logger, 'LAKE_FORMAT', 'jsonl')
+    api.get_repo_issues('jxnl/instructor', params={'page': 3})
+
+    stats = export.export_parquet(str(lake_dir), str(output_dir))
+    assert stats['rows'] == {'calls': 4, 'github_issues': 9}
+    assert pq.read_table(output_dir / 'github_issues').num_rows == 9
+    assert sorted(os.listdir(output_dir / 'github_issues')) == [
+        'FakeGithubAPI_get_repo_issues.json.parquet', 'FakeGithubAPI_get_repo_issues.jsonl.parquet']
+
+    os.remove(lake_dir / 'FakeGithubAPI_get_repo_issues.jsonl')
+    export.export_parquet(str(lake_dir), str(output_dir))
+    assert pq.read_table(output_dir / 'github_issues').num_rows == 6
+
+
+def test_parquet_export(lake_dir, tmp_path_factory, monkeypatch):
+    pq = pytest.importorskip('pyarrow.parquet')
+    from api_crawler.data_lake import export
+
+    monkeypatch.setattr(logger, 'LAKE_FORMAT', 'jsonl')
+    monkeypatch.setattr(logger, 'LAKE_ROTATE_MAX_RECORDS', 1)
+    monkeypatch.setattr(export, 'SHAPES', [export.SHAPES[0]._replace(functions=['FakeGithubAPI.get_repo_issues'])])
+    output_dir = tmp_path_factory.mktemp('parquet')
+    api = FakeGithubAPI()
+    api.get_repo_issues('jxnl/instructor', params={'page': 1})
+    api.get_repo_issues('jxnl/instructor', params={'page': 2})
+    DummyAPI().get('python')
+
+    stats = export.export_parquet(str(lake_dir), str(output_dir))
+    assert stats['rows'] == {'calls': 3, 'github_issues': 6}
+    issues = pq.read_table(output_dir / 'github_issues', filters=[('created_at', '>=', utc_datetime('2024-02-01'))])
+    assert issues.num_rows == 3
+    assert issues.schema.field('number').type == 'int64'
+    assert issues.column('labels').to_pylist()[0] == ['bug']
+    assert issues.column('repo_name').to_pylist()[0] == 'jxnl/instructor'
+    calls = pq.read_table(output_dir / 'calls').to_pylist()
+    assert [call['output_json'] for call in calls if call['function'] == 'DummyAPI.get'] == ['{"query": "python", "page": 1}']
+
+    # Only the segment closed by the next call and the file being written are exported again
+    api.get_repo_issues('jxnl/instructor', params={'page': 3})
+    stats = export.export_parquet(str(lake_dir), str(output_dir))
+    assert (stats['exported'], stats['skipped'], stats['removed']) == (2, 2, 0)
+    assert pq.read_table(output_dir / 'github_issues').num_rows == 9
+
+    # The tables of the deleted lake files are removed
+    os.remove(lake_dir / 'DummyAPI_get.jsonl')
+    stats = export.export_parquet(str(lake_dir), str(output_dir))
+    assert (stats['exported'], stats['skipped'], stats['removed']) == (0, 3, 1)
+    assert pq.read_table(output_dir / 'calls').num_rows == 3
+
+
+def utc_datetime(value):
+    from datetime import datetime, timezone
+
+    return datetime.fromisoformat(value).replace(tzinfo=timezone.utc)
@@ -0,0 +1,29 @@
+import os
+import subprocess
+import sys
+
+
+def run_python(code: str, **env) -> str:
+    environment = {key: value for key, value in os.environ.items() if key != 'LAKES_BASE_DIR'}
+    environment.update(env)
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, env=environment, check=True)
+    return result.stdout.strip()
+
+
+def test_import_does_not_load_the_sources():
+    loaded = run_python("import sys, api_crawler; "
+                        "print(sorted(m for m in ['selenium', 'praw', 'apify_client', 'youtubesearchpython', 'GoogleNews', "
+                        "'api_crawler.data_sources.github'] if m in sys.modules))")
+    assert loaded == '[]'
+
+
+def test_sources_are_loaded_on_first_access():
+    loaded = run_python("import sys; from api_crawler import GithubAPI; "
+                        "print(GithubAPI.__name__, 'selenium' in sys.modules, 'praw' in sys.modules)")
+    assert loaded == 'GithubAPI False False'
+
+
+def test_lake_directory_is_read_at_first_use(tmp_path):
+    lake_dir = run_python("import os; from api_crawler.data_lake import get_lakes_base_dir; "
+                          f"os.environ['LAKES_BASE_DIR'] = {str(tmp_path)!r}; print(get_lakes_base_dir())")
+    assert lake_dir == str(tmp_path)
@@ -0,0 +1,773 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlsplit
+import pytest
+import requests
+from api_crawler.data_lake import logger, read_log, enable_response_cache, disable_response_cache
+from api_crawler.data_sources._base import BaseRestfulAPI, AsyncBaseRestfulAPI, get_shared_adapter
+from api_crawler.data_sources._rate_limit import RateLimiter, SQLiteBackend, set_rate_limiter, parse_rate_limits
+from api_crawler.data_sources._retry import RetryPolicy, RetryMetrics, set_retry_policy
+from api_crawler.data_sources._http_cache import HttpCache, set_http_cache, requests_response
+from api_crawler.data_sources._sync_state import SyncState, set_sync_state
+from api_crawler.exceptions import OfflineCacheMissException, GraphQLException
+from api_crawler.data_sources.github import GithubAPI
+from api_crawler.data_sources.github import AsyncGithubAPI
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    client_ports = []
+    hits = Counter()
+    # Time some issues or commits were last updated, by number or sha
+    updated = {}
+    # Number of requests in flight, and its maximum, to the comments of the issues
+    in_flight = Counter()
+    lock = threading.Lock()
+    # Number of requests to each path answered with an error before the path succeeds
+    failures = {'/limited': 1, '/flaky': 2, '/down': 100}
+
+    def do_GET(self):
+        self.client_ports.append(self.client_address[1])
+        url = urlsplit(self.path)
+        self.hits[url.path] += 1
+        query = parse_qs(url.query)
+        if url.path == '/slow':
+            time.sleep(1)
+        # The pages of 'repos/owner/broken/issues' and the comments of its issues are slow, except the second
+        # page and the comments of the second issue which are missing
+        missing = url.path == '/repos/owner/broken/issues/2/comments' or (
+            url.path == '/repos/owner/broken/issues' and query.get('page') == ['2'])
+        if url.path.startswith('/repos/owner/broken/') and not missing:
+            time.sleep(0.2)
+        if url.path.endswith('/comments'):
+            with self.lock:
+                self.in_flight['now'] += 1
+                self.in_flight['max'] = max(self.in_flight['max'], self.in_flight['now'])
+            time.sleep(0.02)
+            with self.lock:
+                self.in_flight['now'] -= 1
+        body = json.dumps(self.github_response(url.path, query)).encode()
+        failing = self.hits[url.path] <= self.failures.get(url.path, 0)
+        # The GitHub resources are versioned by the ETag of their body
+        etag = f'"{hashlib.md5(body).hexdigest()}"'
+        if url.path.startswith('/repos/') and self.headers.get('If-None-Match') == etag:
+            self.hits['not_modified'] += 1
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        if failing and url.path == '/limited':
+            self.send_response(429)
+            self.send_header('Retry-After', '1')
+        elif missing:
+            self.send_response(404)
+        else:
+            self.send_response(503 if failing else 200)
+        self.send_header('Content-Type', 'application/json')
+        if url.path.startswith('/repos/'):
+            self.send_header('ETag', etag)
+        link = self.github_link(url.path, query, self.headers['Host'])
+        if link:
+            self.send_header('Link', link)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    @classmethod
+    def github_listing(cls, path, query):
+        # 'repos/owner/repo/issues' lists 250 issues. Every tenth issue has no comment, the 7th has 150
+        # comments and the others one. 'repos/owner/repo/commits' lists 120 commits. The issues and commits
+        # are updated a minute apart, unless `updated` tells otherwise
+        since = query.get('since', [''])[0]
+        if path == '/repos/owner/repo/issues':
+            issues = [{'number': number, 'title': f'Issue {number}', 'state': query.get('state', ['open'])[0],
+                       'comments': 0 if number % 10 == 0 else 150 if number == 7 else 1,
+                       'updated_at': cls.updated.get(number, f'2024-06-01T{number // 60:02d}:{number % 60:02d}:00Z')}
+                      for number in range(1, 251)]
+            issues = [issue for issue in issues if issue['updated_at'] >= since]
+            if query.get('sort') == ['updated']:
+                issues.sort(key=lambda issue: issue['updated_at'], reverse=query.get('direction') != ['asc'])
+            return issues
+        if path == '/repos/owner/repo/issues/7/comments':
+            return [{'body': f'Comment {number} on 7'} for number in range(1, 151)]
+        if path == '/repos/owner/repo/commits':
+            commits = [{'sha': f'{number:040x}', 'commit': {'committer': {
+                'date': cls.updated.get(f'{number:040x}', f'2024-06-01T{number // 60:02d}:{number % 60:02d}:00Z')}}}
+                for number in range(1, 121)]
+            return [commit for commit in commits if commit['commit']['committer']['date'] >= since]
+        if path == '/repos/owner/broken/issues':
+            return [{'number': number} for number in range(1, 2001)]
+        return None
+
+    @classmethod
+    def github_response(cls, path, query):
+        listing = cls.github_listing(path, query)
+        if listing is not None:
+            page, per_page = int(query.get('page', [1])[0]), int(query.get('per_page', [30])[0])
+            start = int(query['cursor'][0]) if 'cursor' in query else (page - 1) * per_page
+            return listing[start:start + per_page]
+        if path.startswith('/repos/owner/repo/issues/') and path.endswith('/comments'):
+            return [{'body': f"Comment on {path.split('/')[-2]}"}]
+        return {'ok': True}
+
+    @classmethod
+    def github_link(cls, path, query, host):
+        # The listings tell their next and last pages, except the commits which are paginated by cursor and
+        # only tell their next page
+        listing = cls.github_listing(path, query)
+        if listing is None:
+            return None
+        page, per_page = int(query.get('page', [1])[0]), int(query.get('per_page', [30])[0])
+        params = {name: values[0] for name, values in query.items() if name not in ('page', 'cursor')}
+
+        def url(**position):
+            return f'<http://{host}{path}?{urlencode({**params, **position})}>'
+
+        if path.endswith('/commits'):
+            start = int(query['cursor'][0]) if 'cursor' in query else (page - 1) * per_page
+            return f'{url(cursor=start + per_page)}; rel="next"' if start + per_page < len(listing) else None
+        last_page = max(1, -(-len(listing) // per_page))
+        links = [f'{url(page=page + 1)}; rel="next"'] if page < last_page else []
+        links.append(f'{url(page=last_page)}; rel="last"')
+        return ', '.join(links)
+
+    do_POST = do_GET
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(autouse=True)
+def lakes_base_dir(tmp_path, monkeypatch):
+    # The logged calls are written to the temporary directory of the test
+    monkeypatch.setattr(logger, 'LAKES_BASE_DIR', str(tmp_path))
+    return tmp_path
+
+
+@pytest.fixture(autouse=True)
+def rate_limiter():
+    # Every test gets a rate limiter of its own
+    rate_limiter = RateLimiter()
+    set_rate_limiter(rate_limiter)
+    yield rate_limiter
+    set_rate_limiter(None)
+
+
+@pytest.fixture(autouse=True)
+def retry_metrics():
+    # Every test gets fast retries and metrics of its own
+    metrics = RetryMetrics()
+    set_retry_policy(RetryPolicy(backoff=0.01, max_backoff=0.05, metrics=metrics))
+    yield metrics
+    set_retry_policy(None)
+
+
+@pytest.fixture(autouse=True)
+def http_cache():
+    http_cache = HttpCache()
+    set_http_cache(http_cache)
+    yield http_cache
+    set_http_cache(None)
+
+
+@pytest.fixture
+def stub_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    StubHandler.client_ports = []
+    StubHandler.hits = Counter()
+    StubHandler.updated = {}
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_address[1]}/'
+    server.shutdown()
+    server.server_close()
+
+
+class StubAPI(BaseRestfulAPI):
+    def __init__(self, base_url, **kwargs):
+        super().__init__(**kwargs)
+        self.base_url = base_url
+
+
+class AsyncStubAPI(AsyncBaseRestfulAPI):
+    def __init__(self, base_url, **kwargs):
+        super().__init__(**kwargs)
+        self.base_url = base_url
+
+
+def test_instances_share_connections(stub_server):
+    for _ in range(3):
+        assert StubAPI(stub_server).get('issues').json() == {'ok': True}
+    assert len(StubHandler.client_ports) == 3
+    assert len(set(StubHandler.client_ports)) == 1
+
+    StubAPI(stub_server, share_connections=False).get('issues')
+    assert len(set(StubHandler.client_ports)) == 2
+    assert StubAPI(stub_server).session.get_adapter(stub_server) is get_shared_adapter()
+
+
+def test_requests_time_out(stub_server):
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        StubAPI(stub_server, timeout=0.2).get('slow')
+    assert StubAPI(stub_server, timeout=0.2).get('slow', timeout=5).status_code == 200
+
+
+def test_async_requests_run_concurrently(stub_server):
+    pytest.importorskip('httpx')
+    async def fetch_all():
+        async with AsyncStubAPI(stub_server) as api:
+            return await asyncio.gather(*[api.get('slow') for _ in range(10)])
+
+    start = time.monotonic()
+    responses = asyncio.run(fetch_all())
+    assert time.monotonic() - start < 5
+    assert [response.json() for response in responses] == [{'ok': True}] * 10
+
+
+def test_async_requests_time_out(stub_server):
+    httpx = pytest.importorskip('httpx')
+    async def fetch(**kwargs):
+        async with AsyncStubAPI(stub_server, timeout=0.2) as api:
+            return await api.get('slow', **kwargs)
+
+    with pytest.raises(httpx.ReadTimeout):
+        asyncio.run(fetch())
+    assert asyncio.run(fetch(timeout=5)).status_code == 200
+
+
+def test_async_github_paginates_and_logs(stub_server, tmp_path):
+    pytest.importorskip('httpx')
+
+    async def crawl():
+        async with AsyncGithubAPI(api_key='token') as github:
+            github.base_url = stub_server
+            pages = [len(page) async for page in github.iter_repo_issues('owner/repo')]
+            issues = await github.get_all_repo_issues('owner/repo')
+            commented = await github.get_repo_issues('owner/repo', params={'per_page': 5, 'page': 1}, comments=True)
+            return pages, issues, commented
+
+    pages, issues, commented = asyncio.run(crawl())
+    assert pages == [100, 100, 50]
+    assert [issue['number'] for issue in issues] == list(range(1, 251))
+    assert [issue['comments_thread'] for issue in commented] == [[{'body': f'Comment on {number}'}] for number in range(1, 6)]
+
+    [outer] = read_log(str(tmp_path / 'AsyncGithubAPI_get_all_repo_issues.json'))
+    assert len(outer['output']) == 250
+
+
+def test_async_github_follows_next_links(stub_server):
+    pytest.importorskip('httpx')
+    async def crawl():
+        async with AsyncGithubAPI(api_key='token') as github:
+            github.base_url = stub_server
+            return [len(page) async for page in github.iter_repo_commits('owner/repo', params={'per_page': 50})]
+
+    assert asyncio.run(crawl()) == [50, 50, 20]
+
+
+def test_github_fetches_pages_concurrently_in_order(stub_server):
+    StubHandler.hits.clear()
+    github = GithubAPI(api_key='token')
+    github.base_url = stub_server
+    github.page_workers = 3
+
+    issues = github.get_all_repo_issues('owner/repo', params={'per_page': 10, 'state': 'closed'})
+    assert [issue['number'] for issue in issues] == list(range(1, 251))
+    # The parameters are kept on every page, and every page is requested once
+    assert all(issue['state'] == 'closed' for issue in issues)
+    assert StubHandler.hits['/repos/owner/repo/issues'] == 25
+
+    # Without a last page, the next pages are followed
+    commits = github.get_all_repo_commits('owner/repo')
+    assert [int(commit['sha'], 16) for commit in commits] == list(range(1, 121))
+    assert StubHandler.hits['/repos/owner/repo/commits'] == 2
+
+
+def test_github_stops_fetching_pages_on_a_failure(stub_server):
+    github = GithubAPI(api_key='token')
+    github.base_url = stub_server
+    github.page_workers = 2
+
+    # The pages queued behind the missing one are not fetched
+    with pytest.raises(requests.exceptions.HTTPError):
+        github.get_all_repo_issues('owner/broken')
+    assert StubHandler.hits['/repos/owner/broken/issues'] < 6
+
+
+def test_github_stops_fetching_comment_threads_on_a_failure(stub_server):
+    StubHandler.hits.clear()
+    github = GithubAPI(api_key='token')
+    github.base_url = stub_server
+    github.comment_workers = 2
+
+    # The threads queued behind the missing one are not fetched
+    with pytest.raises(requests.exceptions.HTTPError):
+        github.get_repo_issues('owner/broken', params={'per_page': 100, 'page': 1}, comments=True)
+    assert sum(hits for path, hits in StubHandler.hits.items() if path.endswith('/comments')) < 6
+
+
+def test_github_fetches_comment_threads_concurrently(stub_server):
+    StubHandler.hits.clear()
+    StubHandler.in_flight.clear()
+    github = GithubAPI(api_key='token')
+    github.base_url = stub_server
+    github.comment_workers = 4
+
+    issues = github.get_repo_issues('owner/repo', params={'per_page': 20, 'page': 1}, comments=True)
+    threads = {issue['number']: issue['comments_thread'] for issue in issues}
+    # The issues without comments are not requested
+    assert threads[10] == threads[20] == []
+    assert '/repos/owner/repo/issues/10/comments' not in StubHandler.hits
+    # The threads are complete, in order
+    assert threads[7] == [{'body': f'Comment {number} on 7'} for number in range(1, 151)]
+    assert threads[1] == [{'body': 'Comment on 1'}]
+    assert 1 < StubHandler.in_flight['max'] <= 4
+
+
+@pytest.fixture
+def sync_state(tmp_path):
+    sync_state = SyncState(str(tmp_path / 'sync'))
+    set_sync_state(sync_state)
+    yield sync_state
+    set_sync_state(None)
+
+
+def test_github_syncs_incrementally(stub_server, sync_state):
+    github = GithubAPI(api_key='token')
+    github.base_url = stub_server
+
+    # The first sync fetches the whole history
+    assert len(github.sync_repo_issues('owner/repo')) == 250
+    assert len(github.sync_repo_commits('owner/repo')) == 120
+    assert sync_state.watermark('owner/repo', 'issues') == '2024-06-01T04:10:00Z'
+    assert sync_state.watermark('owner/repo', 'commits') == '2024-06-01T02:00:00Z'
+
+    # The next ones only fetch what changed since the watermarks
+    StubHandler.hits.clear()
+    StubHandler.updated.update({3: '2024-06-02T00:00:00Z', 5: '2024-06-02T01:00:00Z'})
+    delta = github.sync_repo_issues('owner/repo')
+    assert [issue['number'] for issue in delta] == [5, 3, 250]
+    assert StubHandler.hits['/repos/owner/repo/issues'] == 1
+    assert sync_state.watermark('owner/repo', 'issues') == '2024-06-02T01:00:00Z'
+
+    snapshot = github.get_repo_snapshot('owner/repo', 'issues')
+    assert len(snapshot) == 250
+    assert [(issue['number'], issue['updated_at']) for issue in snapshot[-2:]] == [(3, '2024-06-02T00:00:00Z'), (5, '2024-06-02T01:00:00Z')]
+
+    # Without changes, the sync keeps its watermark
+    assert [commit['sha'] for commit in github.sync_repo_commits('owner/repo')] == [f'{120:040x}']
+    assert sync_state.watermark('owner/repo', 'commits') == '2024-06-01T02:00:00Z'
+    assert len(github.get_repo_snapshot('owner/repo', 'commits')) == 120
+
+    sync_state.reset('owner/repo', 'issues')
+    assert sync_state.watermark('owner/repo', 'issues') is None and github.get_repo_snapshot('owner/repo', 'issues') == []
+    assert sync_state.watermark('owner/repo', 'commits') is not None
+
+
+def test_github_syncs_are_not_memoized(stub_server, sync_state):
+    github = GithubAPI(api_key='token')
+    github.base_url = stub_server
+    enable_response_cache(directory=None)
+    try:
+        assert len(github.sync_repo_commits('owner/repo')) == 120
+        # The next sync fetches the delta, rather than returning the memoized history
+        StubHandler.updated[f'{2:040x}'] = '2024-06-02T00:00:00Z'
+        assert [commit['sha'] for commit in github.sync_repo_commits('owner/repo')] == [f'{2:040x}', f'{120:040x}']
+        assert sync_state.watermark('owner/repo', 'commits') == '2024-06-02T00:00:00Z'
+    finally:
+        StubHandler.updated.pop(f'{2:040x}')
+        disable_response_cache()
+
+
+def test_async_github_fetches_comment_threads(stub_server):
+    pytest.importorskip('httpx')
+    async def crawl():
+        async with AsyncGithubAPI(api_key='token') as github:
+            github.base_url = stub_server
+            return await github.get_repo_issues('owner/repo', params={'per_page': 10, 'page': 1}, comments=True)
+
+    threads = {issue['number']: issue['comments_thread'] for issue in asyncio.run(crawl())}
+    assert threads[10] == []
+    assert len(threads[7]) == 150
+    assert threads[3] == [{'body': 'Comment on 3'}]
+
+
+def test_rate_limiter_token_bucket():
+    rate_limiter = RateLimiter(limits=parse_rate_limits('example.com=2/1'))
+    assert rate_limiter.reserve('example.com') == 0
+    assert rate_limiter.reserve('example.com') == 0
+    assert 0.4 < rate_limiter.reserve('example.com') <= 0.5
+    # Hosts without limits are not throttled
+    assert all(rate_limiter.reserve('other.com') == 0 for _ in range(100))
+
+
+def test_rate_limiter_honors_rate_limit_headers():
+    rate_limiter = RateLimiter()
+    reset = time.time() + 30
+    rate_limiter.update('api.github.com', {'X-RateLimit-Remaining': '2', 'X-RateLimit-Reset': str(reset)})
+    assert rate_limiter.reserve('api.github.com') == 0
+    assert rate_limiter.reserve('api.github.com') == 0
+    assert 29 < rate_limiter.reserve('api.github.com') <= 30
+
+    # Once the quota is reset, the requests go again
+    rate_limiter.update('api.github.com', {'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': str(time.time() - 1)})
+    assert rate_limiter.reserve('api.github.com') == 0
+
+
+
+def test_rate_limiter_keeps_the_quota_resources_apart():
+    rate_limiter = RateLimiter()
+    reset = time.time() + 50
+    rate_limiter.update('api.github.com', {'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': str(reset),
+                                           'X-RateLimit-Resource': 'search'}, 'https://api.github.com/search/issues?q=x')
+    rate_limiter.update('api.github.com', {'X-RateLimit-Remaining': '4000', 'X-RateLimit-Reset': str(reset),
+                                           'X-RateLimit-Resource': 'core'}, 'https://api.github.com/repos/owner/repo/issues')
+    # The used up search quota only holds the search requests
+    assert 49 < rate_limiter.reserve('api.github.com', path='https://api.github.com/search/code?q=y') <= 50
+    assert rate_limiter.reserve('api.github.com', path='https://api.github.com/repos/owner/other/pulls') == 0
+    assert rate_limiter.quota_key('api.github.com', 'https://api.github.com/graphql') == 'api.github.com'
+
+
+def test_rate_limiter_shares_limits_between_processes(tmp_path):
+    limits = {'example.com': (3, 60)}
+    first = RateLimiter(SQLiteBackend(str(tmp_path / 'limits.sqlite')), limits)
+    second = RateLimiter(SQLiteBackend(str(tmp_path / 'limits.sqlite')), limits)
+    assert [first.reserve('example.com') for _ in range(2)] == [0, 0]
+    assert second.reserve('example.com') == 0
+    assert first.reserve('example.com') > 0 and second.reserve('example.com') > 0
+
+
+def test_requests_wait_for_retry_after(stub_server, retry_metrics):
+    start = time.monotonic()
+    assert StubAPI(stub_server).get('limited').status_code == 200
+    assert time.monotonic() - start > 0.8
+    assert retry_metrics.snapshot()['retries_by_reason'] == {'429': 1}
+
+
+def test_declared_rate_limit_spaces_async_requests(stub_server):
+    pytest.importorskip('httpx')
+    class LimitedAPI(AsyncStubAPI):
+        rate_limit = (1, 0.2)
+
+    async def fetch_all():
+        async with LimitedAPI(stub_server) as api:
+            return await asyncio.gather(*[api.get('issues') for _ in range(4)])
+
+    start = time.monotonic()
+    asyncio.run(fetch_all())
+    assert time.monotonic() - start > 0.55
+
+
+def test_transient_errors_are_retried(stub_server, retry_metrics):
+    api = StubAPI(stub_server)
+    assert api.get('flaky').json() == {'ok': True}
+    assert StubHandler.hits['/flaky'] == 3
+
+    # Out of attempts, the last response is returned
+    assert api.get('down').status_code == 503
+    assert StubHandler.hits['/down'] == 5
+
+    metrics = retry_metrics.snapshot()
+    assert metrics['calls'] == 2 and metrics['retried_calls'] == 2 and metrics['give_ups'] == 1
+    assert metrics['retries_by_reason'] == {'503': 6}
+    assert list(metrics['retries_by_host']) == [stub_server.split('/')[2]]
+
+
+def test_retry_policy_methods_and_deadline(stub_server, retry_metrics):
+    api = StubAPI(stub_server)
+    api.retry_policy = RetryPolicy(methods=('GET',), metrics=retry_metrics)
+    assert api.post('flaky').status_code == 503
+
+    # Waiting for the Retry-After would exceed the deadline of the call
+    api.retry_policy = RetryPolicy(deadline=0.5, metrics=retry_metrics)
+    assert api.get('limited').status_code == 429
+    assert retry_metrics.snapshot()['give_ups'] == 1
+
+
+def test_retry_policy_retries_exceptions(retry_metrics):
+    attempts = []
+
+    def connect():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise requests.exceptions.ConnectionError('Connection reset by peer')
+        return 'connected'
+
+    policy = RetryPolicy(backoff=0.01, metrics=retry_metrics)
+    assert policy.call(connect) == 'connected'
+    assert retry_metrics.snapshot()['retries_by_reason'] == {'ConnectionError': 2}
+    with pytest.raises(ValueError):
+        policy.call(lambda: int('not a number'))
+    assert retry_metrics.snapshot()['retries'] == 2
+
+
+def test_async_transient_errors_are_retried(stub_server, retry_metrics):
+    pytest.importorskip('httpx')
+    async def fetch():
+        async with AsyncStubAPI(stub_server) as api:
+            return await api.get('flaky')
+
+    assert asyncio.run(fetch()).status_code == 200
+    assert retry_metrics.snapshot()['retries'] == 2
+
+
+@pytest.mark.parametrize('persistent', [False, True])
+def test_github_revalidates_cached_responses(stub_server, tmp_path, persistent):
+    if persistent:
+        set_http_cache(HttpCache(str(tmp_path / 'http_cache')))
+    github = GithubAPI(api_key='token')
+    github.base_url = stub_server
+    params = {'per_page': 100, 'page': 1}
+    first = github.get('repos/owner/repo/issues', params=params).json()
+
+    # A new instance, e.g. of the next hourly run, gets a 304 and the cached body
+    github = GithubAPI(api_key='token')
+    github.base_url = stub_server
+    response = github.get('repos/owner/repo/issues', params=params)
+    assert response.status_code == 200 and response.json() == first
+    assert StubHandler.hits['not_modified'] == 1
+
+    # The key includes the parameters and the credentials
+    assert github.get('repos/owner/repo/issues', params={**params, 'page': 2}).json()[0]['number'] == 101
+    github.headers = {**github.headers, 'Authorization': 'Bearer other'}
+    github.get('repos/owner/repo/issues', params=params)
+    assert StubHandler.hits['not_modified'] == 1
+    if persistent:
+        assert len(list((tmp_path / 'http_cache').rglob('*.pkl.gz'))) == 3
+
+
+def test_async_github_revalidates_cached_responses(stub_server, http_cache, tmp_path, monkeypatch):
+    pytest.importorskip('httpx')
+    monkeypatch.setattr(logger, 'LAKES_BASE_DIR', str(tmp_path))
+
+    async def fetch():
+        async with AsyncGithubAPI(api_key='token') as github:
+            github.base_url = stub_server
+            return [await github.get_repo_issues('owner/repo', params={'page': 3, 'per_page': 100}) for _ in range(2)]
+
+    first, second = asyncio.run(fetch())
+    assert first == second and len(second) == 50
+    stats = http_cache.stats()
+    assert (stats['revalidated'], stats['misses'], stats['stored'], stats['hits']) == (1, 1, 1, 0)
+
+
+def test_http_cache_serves_fresh_responses(stub_server, tmp_path):
+    api = StubAPI(stub_server)
+    host = stub_server.split('/')[2]
+    api.http_cache = HttpCache(str(tmp_path), ttls={f'{host}/issues': 60, f'{host}/slow': 0})
+    assert api.get('issues', params={'state': 'open', 'page': 1, 'labels': None}).json() == {'ok': True}
+    assert api.get('issues', params={'page': 1, 'state': 'open'}).json() == {'ok': True}
+    assert StubHandler.hits['/issues'] == 1
+    # Without a validator, the responses of a URL whose TTL is 0 are not cached
+    api.get('slow')
+    api.get('slow')
+    assert StubHandler.hits['/slow'] == 2
+
+    # Other processes share the cache directory, and can replay it offline
+    offline = StubAPI(stub_server)
+    offline.http_cache = HttpCache(str(tmp_path), offline=True)
+    assert offline.get('issues', params={'page': 1, 'state': 'open'}).json() == {'ok': True}
+    with pytest.raises(OfflineCacheMissException):
+        offline.get('issues', params={'page': 2})
+    assert StubHandler.hits['/issues'] == 1
+
+
+def test_http_cache_revalidates_stale_responses_in_background(stub_server):
+    api = StubAPI(stub_server)
+    api.cache_ttl = 0.2
+    api.http_cache = HttpCache(stale_while_revalidate=30)
+    first = api.get('repos/owner/repo/issues/1/comments')
+    time.sleep(0.3)
+    # The stale response is served at once, and refreshed by a background request
+    assert api.get('repos/owner/repo/issues/1/comments').json() == first.json()
+    for _ in range(50):
+        if StubHandler.hits['not_modified']:
+            break
+        time.sleep(0.05)
+    assert StubHandler.hits['/repos/owner/repo/issues/1/comments'] == 2
+    assert StubHandler.hits['not_modified'] == 1
+    api.get('repos/owner/repo/issues/1/comments')
+    assert StubHandler.hits['/repos/owner/repo/issues/1/comments'] == 2
+    assert api.http_cache.stats()['stale_hits'] == 1 and api.http_cache.stats()['hits'] == 1
+
+
+def test_http_cache_serves_cached_responses_on_errors():
+    http_cache = HttpCache(stale_if_error=True)
+    response = requests.Response()
+    response.status_code, response._content, response.url = 200, b'{"page": 1}', 'https://example.com/page'
+    response.headers['ETag'] = '"v1"'
+
+    def unreachable():
+        raise requests.exceptions.ConnectionError('Network is unreachable')
+
+    assert http_cache.fetch('https://example.com/page', {}, lambda: response, requests_response) is response
+    replayed = http_cache.fetch('https://example.com/page', {}, unreachable, requests_response)
+    assert replayed.json() == {'page': 1}
+    assert http_cache.stats()['stale_if_error'] == 1
+    with pytest.raises(requests.exceptions.ConnectionError):
+        http_cache.fetch('https://example.com/other', {}, unreachable, requests_response)
+
+
+def test_http_cache_raises_errors_by_default():
+    http_cache = HttpCache()
+    response = requests.Response()
+    response.status_code, response._content, response.url = 200, b'{"page": 1}', 'https://example.com/page'
+    response.headers['ETag'] = '"v1"'
+    http_cache.fetch('https://example.com/page', {}, lambda: response, requests_response)
+
+    def unreachable():
+        raise requests.exceptions.ConnectionError('Network is unreachable')
+
+    with pytest.raises(requests.exceptions.ConnectionError):
+        http_cache.fetch('https://example.com/page', {}, unreachable, requests_response)
+    failure = requests.Response()
+    failure.status_code, failure._content = 503, b''
+    assert http_cache.fetch('https://example.com/page', {}, lambda: failure, requests_response).status_code == 503
+    assert http_cache.stats()['stale_if_error'] == 0
+
+
+def test_http_cache_counts_replaced_entries_once(tmp_path):
+    http_cache = HttpCache(str(tmp_path))
+    entry = {'status': 200, 'headers': {}, 'content': os.urandom(2000), 'stored': time.time()}
+    http_cache.set('a1', entry)
+    size = http_cache._disk_bytes
+    for _ in range(3):
+        http_cache.set('a1', entry)
+    assert http_cache._disk_bytes == size
+
+
+def test_http_cache_evicts_least_recently_used_entries(tmp_path):
+    http_cache = HttpCache(str(tmp_path), max_bytes=10 ** 9)
+    entry = {'status': 200, 'headers': {}, 'content': os.urandom(2000), 'stored': time.time()}
+    for key in ['a1', 'b2', 'c3']:
+        http_cache.set(key, entry)
+        time.sleep(0.02)
+    http_cache.get('a1')
+    http_cache.evict(max_bytes=5000)
+    assert http_cache.get('b2') is None
+    assert http_cache.get('a1') is not None and http_cache.get('c3') is not None
+    assert http_cache.stats()['evicted'] == 1
+
+
+def graphql_comment(number, login='octocat'):
+    return {'id': f'IC_{number}', 'databaseId': number, 'body': f'Comment {number}', 'url': f'https://github.com/c/{number}',
+            'createdAt': '2024-06-01T00:00:00Z', 'updatedAt': '2024-06-01T00:00:00Z', 'authorAssociation': 'NONE',
+            'author': {'login': login}, 'reactionGroups': []}
+
+
+def graphql_issue(number, comments, total_comments, next_cursor=None):
+    return {'id': f'I_{number}', 'number': number, 'databaseId': 1000 + number, 'title': f'Issue {number}',
+            'body': '', 'state': 'CLOSED', 'url': f'https://github.com/owner/repo/issues/{number}',
+            'createdAt': '2024-06-01T00:00:00Z', 'updatedAt': '2024-06-02T00:00:00Z', 'closedAt': None,
+            'authorAssociation': 'OWNER', 'author': {'login': 'owner'},
+            'labels': {'nodes': [{'id': 'L_1', 'name': 'bug', 'color': 'd73a4a', 'description': None}]},
+            'reactionGroups': [{'content': 'THUMBS_UP', 'reactors': {'totalCount': 2}},
+                               {'content': 'HEART', 'reactors': {'totalCount': 1}}],
+            'comments': {'totalCount': total_comments, 'pageInfo': {'hasNextPage': next_cursor is not None, 'endCursor': next_cursor},
+                         'nodes': comments}}
+
+
+class GraphQLStubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    queries = []
+    # Canned responses, by the repository or node and the cursor of the page
+    responses = {
+        ('repo', None): {'data': {'repository': {'issues': {
+            'pageInfo': {'hasNextPage': True, 'endCursor': 'page-1'},
+            'nodes': [graphql_issue(2, [graphql_comment(1), graphql_comment(2)], 3, next_cursor='comments-1'),
+                      graphql_issue(1, [], 0)]}}}},
+        ('I_2', 'comments-1'): {'data': {'node': {'comments': {
+            'totalCount': 3, 'pageInfo': {'hasNextPage': False, 'endCursor': 'comments-2'}, 'nodes': [graphql_comment(3)]}}}},
+        ('repo', 'page-1'): {'data': {'repository': {'issues': {
+            'pageInfo': {'hasNextPage': False, 'endCursor': 'page-2'}, 'nodes': [graphql_issue(3, [], 0)]}}}},
+        ('missing', None): {'data': None, 'errors': [{'message': "Could not resolve to a Repository with the name 'owner/missing'."}]},
+    }
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        self.queries.append(payload)
+        variables = payload['variables']
+        body = json.dumps(self.responses[(variables.get('name') or variables.get('id'), variables.get('after'))]).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def graphql_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), GraphQLStubHandler)
+    GraphQLStubHandler.queries = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_address[1]}/'
+    server.shutdown()
+    server.server_close()
+
+
+def test_github_graphql_backend(graphql_server):
+    github = GithubAPI(api_key='token', backend='graphql')
+    github.base_url = graphql_server
+
+    issues = github.get_all_repo_issues('owner/repo', params={'state': 'closed', 'since': '2024-06-01T00:00:00Z'}, comments=True)
+    assert [issue['number'] for issue in issues] == [2, 1, 3]
+    # The nodes are normalized to the REST shapes
+    issue = issues[0]
+    assert issue['id'] == 1002 and issue['node_id'] == 'I_2'
+    assert issue['html_url'] == 'https://github.com/owner/repo/issues/2'
+    assert issue['state'] == 'closed' and issue['created_at'] == '2024-06-01T00:00:00Z'
+    assert issue['user'] == {'login': 'owner'} and issue['author_association'] == 'OWNER'
+    assert issue['labels'] == [{'node_id': 'L_1', 'name': 'bug', 'color': 'd73a4a', 'description': None}]
+    assert issue['reactions']['total_count'] == 3 and issue['reactions']['+1'] == 2 and issue['reactions']['heart'] == 1
+    # The next pages of the comments are followed
+    assert issue['comments'] == 3
+    assert [comment['id'] for comment in issue['comments_thread']] == [1, 2, 3]
+    assert issue['comments_thread'][0]['user'] == {'login': 'octocat'}
+    assert issues[1]['comments_thread'] == []
+
+    # One query per page of issues, and one per extra page of comments
+    assert len(GraphQLStubHandler.queries) == 3
+    variables = GraphQLStubHandler.queries[0]['variables']
+    assert variables['states'] == ['CLOSED'] and variables['filterBy'] == {'since': '2024-06-01T00:00:00Z'}
+    assert GraphQLStubHandler.queries[2]['variables']['after'] == 'page-1'
+
+
+def test_github_graphql_selects_fields(graphql_server):
+    github = GithubAPI(api_key='token', backend='graphql')
+    github.base_url = graphql_server
+
+    github.get_all_repo_issues('owner/repo', fields=('title',))
+    query = GraphQLStubHandler.queries[0]['query']
+    assert 'nodes { id number title comments { totalCount } }' in query
+
+    with pytest.raises(ValueError):
+        github.get_all_repo_issues('owner/repo', params={'milestone': '1'})
+    with pytest.raises(GraphQLException):
+        github.get_all_repo_issues('owner/missing')
+
+    # The REST backend cannot select fields
+    github.backend = 'rest'
+    with pytest.raises(ValueError):
+        github.get_all_repo_issues('owner/repo', fields=('title',))
+    assert len(GraphQLStubHandler.queries) == 3
+
+
+def test_http_cache_bounds_the_memory_by_bytes():
+    http_cache = HttpCache(max_memory_bytes=5000)
+    for key in ['a1', 'b2', 'c3']:
+        http_cache.set(key, {'status': 200, 'headers': {}, 'content': os.urandom(2000), 'stored': time.time()})
+    assert http_cache.get('a1') is None
+    assert http_cache.get('b2') is not None and http_cache.get('c3') is not None
+    # Replacing an entry does not count its previous body
+    http_cache.set('c3', {'status': 200, 'headers': {}, 'content': os.urandom(2000), 'stored': time.time()})
+    assert http_cache.get('b2') is not None